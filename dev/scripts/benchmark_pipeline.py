@@ -0,0 +1,225 @@
+"""
+Benchmark the throughput of the quinex pipeline.
+
+Times the pre-processing, quantity identification (get_quantities), the sequential
+pipeline (simple_call), and the parallel pipeline (__call__) separately on corpora of
+increasing size. Reports chars/s, quantities/s, claims/s, and peak RSS per stage and
+writes the results to a JSON file for regression tracking.
+
+Usage:
+    python dev/scripts/benchmark_pipeline.py --preset tiny --sizes 1000 10000 100000
+    python dev/scripts/benchmark_pipeline.py --preset small --corpus path/to/papers/ --output benchmark.json
+"""
+import os
+import json
+import random
+import resource
+import platform
+import threading
+from time import time, perf_counter
+from pathlib import Path
+from argparse import ArgumentParser
+from datetime import datetime
+import torch
+from quinex import Quinex, __version__, msg
+from quinex.config.presets import models, tasks
+
+
+SYNTHETIC_SENTENCES = [
+    "The total pipeline length increases from {a} km to {b} km in the scenario with high demand.",
+    "The liquefaction plants can cool hydrogen to −253 °C, requiring up to {p}% of its energy content.",
+    "In {year}, {p}% of the energy consumption of the sector was covered by fuels [5].",
+    "The bottom giraffe would be exposed to a pressure of more than 10^{e} Pa (see Figure 3).",
+    "A CO2 uptake of {x} mmol⋅g -1 is observed at {t} K and {x} mbar partial pressure.",
+    "The costs amount to roughly {x} EUR/kWh for wind turbines and {y} EUR/kWh for open-field PV.",
+    "This section describes the methodology used in the remainder of this study.",
+    "Several trees were planted along the road to reduce noise.",
+]
+
+
+class PeakRSSMonitor:
+    """Sample the resident set size (RSS) of this process in a background thread to get its peak during a stage."""
+
+    def __init__(self, interval: float=0.05):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+
+    @staticmethod
+    def get_rss() -> int:
+        """Current RSS in bytes."""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (FileNotFoundError, ValueError, OSError):
+            # Fall back to the peak RSS of the whole process (in kB on Linux, in bytes on macOS).
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return max_rss if platform.system() == "Darwin" else max_rss * 1024
+
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.get_rss())
+            self._stop.wait(self.interval)
+
+
+    def __enter__(self):
+        self.peak_rss = self.get_rss()
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self.get_rss())
+
+
+def get_synthetic_text(nbr_chars: int, seed: int=42) -> str:
+    """Create a text of the given length with paragraphs of sentences with and without quantities."""
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length < nbr_chars:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            sentence = rng.choice(SYNTHETIC_SENTENCES).format(
+                a=rng.randint(1_000, 30_000), b=rng.randint(1_000, 30_000), p=round(rng.uniform(0, 100), 1),
+                year=rng.randint(1990, 2050), e=rng.randint(2, 9), x=round(rng.uniform(0, 10), 2),
+                y=round(rng.uniform(0, 1), 3), t=rng.randint(200, 400),
+            )
+            sentences.append(sentence)
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+
+    return "\n\n".join(paragraphs)[:nbr_chars]
+
+
+def load_corpus(corpus_dir: Path, max_papers: int=None) -> dict:
+    """Load abstracts and full texts from structured.json files of parsed papers."""
+    abstracts = []
+    fulltexts = []
+    for path in sorted(corpus_dir.rglob("structured.json"))[:max_papers]:
+        with open(path, "r", encoding="utf-8") as f:
+            paper = json.load(f)
+
+        text = paper.get("text", "")
+        if len(text) == 0:
+            continue
+
+        fulltexts.append(text)
+        for span in paper.get("annotations", {}).get("abstract", []):
+            abstracts.append(text[span["start"]:span["end"]])
+
+    corpora = {}
+    if len(abstracts) > 0:
+        corpora["abstracts"] = abstracts
+    if len(fulltexts) > 0:
+        corpora["papers"] = fulltexts
+
+    return corpora
+
+
+def benchmark_stage(fn, texts: list[str], count_results=None, repeats: int=1) -> dict:
+    """Time a stage of the pipeline on the given texts and measure its peak RSS."""
+    durations = []
+    nbr_results = 0
+    with PeakRSSMonitor() as monitor:
+        for _ in range(repeats):
+            nbr_results = 0
+            start = perf_counter()
+            for text in texts:
+                result = fn(text)
+                if count_results is not None:
+                    nbr_results += count_results(result)
+            durations.append(perf_counter() - start)
+
+    duration = min(durations)
+    nbr_chars = sum(len(text) for text in texts)
+    stats = {
+        "seconds": round(duration, 4),
+        "chars_per_second": round(nbr_chars / duration, 1),
+        "peak_rss_mb": round(monitor.peak_rss / 2**20, 1),
+    }
+    if count_results is not None:
+        stats["results"] = nbr_results
+        stats["results_per_second"] = round(nbr_results / duration, 2)
+
+    return stats
+
+
+def run_benchmark(quinex: Quinex, corpora: dict, repeats: int=1) -> dict:
+    """Benchmark each stage of the pipeline on each corpus."""
+
+    stages = {
+        "preprocess": (quinex.preprocess, None, None),
+        "get_quantities": (quinex.get_quantities, len, "quantities_per_second"),
+        "simple_call": (quinex.simple_call, len, "claims_per_second"),
+        "__call__": (quinex.__call__, len, "claims_per_second"),
+    }
+
+    results = {}
+    for corpus_name, texts in corpora.items():
+        msg.divider(f"{corpus_name} ({len(texts)} texts, {sum(len(t) for t in texts)} chars)")
+        results[corpus_name] = {"nbr_texts": len(texts), "nbr_chars": sum(len(t) for t in texts), "stages": {}}
+        for stage_name, (fn, count_results, rate_name) in stages.items():
+            stats = benchmark_stage(fn, texts, count_results=count_results, repeats=repeats)
+            if rate_name is not None:
+                stats[rate_name] = stats.pop("results_per_second")
+            results[corpus_name]["stages"][stage_name] = stats
+            msg.text(f"{stage_name:>15}: {stats}")
+
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the throughput of the quinex pipeline.")
+    parser.add_argument("--preset", default="tiny", choices=["tiny", "small", "base"], help="Model preset to benchmark.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000], help="Number of chars of the synthetic texts.")
+    parser.add_argument("--corpus", type=Path, default=None, help="Directory with structured.json files of parsed papers to benchmark on abstracts and full papers.")
+    parser.add_argument("--max_papers", type=int, default=10, help="Maximum number of papers to load from the corpus.")
+    parser.add_argument("--repeats", type=int, default=1, help="Number of repetitions per stage. The fastest one is reported.")
+    parser.add_argument("--threads", type=int, default=None, help="Number of torch threads.")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"), help="Path to write the results to.")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    # Get corpora of increasing size.
+    corpora = {f"synthetic_{size}_chars": [get_synthetic_text(size)] for size in args.sizes}
+    if args.corpus is not None:
+        corpora.update(load_corpus(args.corpus, args.max_papers))
+
+    # Load pipeline on CPU.
+    start = time()
+    quinex = Quinex(**getattr(models, args.preset), **tasks.full, use_cpu=True)
+    init_time = time() - start
+
+    # Warm up.
+    quinex(get_synthetic_text(500, seed=0))
+
+    results = {
+        "timestamp": datetime.now().astimezone().replace(microsecond=0).isoformat(),
+        "quinex_version": __version__,
+        "preset": args.preset,
+        "device": "cpu",
+        "torch_threads": torch.get_num_threads(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "init_seconds": round(init_time, 3),
+        "corpora": run_benchmark(quinex, corpora, repeats=args.repeats),
+    }
+    quinex.close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+
+    msg.good(f"Benchmark results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark the sentence segmenters of the quinex preprocessing in terms of speed and agreement.
+
+Compares the spaCy components that can be used for sentence boundary detection ("parser",
+"senter", and "sentencizer") in terms of chars/s and how well their sentence boundaries
+agree with the ones of the parser (precision, recall, and F1 of the sentence starts).
+Both processing each text individually and batched processing with nlp.pipe() are timed.
+
+Usage:
+    python dev/scripts/benchmark_sentence_segmentation.py --sizes 10000 100000
+    python dev/scripts/benchmark_sentence_segmentation.py --corpus path/to/papers/ --output segmentation.json
+"""
+import json
+from time import perf_counter
+from pathlib import Path
+from argparse import ArgumentParser
+from quinex import Quinex, msg
+from quinex.pipeline import SENTENCE_SEGMENTERS
+from benchmark_pipeline import get_synthetic_text, load_corpus
+
+
+def get_sentence_starts(doc) -> set[int]:
+    """Get the char offsets at which sentences start."""
+    return set(sent.start_char for sent in doc.sents)
+
+
+def get_agreement(reference_docs: list, docs: list) -> dict:
+    """Get precision, recall, and F1 of the sentence starts compared to the reference."""
+    true_positives = 0
+    nbr_predicted = 0
+    nbr_reference = 0
+    for reference_doc, doc in zip(reference_docs, docs):
+        reference_starts = get_sentence_starts(reference_doc)
+        starts = get_sentence_starts(doc)
+        true_positives += len(reference_starts & starts)
+        nbr_predicted += len(starts)
+        nbr_reference += len(reference_starts)
+
+    precision = true_positives / nbr_predicted if nbr_predicted > 0 else 0.0
+    recall = true_positives / nbr_reference if nbr_reference > 0 else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+
+def time_preprocessing(quinex: Quinex, texts: list[str]) -> tuple[list, dict]:
+    """Time preprocessing the texts one by one and in batches."""
+    nbr_chars = sum(len(text) for text in texts)
+
+    start = perf_counter()
+    docs = [quinex.nlp(text) for text in texts]
+    for doc in docs:
+        quinex._get_semantic_boundaries(doc)
+    duration_single = perf_counter() - start
+
+    start = perf_counter()
+    quinex.preprocess_many(texts)
+    duration_batched = perf_counter() - start
+
+    stats = {
+        "chars_per_second": round(nbr_chars / duration_single, 1),
+        "chars_per_second_batched": round(nbr_chars / duration_batched, 1),
+    }
+
+    return docs, stats
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the sentence segmenters of the quinex preprocessing.")
+    parser.add_argument("--spacy_model", default="en_core_web_md", help="spaCy model to use.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000], help="Number of chars of the synthetic texts.")
+    parser.add_argument("--corpus", type=Path, default=None, help="Directory with structured.json files of parsed papers to benchmark on abstracts and full papers.")
+    parser.add_argument("--max_papers", type=int, default=10, help="Maximum number of papers to load from the corpus.")
+    parser.add_argument("--output", type=Path, default=Path("sentence_segmentation_results.json"), help="Path to write the results to.")
+    args = parser.parse_args()
+
+    corpora = {f"synthetic_{size}_chars": [get_synthetic_text(size)] for size in args.sizes}
+    if args.corpus is not None:
+        corpora.update(load_corpus(args.corpus, args.max_papers))
+
+    # Only spaCy is needed for preprocessing.
+    pipelines = {
+        segmenter: Quinex(spacy_model_name=args.spacy_model, sentence_segmenter=segmenter, enable_quantity_extraction=False,
+            enable_context_extraction=False, enable_qualifier_extraction=False, enable_statement_classification=False)
+        for segmenter in SENTENCE_SEGMENTERS
+    }
+
+    # Warm up.
+    for quinex in pipelines.values():
+        quinex.nlp(get_synthetic_text(500, seed=0))
+
+    results = {}
+    for corpus_name, texts in corpora.items():
+        msg.divider(f"{corpus_name} ({len(texts)} texts, {sum(len(t) for t in texts)} chars)")
+        results[corpus_name] = {}
+        reference_docs = None
+        for segmenter, quinex in pipelines.items():
+            docs, stats = time_preprocessing(quinex, texts)
+            if segmenter == "parser":
+                reference_docs = docs
+            stats["agreement_with_parser"] = get_agreement(reference_docs, docs)
+            results[corpus_name][segmenter] = stats
+            msg.text(f"{segmenter:>12}: {stats}")
+
+    for quinex in pipelines.values():
+        quinex.close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+
+    msg.good(f"Benchmark results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
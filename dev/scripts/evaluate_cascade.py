@@ -0,0 +1,190 @@
+"""
+Evaluate the quality versus cost trade-off of model cascades for different thresholds.
+
+In a cascade (see Quinex(cascade_model_preset=...)), a smaller model is applied first and only
+inputs whose prediction has a confidence below a threshold are processed again with the larger
+model. This script applies both models once to all examples of the dev sets and then simulates
+the cascade for each threshold, reporting the quality and the fraction of escalated inputs.
+
+Quantity span identification is evaluated on quantity NER datasets (JSON files with a "data"
+field containing examples with "tokens" and "ner_tags") in terms of precision, recall, and F1
+of exact quantity spans. Measurement context extraction is evaluated on SQuAD-style datasets
+(JSON files with a "data" field containing examples with "question", "context", and "answers")
+in terms of exact match and F1 of the answers.
+
+Usage:
+    python dev/scripts/evaluate_cascade.py --quantity_dev_sets path/to/quantity_ner_dev.json --context_dev_sets path/to/context_dev.json
+    python dev/scripts/evaluate_cascade.py --cascade_model_preset small --thresholds 0.5 0.7 0.9 --output cascade.json
+"""
+import sys
+import json
+from time import perf_counter
+from pathlib import Path
+from argparse import ArgumentParser
+from quinex import msg
+from quinex.config.presets import models as model_presets
+from quinex.extract.utils.transformers import load_transformers_pipe
+from quinex.extract.utils.cascade import get_token_classification_confidence, get_generation_confidence
+from validate_chunk_prefilter import is_outside_tag, is_begin_tag
+
+sys.path.append(str(Path(__file__).parents[1] / "training" / "context_extraction" / "metrics"))
+from compute_score import compute_exact, compute_f1
+
+
+def load_examples(dataset_paths: list[Path]) -> list[dict]:
+    examples = []
+    for dataset_path in dataset_paths:
+        with open(dataset_path, "r", encoding="utf-8") as f:
+            examples.extend(json.load(f)["data"])
+
+    return examples
+
+
+def get_gold_quantity_spans(tokens: list[str], tags: list, label_names: list[str]=None) -> set[tuple[int, int]]:
+    """Get the char offsets of the gold quantity spans in the tokens joined by spaces."""
+    spans = set()
+    start = None
+    end = None
+    char_offset = 0
+    for token, tag in zip(tokens, tags):
+        if is_outside_tag(tag, label_names) or is_begin_tag(tag, label_names):
+            if start is not None:
+                spans.add((start, end))
+            start = None if is_outside_tag(tag, label_names) else char_offset
+        elif start is None:
+            # Treat an inside tag without a preceding begin tag as begin tag.
+            start = char_offset
+        end = char_offset + len(token)
+        char_offset += len(token) + 1
+
+    if start is not None:
+        spans.add((start, end))
+
+    return spans
+
+
+def predict(pipe, inputs: list, batch_size: int) -> tuple[list, float]:
+    """Apply a pipeline to all inputs and measure the duration."""
+    start = perf_counter()
+    predictions = []
+    for i in range(0, len(inputs), batch_size):
+        predictions.extend(pipe(inputs[i:i+batch_size]))
+
+    return predictions, perf_counter() - start
+
+
+def get_span_scores(gold_spans: list[set], predicted_spans: list[set]) -> dict:
+    true_positives = sum(len(gold & predicted) for gold, predicted in zip(gold_spans, predicted_spans))
+    nbr_predicted = sum(len(predicted) for predicted in predicted_spans)
+    nbr_gold = sum(len(gold) for gold in gold_spans)
+    precision = true_positives / nbr_predicted if nbr_predicted > 0 else 0.0
+    recall = true_positives / nbr_gold if nbr_gold > 0 else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+
+def get_answer_scores(gold_answers: list[list[str]], predicted_answers: list[str]) -> dict:
+    exact = [max(compute_exact(gold, predicted) for gold in golds) for golds, predicted in zip(gold_answers, predicted_answers)]
+    f1 = [max(compute_f1(gold, predicted) for gold in golds) for golds, predicted in zip(gold_answers, predicted_answers)]
+
+    return {"exact": round(sum(exact) / max(len(exact), 1), 4), "f1": round(sum(f1) / max(len(f1), 1), 4)}
+
+
+def sweep_thresholds(thresholds: list[float], confidences: list[float], small_predictions: list, large_predictions: list, score, durations: dict) -> list[dict]:
+    """Simulate the cascade for each threshold."""
+    results = []
+    for threshold in [None] + thresholds + [float("inf")]:
+        if threshold is None:
+            # Only the smaller model.
+            escalated = [False] * len(confidences)
+        else:
+            escalated = [confidence < threshold for confidence in confidences]
+        predictions = [large if is_escalated else small for small, large, is_escalated in zip(small_predictions, large_predictions, escalated)]
+        escalation_rate = sum(escalated) / max(len(escalated), 1)
+        results.append({
+            "threshold": "small only" if threshold is None else "large only" if threshold == float("inf") else threshold,
+            "escalation_rate": round(escalation_rate, 4),
+            # Approximate cost relative to the large model alone.
+            "relative_duration": round((durations["small"] + escalation_rate * durations["large"]) / durations["large"], 4),
+            **score(predictions),
+        })
+
+    return results
+
+
+def evaluate_quantity_cascade(examples: list[dict], small_model: str, large_model: str, thresholds: list[float], label_names: list[str], batch_size: int) -> list[dict]:
+    texts = [" ".join(example["tokens"]) for example in examples]
+    gold_spans = [get_gold_quantity_spans(example["tokens"], example["ner_tags"], label_names) for example in examples]
+
+    durations = {}
+    small_pipe = load_transformers_pipe("token-classification", small_model, "cpu", batch_size=batch_size, backend="torch", return_scores=True)
+    small_predictions, durations["small"] = predict(small_pipe, texts, batch_size)
+    large_pipe = load_transformers_pipe("token-classification", large_model, "cpu", batch_size=batch_size)
+    large_predictions, durations["large"] = predict(large_pipe, texts, batch_size)
+
+    confidences = [get_token_classification_confidence(prediction) for prediction in small_predictions]
+    to_spans = lambda prediction: {(entity["start"], entity["end"]) for entity in prediction}
+    score = lambda predictions: get_span_scores(gold_spans, [to_spans(prediction) for prediction in predictions])
+
+    return sweep_thresholds(thresholds, confidences, small_predictions, large_predictions, score, durations)
+
+
+def evaluate_context_cascade(examples: list[dict], small_model: str, large_model: str, thresholds: list[float], batch_size: int) -> list[dict]:
+    inputs = [" ".join(["question:", example["question"].lstrip(), "context:", example["context"].lstrip()]) for example in examples]
+    gold_answers = [example["answers"]["text"] if len(example["answers"]["text"]) > 0 else [""] for example in examples]
+
+    durations = {}
+    small_pipe = load_transformers_pipe("text2text-generation", small_model, "cpu", batch_size=batch_size, backend="torch", return_scores=True)
+    small_predictions, durations["small"] = predict(small_pipe, inputs, batch_size)
+    large_pipe = load_transformers_pipe("text2text-generation", large_model, "cpu", batch_size=batch_size, backend="torch")
+    large_predictions, durations["large"] = predict(large_pipe, inputs, batch_size)
+
+    confidences = [get_generation_confidence(prediction) for prediction in small_predictions]
+    score = lambda predictions: get_answer_scores(gold_answers, [prediction["generated_text"].strip() for prediction in predictions])
+
+    return sweep_thresholds(thresholds, confidences, small_predictions, large_predictions, score, durations)
+
+
+def print_results(results: list[dict]):
+    header = list(results[0].keys())
+    msg.table([[result[key] for key in header] for result in results], header=header, divider=True)
+
+
+def main():
+    parser = ArgumentParser(description="Evaluate the quality versus cost trade-off of model cascades for different thresholds.")
+    parser.add_argument("--quantity_dev_sets", nargs="*", type=Path, default=[], help="Quantity NER datasets in JSON format.")
+    parser.add_argument("--context_dev_sets", nargs="*", type=Path, default=[], help="SQuAD-style context extraction datasets in JSON format.")
+    parser.add_argument("--label_names", nargs="+", default=None, help="Label names in the order of the label ids if the NER tags are ids (e.g., O B-Quantity I-Quantity).")
+    parser.add_argument("--cascade_model_preset", default="tiny", help="Model preset of the smaller models.")
+    parser.add_argument("--model_preset", default="base", help="Model preset of the larger models.")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99], help="Thresholds to evaluate.")
+    parser.add_argument("--batch_size", type=int, default=16, help="Batch size.")
+    parser.add_argument("--output", type=Path, default=Path("cascade_results.json"), help="Path to write the results to.")
+    args = parser.parse_args()
+
+    small_models = getattr(model_presets, args.cascade_model_preset)
+    large_models = getattr(model_presets, args.model_preset)
+
+    results = {}
+    if len(args.quantity_dev_sets) > 0:
+        msg.divider(f"Quantity span identification ({small_models['quantity_model_name']} -> {large_models['quantity_model_name']})")
+        results["quantity_model"] = evaluate_quantity_cascade(load_examples(args.quantity_dev_sets), small_models["quantity_model_name"], large_models["quantity_model_name"], args.thresholds, args.label_names, args.batch_size)
+        print_results(results["quantity_model"])
+
+    if len(args.context_dev_sets) > 0:
+        msg.divider(f"Measurement context extraction ({small_models['context_model_name']} -> {large_models['context_model_name']})")
+        results["context_model"] = evaluate_context_cascade(load_examples(args.context_dev_sets), small_models["context_model_name"], large_models["context_model_name"], args.thresholds, args.batch_size)
+        print_results(results["context_model"])
+
+    if len(results) == 0:
+        msg.fail("No dev sets given. Use --quantity_dev_sets and/or --context_dev_sets.", exits=1)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+
+    msg.good(f"Cascade results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
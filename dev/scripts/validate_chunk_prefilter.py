@@ -0,0 +1,100 @@
+"""
+Validate that the chunk prefilter of the quantity span identification does not lose any quantities.
+
+The prefilter skips chunks without any digit, number word, imprecise quantity, or constant
+(see may_contain_quantity() in quinex/extract/subtasks/quantity_span_identification.py).
+This script applies it to the examples of the quantity NER datasets (JSON files with a "data"
+field containing examples with "tokens" and "ner_tags") and reports the gold quantities that
+would be lost because their example would be skipped, as well as the gold quantity surfaces
+that do not contain any quantity cue themselves. Exits with code 1 if any quantity is lost.
+
+Usage:
+    python dev/scripts/validate_chunk_prefilter.py path/to/quantity_ner_train.json path/to/quantity_ner_dev.json
+"""
+import sys
+import json
+from pathlib import Path
+from argparse import ArgumentParser
+from quinex import msg
+from quinex.extract.subtasks.quantity_span_identification import may_contain_quantity
+
+
+def is_outside_tag(tag, label_names: list[str]=None) -> bool:
+    """Check if a NER tag is the "O" tag. Tags are either label strings or label ids."""
+    if isinstance(tag, int):
+        return tag == 0 if label_names is None else label_names[tag] == "O"
+    else:
+        return tag == "O"
+
+
+def is_begin_tag(tag, label_names: list[str]=None) -> bool:
+    if isinstance(tag, int) and label_names is not None:
+        tag = label_names[tag]
+    return isinstance(tag, str) and tag.startswith("B-")
+
+
+def get_gold_quantities(tokens: list[str], tags: list, label_names: list[str]=None) -> list[str]:
+    """Get the surfaces of the gold quantity spans of an example."""
+    quantities = []
+    current = []
+    for token, tag in zip(tokens, tags):
+        if is_outside_tag(tag, label_names) or is_begin_tag(tag, label_names):
+            if len(current) > 0:
+                quantities.append(" ".join(current))
+            current = [] if is_outside_tag(tag, label_names) else [token]
+        else:
+            current.append(token)
+
+    if len(current) > 0:
+        quantities.append(" ".join(current))
+
+    return quantities
+
+
+def main():
+    parser = ArgumentParser(description="Validate that the chunk prefilter does not lose any gold quantities.")
+    parser.add_argument("datasets", nargs="+", type=Path, help="Quantity NER datasets in JSON format.")
+    parser.add_argument("--label_names", nargs="+", default=None, help="Label names in the order of the label ids if the NER tags are ids (e.g., O B-Quantity I-Quantity).")
+    args = parser.parse_args()
+
+    nbr_examples = 0
+    nbr_skipped_examples = 0
+    nbr_gold_quantities = 0
+    lost_quantities = []
+    quantities_without_cue = []
+    for dataset_path in args.datasets:
+        with open(dataset_path, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+
+        for example in dataset["data"]:
+            nbr_examples += 1
+            text = " ".join(example["tokens"])
+            gold_quantities = get_gold_quantities(example["tokens"], example["ner_tags"], args.label_names)
+            nbr_gold_quantities += len(gold_quantities)
+
+            if not may_contain_quantity(text):
+                nbr_skipped_examples += 1
+                lost_quantities.extend((dataset_path.name, q, text) for q in gold_quantities)
+
+            quantities_without_cue.extend(q for q in gold_quantities if not may_contain_quantity(q))
+
+    msg.divider("Chunk prefilter validation")
+    msg.text(f"Examples: {nbr_examples}")
+    msg.text(f"Skipped examples: {nbr_skipped_examples} ({nbr_skipped_examples / max(nbr_examples, 1):.1%})")
+    msg.text(f"Gold quantities: {nbr_gold_quantities}")
+    msg.text(f"Gold quantities without any cue themselves: {len(quantities_without_cue)} (kept if their example has another cue)")
+    for q in sorted(set(quantities_without_cue)):
+        msg.text(f"  - {q}", color="grey")
+
+    recall = 1 - len(lost_quantities) / max(nbr_gold_quantities, 1)
+    if len(lost_quantities) == 0:
+        msg.good(f"No gold quantity is lost by the prefilter (recall {recall:.2%}).")
+    else:
+        msg.fail(f"{len(lost_quantities)} gold quantities are lost by the prefilter (recall {recall:.2%}):")
+        for dataset_name, q, text in lost_quantities:
+            msg.text(f"  - {q!r} in {dataset_name}: {text[:100]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ from wasabi import msg
 from tqdm import tqdm
 from quinex import Quinex
 from quinex.config.presets import models, tasks
+from quinex.documents.papers.parse.helpers.transform import get_boilerplate_regions
 from text_processing_utils.boolean_checks import is_gibberish
 
 
@@ -14,6 +15,7 @@ from text_processing_utils.boolean_checks import is_gibberish
 def extract_quantitative_information_from_batch(
     batch_dir,
     skip_imprecise_quantities=False,
+    skip_boilerplate_regions=True,
     use_cpu=True,
     use_fp16=False,
     parallel_worker_device_map={
@@ -84,7 +86,9 @@ def extract_quantitative_information_from_batch(
             msg.info(f"Extracting quantitative information from {paper_id}...")  
             start = time()
             try:
-                predictions = quinex(paper["text"], skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=True)
+                # Skip reference lists, funding statements, citations, and similar regions.
+                exclude_regions = get_boilerplate_regions(paper["text"], paper.get("annotations", {})) if skip_boilerplate_regions else None
+                predictions = quinex(paper["text"], skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=True, exclude_regions=exclude_regions)
             except Exception as e:
                 print(e)
                 predictions = []
@@ -99,6 +103,7 @@ def extract_quantitative_information_from_batch(
         paper["provenance"] = {
             "execution_time": execution_time,
             "skip_imprecise_quantities": config["quantitative_information_extraction"]["skip_imprecise_quantities"],
+            "skip_boilerplate_regions": skip_boilerplate_regions,
             "models": config["quantitative_information_extraction"]["model_paths"],
             "timestamp": datetime.now().astimezone().replace(microsecond=0, second=0).isoformat()
         }
@@ -3,7 +3,7 @@ import yaml
 from typing import Annotated
 from argparse import ArgumentParser
 from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 import uvicorn
 from pydantic import BaseModel
 from quinex import Quinex, __version__
@@ -66,6 +66,12 @@ parallel_worker_device_map = {
 quinex = Quinex(**models.base, **tasks.full, use_cpu=use_cpu, parallel_worker_device_map=parallel_worker_device_map)
 
 
+@app.on_event("shutdown")
+def shutdown_pipeline():
+    # Shut down the long-lived model workers of the pipeline.
+    quinex.close()
+
+
 # ==========================================
 # =             API Endpoints              =
 # ==========================================
@@ -98,6 +104,27 @@ def process_text(text: Annotated[str, Body(examples=[example_text])], skip_impre
     return {"predictions": json.dumps({"quantitative_statements": predictions}, ensure_ascii=False)}
 
 
+@app.post("/api/stream_text/", tags=["Predict"])
+async def stream_text(text: Annotated[str, Body(examples=[example_text])], skip_imprecise_quantities: bool=True, add_curation_fields: bool=False):
+    """Stream quantitative statements as server-sent events as soon as they are extracted."""
+
+    if text == None:
+        raise HTTPException(status_code=400, detail='Missing text in request body in form of json={"text": "Some text."}')
+    elif type(text) != str:
+        raise HTTPException(status_code=400, detail='Text must be of type string.')
+    
+    # Send text through the models.
+    print("Streaming pipeline results for text...")
+    async def event_stream():
+        async for quantitative_statement in quinex.astream(text, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields):
+            yield f"data: {json.dumps(quantitative_statement, ensure_ascii=False)}\n\n"
+        
+        # Signal the end of the stream.
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 class TextAndQuantity(BaseModel):
     text: str
     quantity_start_char: int
@@ -4,10 +4,30 @@ __version__ = "0.0.0"
 from wasabi import Printer
 msg = Printer(timestamp=True)
 
-# Utility functions and parsers
-from quinex_utils.functions import str2num
-from quinex_utils.parsers.quantity_parser import FastSymbolicQuantityParser
-from quinex_utils.parsers.unit_parser import FastSymbolicUnitParser
+# Utility functions, parsers and the main pipeline class are imported on first access
+# so that, e.g., using str2num does not require importing torch, transformers and spaCy.
+_lazy_imports = {
+    # Utility functions and parsers
+    "str2num": ("quinex_utils.functions", "str2num"),
+    "FastSymbolicQuantityParser": ("quinex_utils.parsers.quantity_parser", "FastSymbolicQuantityParser"),
+    "FastSymbolicUnitParser": ("quinex_utils.parsers.unit_parser", "FastSymbolicUnitParser"),
+    # Main pipeline class
+    "Quinex": ("quinex.pipeline", "Quinex"),
+}
 
-# Main pipeline class
-from .pipeline import Quinex
+__all__ = ["__version__", "msg", *_lazy_imports]
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        import importlib
+        module_name, attr_name = _lazy_imports[name]
+        value = getattr(importlib.import_module(module_name), attr_name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return __all__
@@ -14,6 +14,7 @@ import plotly.graph_objects as go
 from quinex_utils.functions.boolean_checks import contains_any_number
 from quinex_utils.parsers.quantity_parser import FastSymbolicQuantityParser, FastSymbolicUnitParser
 from quinex.normalize.spatial_scope.llm_geoguessing import get_geo_coordinates_from_spatial_scope
+from quinex.extract.utils.caching import CachedQuantityParser
 
 from quinex.analyze.create_plots.helpers.utils import load_application_results, condense_quantity_format
 from quinex.analyze.create_plots.helpers.filter import filter_based_on_characteristic_keywords, only_absolute_quantities, only_keep_successfully_normalized_quantities, filter_rows_with_value_outside_expected_bounds
@@ -42,9 +43,10 @@ def get_single_numeric_value_for_each_quantity(
     if redo_quantity_normalization:
         print("\n>>>>>>>>>>>>>>> Normalizing quantities")
         df_filtered["normalized_quantity"] = None # reset
-        quantity_parser = FastSymbolicQuantityParser()
+        quantity_parser = CachedQuantityParser(FastSymbolicQuantityParser())
         for index, row in tqdm(df_filtered.iterrows()):
             df_filtered.at[index, "normalized_quantity"] = quantity_parser.parse(row["quantity"])
+        print(f"Quantity parser cache: {quantity_parser.get_stats()}")
 
     # Filter out rows with unsuccessfully normalized quantities.
     df_quantity_parsing_failed = df_filtered[df_filtered["normalized_quantity"].apply(lambda x: x is None or not x["success"] or len(x["normalized_quantities"]) == 0)]
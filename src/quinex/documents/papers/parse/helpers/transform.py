@@ -1,3 +1,17 @@
+import re
+
+
+# Headers of sections without quantitative statements of interest. Headers must start with one 
+# of the phrases (optionally after a section number such as "7." or "A.1"), so that, e.g., 
+# "Results and references" or "Fundamentals" are not matched.
+BOILERPLATE_SECTION_HEADER_REGEX = re.compile(
+    r"^\s*(?:(?:\d+(?:\.\d+)*\.?|(?-i:[A-Z])(?:(?:\.\d+)+\.?|\.))\s+)?"
+    r"(?:acknowledg\w*|funding|financial support|conflicts? of interests?|competing interests?|declaration of\b|"
+    r"author contributions?|credit authorship|data availability|references|bibliography|abbreviations|nomenclature)\b",
+    re.IGNORECASE
+)
+
+
 def simple_s2orc_json_to_string(paper: dict) -> str:
     """Convert S2ORC JSON paper to string."""
     section_header = "Abstract: "
@@ -162,6 +176,36 @@ def elsevier_xml_json_to_string(paper: dict) -> str:
     return text, annotations
 
 
+def get_boilerplate_regions(text: str, annotations: dict, skip_citations: bool=True, section_header_regex: re.Pattern=BOILERPLATE_SECTION_HEADER_REGEX) -> list[dict]:
+    """
+    Get the char spans of regions of a parsed paper that do not contain quantitative statements
+    of interest, that is, sections such as acknowledgements, funding statements, or reference lists
+    (identified by their headers) and, optionally, citations (e.g., "[25-28]").
+
+    Args:
+        text (str): Text of the paper (e.g., created by s2orc_json_to_string()).
+        annotations (dict): Annotations of the paper with "section_header" and "citations" spans.
+        skip_citations (bool): Whether to include citations in the regions.
+        section_header_regex (re.Pattern): Regex matching the headers of the sections to include in the regions.
+
+    Returns:
+        list: Regions as dicts with "start" and "end" keys, e.g., to pass as exclude_regions to Quinex.
+    """
+    regions = []
+
+    # A section spans from its header to the next header or the end of the text.
+    headers = sorted(annotations.get("section_header", []), key=lambda span: span["start"])
+    for i, header in enumerate(headers):
+        if section_header_regex.search(text[header["start"]:header["end"]]):
+            end = headers[i+1]["start"] if i + 1 < len(headers) else len(text)
+            regions.append({"start": header["start"], "end": end})
+
+    if skip_citations:
+        regions.extend({"start": span["start"], "end": span["end"]} for span in annotations.get("citations", []))
+
+    return regions
+
+
 def post_process_parsed_json(json_paper):
 
     relevant_keys = ["text", "section", "title", "first", "last", "suffix", "laboratory", "institution", "location", "country", "email", "venue"]                
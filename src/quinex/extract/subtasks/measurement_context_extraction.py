@@ -10,7 +10,11 @@ from text_processing_utils.batches import get_n_batches, get_batches_of_roughly_
 from text_processing_utils.highlight_context import enclose_with_special_symbol, adapt_offsets_to_special_symbol_enclosings
 
 from quinex import msg
-from quinex.extract.utils.transformers import load_transformers_pipe, get_text_chunking_helper
+from quinex.extract.utils.transformers import load_transformers_pipe, get_text_chunking_helper, check_same_tokenizer, CompiledPromptTemplate
+from quinex.extract.utils.documents import get_document_per_quantity, get_centered_chunk_with_enclosed_span, adapt_semantic_boundaries
+from quinex.extract.utils.workers import WorkerPool
+from quinex.extract.utils.batches import apply_pipe_sorted_by_length, sort_by_length, restore_order
+from quinex.extract.utils.cascade import CascadePipe, get_generation_confidence, get_cascade_stats
 from quinex.config.models_registry import MODELS
 
 
@@ -30,6 +34,16 @@ class MeasurementContextExtraction:
         enable_qualifier_extraction (bool, optional): Whether to enable qualifier extraction.
         create_new_pipes_for_qlf_extraction (bool, optional): Whether to use a seperate pipeline for qualifier extraction instead of using the same pipeline as for property and entity extraction.
         empty_dict_for_empty_prediction (bool, optional): Whether to return an empty dict for empty predictions instead of None.        
+        sort_inputs_by_length (bool, optional): Whether to sort the model inputs by token length before batching to reduce padding.
+        max_batch_tokens (int, optional): If given, property and entity inputs are batched under this budget of padded tokens per batch instead of a fixed batch size.
+        assistant_model_path (str, optional): Path to a smaller model of the same family (e.g., JuelichSystemsAnalysis/quinex-context-v0-77M) that drafts the answers, which are verified by the model (assisted generation). Gives the same answers as greedy decoding with the model alone, but processes one input at a time.
+        constrained_decoding (bool, optional): Whether answers can only be spans of the context (requires inference_backend "torch"). Generation stops as soon as the answer cannot be extended to a longer span of the context.
+        implicit_answers (list, optional): Answers to the property question that can be generated with constrained decoding even if they are not in the context.
+        cascade_model_path (str, optional): If given, this smaller model of the same family is applied first and only inputs whose answer has a length-normalized probability below `cascade_threshold` are processed again with the model.
+        cascade_threshold (float, optional): Minimum length-normalized probability of an answer of the smaller model to keep it.
+        window_first_marking (bool, optional): Whether to enclose quantities in special symbols only within a window around them instead of within the whole text (gives the same contexts, but avoids copying the whole text for each quantity).
+        inference_backend (str, optional): "pipeline" to use transformers pipelines, "torch" to use the lean inference engines with identical outputs, or "onnx"/"onnx-int8" to use ONNX Runtime (optionally with int8 weights).
+        qualifier_rank_initializers (list, optional): For each device rank, a function called by the qualifier extraction workers of the rank when they start processing it (e.g., to set their CPU cores).
 
     """
     
@@ -45,7 +59,17 @@ class MeasurementContextExtraction:
             enable_qualifier_extraction=True,            
             create_new_pipes_for_qlf_extraction=False,
             empty_dict_for_empty_prediction=False,
+            sort_inputs_by_length=True,
+            max_batch_tokens=None,
+            window_first_marking=True,
+            assistant_model_path=None,
+            constrained_decoding=False,
+            implicit_answers=None,
+            cascade_model_path=None,
+            cascade_threshold=0.8,
             dtype="auto",
+            inference_backend="pipeline",
+            qualifier_rank_initializers=None,
             verbose=False,
             debug=False
         ): 
@@ -53,6 +77,10 @@ class MeasurementContextExtraction:
         self.verbose = verbose
         self.debug = debug
         self.empty_dict_for_empty_prediction = empty_dict_for_empty_prediction
+        self.sort_inputs_by_length = sort_inputs_by_length
+        # Assisted generation only supports batches of one input.
+        self.max_batch_tokens = max_batch_tokens if assistant_model_path is None else None
+        self.window_first_marking = window_first_marking
 
         # Qualifier extraction settings.
         self.enable_qualifier_extraction = enable_qualifier_extraction
@@ -74,6 +102,9 @@ class MeasurementContextExtraction:
         # Get token counter.
         self.token_counter, self.chunk_size = get_text_chunking_helper(model_path, task="text2text-generation")
 
+        # Precompile the prompts to count the tokens of the fixed parts of the question templates only once.
+        self.prompt_templates = {q_key: CompiledPromptTemplate(f"question: {question} context: ", self.token_counter) for q_key, question in self.questions.items()}
+
         # Get longest question for chunking (assumes all qualifier question templates have the same slots).        
         qualifier_question_token_len = [self.token_counter(self.questions[q_key]) for q_key in self.qualifier_question_keys]
         self.longest_qualifier_question_key = self.qualifier_question_keys[qualifier_question_token_len.index(max(qualifier_question_token_len))]
@@ -86,20 +117,86 @@ class MeasurementContextExtraction:
         article_pronoun_prefixes = ["a", "an", "the", "one", "this", "that", "these", "those", "my", "your", "his", "her", "its", "our", "their", "both", "all", "every"]
         self.perfix_the = lambda x: "the " + x if x.strip().split(" ")[0] not in article_pronoun_prefixes else x
             
+        # Make sure the assistant model is of the same family and drafts tokens of the same vocabulary.
+        if assistant_model_path is not None:
+            registered_models = MODELS["measurement_context_extraction"]
+            if model_path in registered_models and assistant_model_path in registered_models and registered_models[model_path]["family"] != registered_models[assistant_model_path]["family"]:
+                raise ValueError(f"Assistant model {assistant_model_path} must be of the same model family as {model_path}.")
+            check_same_tokenizer(model_path, assistant_model_path)
+
+        # Implicit answers are properties, hence, they are only allowed for the property question.
+        implicit_answers_question_prefix = self.questions["property_question"].partition("{")[0]
+
         # Load parallel measurement context extraction pipelines.
-        self.measurement_context_pipelines = [load_transformers_pipe("text2text-generation", model_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, max_new_tokens=max_new_tokens) for device in devices]
+        load_pipe = lambda device: load_transformers_pipe("text2text-generation", model_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, max_new_tokens=max_new_tokens, backend=inference_backend, assistant_model_path=assistant_model_path, constrain_to_context=constrained_decoding, allowed_answers=implicit_answers, allowed_answers_question_prefix=implicit_answers_question_prefix)
+        if cascade_model_path is not None:
+            # Apply a smaller model first and only the model to inputs the smaller one is unsure about.
+            # The smaller model uses the lean inference engine, which gives the same outputs as the pipeline and also returns scores.
+            check_same_tokenizer(model_path, cascade_model_path)
+            load_model_pipe = load_pipe
+            load_pipe = lambda device: CascadePipe(
+                load_transformers_pipe("text2text-generation", cascade_model_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, max_new_tokens=max_new_tokens, backend="torch", constrain_to_context=constrained_decoding, allowed_answers=implicit_answers, allowed_answers_question_prefix=implicit_answers_question_prefix, return_scores=True),
+                load_model_pipe(device), 
+                cascade_threshold, 
+                get_generation_confidence
+            )
+        self.measurement_context_pipelines = [load_pipe(device) for device in devices]
         
         # Load parallel qualifier extraction pipelines.
         if self.enable_qualifier_extraction:
             if create_new_pipes_for_qlf_extraction:
-                self.qualifier_pipelines = [load_transformers_pipe("text2text-generation", model_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, max_new_tokens=max_new_tokens) for device in devices]
+                self.qualifier_pipelines = [load_pipe(device) for device in devices]
             else:
                 self.qualifier_pipelines = self.measurement_context_pipelines
             self.qualifier_pipelines = get_n_batches(self.qualifier_pipelines, len(self.measurement_context_pipelines))
 
+        self._start_worker_pools(qualifier_rank_initializers)
+
+
+    def _start_worker_pools(self, rank_initializers: list=None):
+        """
+        Set up long-lived workers for the qualifier pipelines of each device rank.
+
+        Args:
+            rank_initializers (list, optional): For each device rank, a function passed to its WorkerPool as rank_initializer.
+        """
+        if self.enable_qualifier_extraction:
+            rank_initializers = rank_initializers or [None] * len(self.qualifier_pipelines)
+            self.qualifier_worker_pools = [WorkerPool(len(pipelines), name=f"qualifier_model_{rank}", rank_kwarg="worker_rank", rank_initializer=rank_initializers[rank]) for rank, pipelines in enumerate(self.qualifier_pipelines)]
+        else:
+            self.qualifier_worker_pools = []
+
+
+    def get_cascade_stats(self) -> dict:
+        """Get the number of inputs and the number of inputs escalated to the larger model if a cascade is used."""
+        qualifier_pipelines = [pipe for pipes in self.qualifier_pipelines for pipe in pipes] if self.enable_qualifier_extraction else []
+        return get_cascade_stats(self.measurement_context_pipelines + qualifier_pipelines)
+
+
+    def close(self):
+        """Shut down the qualifier extraction workers."""
+        for pool in self.qualifier_worker_pools:
+            pool.shutdown()
+
 
     def __call__(self, quantities, device_rank, text, semantic_boundaries, return_llm_inputs=False, add_curation_fields=False):
+        """
+        Extract the measurement context for a batch of quantities.
+
+        Args:
+            quantities (list): List of quantity spans.
+            device_rank (int): The rank of the device to use for processing.
+            text (str or list): The text the quantities stem from or a list with one text per quantity
+                                if the batch contains quantities from different documents.
+            semantic_boundaries (list): Semantic boundaries of the text or a list with the semantic
+                                boundaries of the text of each quantity.
+            return_llm_inputs (bool): Whether to add the model inputs to the output.
+            add_curation_fields (bool): Whether to add curation fields to the output.
+        """
         
+        # Get the text and semantic boundaries each quantity stems from.
+        texts, semantic_boundaries = get_document_per_quantity(quantities, text, semantic_boundaries)
+
         if self.verbose:
             msg.info("Extracting measurement context for batch of quantities...")
             start = time()
@@ -107,7 +204,7 @@ class MeasurementContextExtraction:
         # -------------------------------
         #   Extract measured properties  
         # -------------------------------
-        properties, property_contexts, property_inputs = self.extract_properties(quantities, text, semantic_boundaries, device_rank)
+        properties, property_contexts, property_inputs = self.extract_properties(quantities, texts, semantic_boundaries, device_rank)
         if self.verbose:
             msg.good(f"Property extraction done in {round(time()-start, 3)} s.")
             start = time()
@@ -115,7 +212,7 @@ class MeasurementContextExtraction:
         # -------------------------------
         #   Extract measured entities
         # -------------------------------
-        entities, entity_contexts, entity_inputs, question_template_filling_information = self.extract_entities(quantities, properties, property_contexts, text, semantic_boundaries, device_rank)    
+        entities, entity_contexts, entity_inputs, question_template_filling_information = self.extract_entities(quantities, properties, property_contexts, texts, semantic_boundaries, device_rank)    
         if self.verbose:
             msg.good(f"Entity extraction done in {round(time()-start, 3)} s.")
             start = time()
@@ -123,7 +220,7 @@ class MeasurementContextExtraction:
         # -------------------------------
         #   Extract qualifiers
         # -------------------------------
-        qualifiers, qualifier_inputs = self.extract_qualifiers(quantities, properties, entities, entity_contexts, question_template_filling_information, text, semantic_boundaries, device_rank)
+        qualifiers, qualifier_inputs = self.extract_qualifiers(quantities, properties, entities, entity_contexts, question_template_filling_information, texts, semantic_boundaries, device_rank)
         if self.verbose:
             msg.good(f"Qualifier extraction done in {round(time()-start, 3)} s.")
 
@@ -161,12 +258,17 @@ class MeasurementContextExtraction:
 
     def extract_properties(self, quantities, text, semantic_boundaries, device_rank):
 
+        # Get the text and semantic boundaries each quantity stems from.
+        texts, semantic_boundaries = get_document_per_quantity(quantities, text, semantic_boundaries)
+
         # Create prompts for property extraction.
         property_inputs = []
         property_contexts = []
-        for quantity in quantities:
-            property_question = self.questions["property_question"].format(quantity_span=quantity["text"])
-            property_input, context_w_quantity_enclosing, context_wo_enclosing, context_char_offset = self._get_property_input(property_question, quantity, text, semantic_boundaries)
+        for quantity, text, semantic_boundaries_ in zip(quantities, texts, semantic_boundaries):
+            slots = {"quantity_span": quantity["text"]}
+            property_question = self.questions["property_question"].format(**slots)
+            prefix_token_count = self.prompt_templates["property_question"].count_tokens(**slots)
+            property_input, context_w_quantity_enclosing, context_wo_enclosing, context_char_offset = self._get_property_input(property_question, quantity, text, semantic_boundaries_, prefix_token_count=prefix_token_count)
             property_inputs.append(property_input)
             property_contexts.append((context_w_quantity_enclosing, context_wo_enclosing, context_char_offset))
 
@@ -177,39 +279,48 @@ class MeasurementContextExtraction:
                     print(f"Warning: Chunk in property extraction is too long ({len(chunk)} > {self.chunk_size}): {chunk}")
                     print(property_inputs)
                 
-        property_predictions = self.measurement_context_pipelines[device_rank](property_inputs)
+        property_predictions = self._apply_pipeline(self.measurement_context_pipelines[device_rank], property_inputs)
 
         # Post-process property predictions.
         properties = []
-        for p_prediction, quantity, (_, context_wo_enclosing, context_char_offset) in zip(property_predictions, quantities, property_contexts):
+        for p_prediction, quantity, (_, context_wo_enclosing, context_char_offset), text, semantic_boundaries_ in zip(property_predictions, quantities, property_contexts, texts, semantic_boundaries):
             properties.append(self._postprocess_prediction(
-                p_prediction, quantity, context_wo_enclosing, context_char_offset, text, semantic_boundaries
+                p_prediction, quantity, context_wo_enclosing, context_char_offset, text, semantic_boundaries_
             ))
         
         return properties, property_contexts, property_inputs
    
     
     def extract_entities(self, quantities, properties, property_contexts, text, semantic_boundaries, device_rank):
+        
+        # Get the text and semantic boundaries each quantity stems from.
+        texts, semantic_boundaries = get_document_per_quantity(quantities, text, semantic_boundaries)
+
         # Create prompts for entity extraction.
         entity_inputs = []
         entity_contexts = []        
         question_template_filling_information = []
-        for quantity, property, (context_w_quantity_enclosing, context_wo_enclosing, context_char_offset) in zip(quantities, properties, property_contexts):
+        for quantity, property, (context_w_quantity_enclosing, context_wo_enclosing, context_char_offset), text, semantic_boundaries_ in zip(quantities, properties, property_contexts, texts, semantic_boundaries):
                     
             # Fill in question template.
             if property is None or len(property["text"]) == 0:
                 # Adapt questions to quantity.
                 property_in_question, is_or_are = None, None
-                entity_question = self.questions["entity_question_fallback"].format(quantity_span=quantity["text"])
+                q_key = "entity_question_fallback"
+                slots = {"quantity_span": quantity["text"]}
             else:
                 # Adapt questions to property and quantity.
                 property_in_question = lower_first_letter_if_sent_start(property, text)
                 is_or_are = "are" if is_plural(property_in_question) else "is"
-                entity_question = self.questions["entity_question"].format(quantity_span=quantity["text"], property_span=property_in_question, is_or_are=is_or_are)            
+                q_key = "entity_question"
+                slots = {"quantity_span": quantity["text"], "property_span": property_in_question, "is_or_are": is_or_are}
+            
+            entity_question = self.questions[q_key].format(**slots)
+            prefix_token_count = self.prompt_templates[q_key].count_tokens(**slots)
             
             question_template_filling_information.append((property_in_question, is_or_are))
 
-            entity_input, context_w_quantity_and_property_enclosing, context_wo_enclosing, context_char_offset = self._get_entity_input(entity_question, quantity, property, context_wo_enclosing, context_w_quantity_enclosing, context_char_offset, semantic_boundaries)
+            entity_input, context_w_quantity_and_property_enclosing, context_wo_enclosing, context_char_offset = self._get_entity_input(entity_question, quantity, property, context_wo_enclosing, context_w_quantity_enclosing, context_char_offset, semantic_boundaries_, text=text, prefix_token_count=prefix_token_count)
             entity_inputs.append(entity_input)
             entity_contexts.append((context_w_quantity_and_property_enclosing, context_wo_enclosing, context_char_offset))
 
@@ -221,23 +332,27 @@ class MeasurementContextExtraction:
                     print(entity_inputs)
 
         # Do entity extraction.
-        entity_predictions = self.measurement_context_pipelines[device_rank](entity_inputs)
+        entity_predictions = self._apply_pipeline(self.measurement_context_pipelines[device_rank], entity_inputs)
                 
         # Post-process entity predictions.
         entities = []
-        for e_prediction, quantity, (_, context_wo_enclosing, context_char_offset) in zip(entity_predictions, quantities, entity_contexts):
+        for e_prediction, quantity, (_, context_wo_enclosing, context_char_offset), text, semantic_boundaries_ in zip(entity_predictions, quantities, entity_contexts, texts, semantic_boundaries):
             entities.append(self._postprocess_prediction(
-                e_prediction, quantity, context_wo_enclosing, context_char_offset, text, semantic_boundaries
+                e_prediction, quantity, context_wo_enclosing, context_char_offset, text, semantic_boundaries_
             ))
 
         return entities, entity_contexts, entity_inputs, question_template_filling_information
     
 
     def extract_qualifiers(self, quantities, properties, entities, entity_contexts, question_template_filling_information, text, semantic_boundaries, device_rank):
+        
+        # Get the text and semantic boundaries each quantity stems from.
+        texts, semantic_boundaries = get_document_per_quantity(quantities, text, semantic_boundaries)
+        
         qualifier_inputs = []
         qualifier_contexts = []
         skip_qualifier_extraction_indices = []
-        for i, (quantity, property, entity, (property_in_question, is_or_are), (context_w_quantity_and_property_enclosing, context_wo_enclosing, context_char_offset)) in enumerate(zip(quantities, properties, entities, question_template_filling_information, entity_contexts)):
+        for i, (quantity, property, entity, (property_in_question, is_or_are), (context_w_quantity_and_property_enclosing, context_wo_enclosing, context_char_offset), text, semantic_boundaries_) in enumerate(zip(quantities, properties, entities, question_template_filling_information, entity_contexts, texts, semantic_boundaries)):
             
             if entity is not None and len(entity["text"]) > 0:
                 # Adapt questions to entity.             
@@ -260,18 +375,23 @@ class MeasurementContextExtraction:
                 continue
             
             # Fill in question template.
-            qualifier_questions = {}
             if entity_or_property_in_question is not None:
                 # Use fallback question.
-                for q_key in self.qualifier_question_keys:
-                    qualifier_questions[q_key] = self.questions[q_key + "_fallback"].format(quantity_span=quantity["text"], entity_or_property_span=entity_or_property_in_question, is_or_are=is_or_are)
+                template_suffix = "_fallback"
+                slots = {"quantity_span": quantity["text"], "entity_or_property_span": entity_or_property_in_question, "is_or_are": is_or_are}
                 longest_qualifier_question_key = self.longest_qualifier_fallback_question_key
             else:                
-                for q_key in self.qualifier_question_keys:
-                    qualifier_questions[q_key] = self.questions[q_key].format(quantity_span=quantity["text"], property_span=property_in_question, entity_span=entity_in_question, is_or_are=is_or_are)
+                template_suffix = ""
+                slots = {"quantity_span": quantity["text"], "property_span": property_in_question, "entity_span": entity_in_question, "is_or_are": is_or_are}
                 longest_qualifier_question_key = self.longest_qualifier_question_key
 
-            qualifier_input, context_w_quantity_and_property_and_entity_enclosing, context_wo_enclosing, context_char_offset = self._get_qualifier_input(qualifier_questions, longest_qualifier_question_key, quantity, property, entity, context_wo_enclosing, context_w_quantity_and_property_enclosing, context_char_offset, semantic_boundaries)
+            qualifier_questions = {}
+            prefix_token_counts = {}
+            for q_key in self.qualifier_question_keys:
+                qualifier_questions[q_key] = self.questions[q_key + template_suffix].format(**slots)
+                prefix_token_counts[q_key] = self.prompt_templates[q_key + template_suffix].count_tokens(**slots)
+
+            qualifier_input, context_w_quantity_and_property_and_entity_enclosing, context_wo_enclosing, context_char_offset = self._get_qualifier_input(qualifier_questions, longest_qualifier_question_key, quantity, property, entity, context_wo_enclosing, context_w_quantity_and_property_enclosing, context_char_offset, semantic_boundaries_, text=text, prefix_token_counts=prefix_token_counts)
             qualifier_inputs.append(qualifier_input)
             qualifier_contexts.append((context_w_quantity_and_property_and_entity_enclosing, context_wo_enclosing, context_char_offset))
 
@@ -292,13 +412,12 @@ class MeasurementContextExtraction:
             # Approach 1: One process per question type.
             if self.verbose:
                 msg.info(f"Extracting qualifiers in parallel with {min(max_parallel_qualifier_workers, len(qualifier_inputs_per_key))} workers...")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_qualifier_workers) as executor_qlf:
-                qualifier_predictions = {}
-                for i, (q_key, qualifier_input_batch_per_key) in enumerate(qualifier_inputs_per_key.items()):
-                    qualifier_predictions[q_key] = executor_qlf.submit(self.qualifier_pipelines[device_rank][i % max_parallel_qualifier_workers], qualifier_input_batch_per_key)
-                
-                # Ensure all tasks are completed
-                concurrent.futures.wait(qualifier_predictions.values())
+            qualifier_predictions = {}
+            for q_key, qualifier_input_batch_per_key in qualifier_inputs_per_key.items():
+                qualifier_predictions[q_key] = self.qualifier_worker_pools[device_rank].submit(self._apply_qualifier_pipeline, qualifier_input_batch_per_key, device_rank=device_rank)
+            
+            # Ensure all tasks are completed
+            concurrent.futures.wait(qualifier_predictions.values())
         
             # Get results.
             qualifier_predictions = {q_key: q_pred.result() for q_key, q_pred in qualifier_predictions.items()}
@@ -310,28 +429,11 @@ class MeasurementContextExtraction:
             # Approach 2: One process per batch.
             flattened_qualifier_inputs = []
             [flattened_qualifier_inputs.extend(q_inputs.values()) for q_inputs in qualifier_inputs]
-            
+
             if self.verbose:
                 msg.info("Total number of qualifier inputs:", len(flattened_qualifier_inputs))
 
-            batched_flattened_qualifier_inputs = get_batches_of_roughly_equal_size(flattened_qualifier_inputs, self.qualifier_extraction_batch_size)
-            
-            if self.verbose:
-                msg.info(f"Extracting qualifiers in {len(batched_flattened_qualifier_inputs)} batches in parallel with {max_parallel_qualifier_workers} workers with batch size of {self.qualifier_extraction_batch_size}...")
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_qualifier_workers) as executor_qlf:
-                qualifier_predictions = []
-                for i, qlf_input_batch in enumerate(batched_flattened_qualifier_inputs):
-                    if self.verbose:
-                        msg.info("Submitting qualifier batch", i)
-                    qualifier_predictions.append(executor_qlf.submit(self.qualifier_pipelines[device_rank][i % max_parallel_qualifier_workers], qlf_input_batch))
-                
-                # Ensure all tasks are completed
-                concurrent.futures.wait(qualifier_predictions)
-        
-            # Get results and chain lists of qualifier predictions together.
-            qualifier_predictions = [q_pred.result() for q_pred in qualifier_predictions]
-            qualifier_predictions = list(itertools.chain(*qualifier_predictions))
+            qualifier_predictions = self._extract_qualifiers_in_parallel_batches(flattened_qualifier_inputs, device_rank)
 
             # Batch qualifier predictions per quantity.
             nbr_qualifier_questions = len(self.qualifier_question_keys)
@@ -346,13 +448,13 @@ class MeasurementContextExtraction:
 
         # Post-process qualifier predictions.
         qualifiers = []                
-        for q_predictions, quantity, (_, context_wo_enclosing, context_char_offset) in zip(qualifier_predictions_per_quantity, quantities, qualifier_contexts):
+        for q_predictions, quantity, (_, context_wo_enclosing, context_char_offset), text, semantic_boundaries_ in zip(qualifier_predictions_per_quantity, quantities, qualifier_contexts, texts, semantic_boundaries):
             qualifiers_per_quantity = {}
             # for q_key, q_prediction in q_predictions.items():
             for q_key, q_prediction in zip(self.qualifier_question_keys, q_predictions):            
                 # Post-process qualifier predictions.
                 qualifiers_per_quantity[q_key] = self._postprocess_prediction(
-                    q_prediction, quantity, context_wo_enclosing, context_char_offset, text, semantic_boundaries
+                    q_prediction, quantity, context_wo_enclosing, context_char_offset, text, semantic_boundaries_
                 )
 
             qualifiers.append(qualifiers_per_quantity)
@@ -360,13 +462,60 @@ class MeasurementContextExtraction:
         return qualifiers, qualifier_inputs
     
 
-    def _get_property_input(self, question, quantity, text, semantic_boundaries, add_distant_context=False):
+    def _extract_qualifiers_in_parallel_batches(self, qualifier_inputs, device_rank):
+        """Split the qualifier inputs into batches and distribute them over the qualifier pipelines of the given device rank."""
+
+        if self.sort_inputs_by_length:
+            # Sort inputs by token length so that each batch contains inputs of similar length.
+            qualifier_inputs, order = sort_by_length(qualifier_inputs, length=self.token_counter.count_words)
+
+        batched_qualifier_inputs = get_batches_of_roughly_equal_size(qualifier_inputs, self.qualifier_extraction_batch_size)
+        
+        if self.verbose:
+            msg.info(f"Extracting qualifiers in {len(batched_qualifier_inputs)} batches in parallel with {len(self.qualifier_pipelines[device_rank])} workers with batch size of {self.qualifier_extraction_batch_size}...")
+
+        qualifier_predictions = []
+        for i, qlf_input_batch in enumerate(batched_qualifier_inputs):
+            if self.verbose:
+                msg.info("Submitting qualifier batch", i)
+            qualifier_predictions.append(self.qualifier_worker_pools[device_rank].submit(self._apply_qualifier_pipeline, qlf_input_batch, device_rank=device_rank))
+        
+        # Ensure all tasks are completed
+        concurrent.futures.wait(qualifier_predictions)
+    
+        # Get results and chain lists of qualifier predictions together.
+        qualifier_predictions = [q_pred.result() for q_pred in qualifier_predictions]
+        qualifier_predictions = list(itertools.chain(*qualifier_predictions))
+
+        if self.sort_inputs_by_length:
+            # Restore the order of the inputs.
+            qualifier_predictions = restore_order(qualifier_predictions, order)
+
+        return qualifier_predictions
+
+
+    def _apply_pipeline(self, pipe, inputs):
+        """Apply a pipeline to a batch of inputs, sorted by token length to reduce padding if enabled."""
+        if self.sort_inputs_by_length:
+            return apply_pipe_sorted_by_length(pipe, inputs, length=self.token_counter.count_words, max_batch_tokens=self.max_batch_tokens)
+        else:
+            return pipe(inputs)
+        
+
+    def _apply_qualifier_pipeline(self, qualifier_inputs, device_rank, worker_rank):
+        """Apply one of the qualifier pipelines of the given device rank to a batch of inputs."""
+        return self.qualifier_pipelines[device_rank][worker_rank](qualifier_inputs)
+
+
+    def _get_property_input(self, question, quantity, text, semantic_boundaries, add_distant_context=False, prefix_token_count=None):
         """Get input for property extraction. Attempts to get largest and most meaningful 
-        chunk of context that still fits into the model.
+        chunk of context that still fits into the model. The token count of the prefix 
+        can be given if it is already known.
         """
         
         prefix = f"question: {question} context: "
-        prefix_token_count = self.token_counter(prefix)
+        if prefix_token_count is None:
+            prefix_token_count = self.token_counter(prefix)
 
         if add_distant_context:
             # Used for an experiment to see if distant context helps. Change to True to use it and adapt the text.
@@ -376,18 +525,17 @@ class MeasurementContextExtraction:
             distant_context = ""
             distant_context_token_count = 0
 
-        # Enclose quantity in special symbols.    
-        context, _ = enclose_with_special_symbol(
-            text,
-            (quantity["start"], quantity["end"]),
-            start_symbol=self.quantity_enclosing[0],
-            end_symbol=self.quantity_enclosing[1],        
-        )    
+        # Enclose quantity in special symbols and get the context centered around it.
         remaining_token_count = self.chunk_size-prefix_token_count - distant_context_token_count
-
-        # TODO: Cache get_single_centered_chunk for speedup.
-        centering_span = (quantity["start"], quantity["end"]+len(self.quantity_enclosing[0])+len(self.quantity_enclosing[1]))
-        (context_char_offset, _), context = semchunk.get_single_centered_chunk(context, centering_char_offsets=centering_span, chunk_size=remaining_token_count, token_counter=self.token_counter, semantic_boundaries=semantic_boundaries, offsets=True)
+        context_char_offset, context = get_centered_chunk_with_enclosed_span(
+            text, 
+            (quantity["start"], quantity["end"]), 
+            self.quantity_enclosing, 
+            remaining_token_count, 
+            self.token_counter, 
+            semantic_boundaries, 
+            window_first=self.window_first_marking
+        )
 
         llm_input = prefix + distant_context + context 
 
@@ -396,9 +544,11 @@ class MeasurementContextExtraction:
         return llm_input, context, context_wo_enclosing, context_char_offset
 
 
-    def _get_entity_input(self, entity_question, quantity, property, context_wo_enclosing, context_w_quantity_enclosing, context_char_offset, semantic_boundaries, add_distant_context=False):
+    def _get_entity_input(self, entity_question, quantity, property, context_wo_enclosing, context_w_quantity_enclosing, context_char_offset, semantic_boundaries, text=None, add_distant_context=False, prefix_token_count=None):
         """Get input for entity extraction. Attempts to get largest and most meaningful 
-        chunk of context that still fits into the model.
+        chunk of context that still fits into the model. The token count of the prefix 
+        can be given if it is already known. If the text the context stems from is given,
+        the tokens of the context are counted based on the token counts of its words.
         """                    
             
         if property is None or property["is_implicit"]:
@@ -433,7 +583,8 @@ class MeasurementContextExtraction:
             )
 
         prefix = f"question: {entity_question} context: "
-        prefix_token_count = self.token_counter(prefix)
+        if prefix_token_count is None:
+            prefix_token_count = self.token_counter(prefix)
 
         if add_distant_context:
             # Used for an experiment to see if distant context helps. Change to True to use it and adapt the text.
@@ -443,7 +594,13 @@ class MeasurementContextExtraction:
             distant_context = ""
             distant_context_token_count = 0
 
-        if prefix_token_count + distant_context_token_count + self.token_counter(context) <= self.chunk_size:
+        # Count the tokens of the context and its chunks based on the token counts of the words in the text.
+        enclosed_spans = [(quantity, self.quantity_enclosing)]
+        if property is not None and not property["is_implicit"]:
+            enclosed_spans.append((property, self.property_enclosing))
+        context_token_counter = self._get_context_token_counter(text, context, context_wo_enclosing, context_char_offset, enclosed_spans)
+
+        if prefix_token_count + distant_context_token_count + context_token_counter(context) <= self.chunk_size:
             # Skip. New input fits into the model. Do not chunk the context again.
             pass
         else:
@@ -451,9 +608,9 @@ class MeasurementContextExtraction:
             remaining_token_count = self.chunk_size-prefix_token_count-distant_context_token_count
 
             # Adapt semantic boundaries to the text character offset and the length of the context.            
-            semantic_boundaries_ = semchunk.adapt_semantic_boundaries(semantic_boundaries, context_char_offset, len(context), added_chars_len=total_symbol_len, added_chars_end_pos=centering_char_offsets[1])
+            semantic_boundaries_ = adapt_semantic_boundaries(semantic_boundaries, context_char_offset, len(context), added_chars_len=total_symbol_len, added_chars_end_pos=centering_char_offsets[1])
             
-            (new_context_char_offset, _), context = semchunk.get_single_centered_chunk(context, centering_char_offsets=centering_char_offsets, chunk_size=remaining_token_count, semantic_boundaries=semantic_boundaries_,token_counter=self.token_counter, offsets=True)
+            (new_context_char_offset, _), context = semchunk.get_single_centered_chunk(context, centering_char_offsets=centering_char_offsets, chunk_size=remaining_token_count, semantic_boundaries=semantic_boundaries_,token_counter=context_token_counter, offsets=True)
             context_char_offset += new_context_char_offset
             context_wo_enclosing = context_wo_enclosing[new_context_char_offset:new_context_char_offset+len(context)-total_symbol_len]
 
@@ -465,9 +622,11 @@ class MeasurementContextExtraction:
         return llm_input, context, context_wo_enclosing, context_char_offset
 
 
-    def _get_qualifier_input(self, qualifier_questions, longest_qualifier_question_key, quantity, property, entity, context_wo_enclosing, context_w_quantity_and_property_enclosing, context_char_offset, semantic_boundaries, add_distant_context=False, distant_context="This study investigates..."):
+    def _get_qualifier_input(self, qualifier_questions, longest_qualifier_question_key, quantity, property, entity, context_wo_enclosing, context_w_quantity_and_property_enclosing, context_char_offset, semantic_boundaries, text=None, add_distant_context=False, distant_context="This study investigates...", prefix_token_counts=None):
         """Get input for qualifier extraction. Attempts to get largest and most meaningful 
-        chunk of context that still fits into the model.
+        chunk of context that still fits into the model. The token counts of the prefixes 
+        per qualifier question can be given if they are already known. If the text the context 
+        stems from is given, the tokens of the context are counted based on the token counts of its words.
         """
         
         if entity is None or entity["is_implicit"]:
@@ -521,8 +680,9 @@ class MeasurementContextExtraction:
             )
     
         prefix = "question: {question} context: "
-        longest_prefix = prefix.format(question=qualifier_questions[longest_qualifier_question_key])
-        max_prefix_token_count = self.token_counter(longest_prefix)
+        if prefix_token_counts is None:
+            prefix_token_counts = {q_key: self.token_counter(prefix.format(question=question)) for q_key, question in qualifier_questions.items()}
+        max_prefix_token_count = prefix_token_counts[longest_qualifier_question_key]
 
         if add_distant_context:
             # Used for an experiment to see if distant context helps. Change to True to use it and adapt the text.
@@ -531,7 +691,15 @@ class MeasurementContextExtraction:
             distant_context = ""
             distant_context_token_count = 0
 
-        if max_prefix_token_count + distant_context_token_count + self.token_counter(context) <= self.chunk_size:
+        # Count the tokens of the context and its chunks based on the token counts of the words in the text.
+        enclosed_spans = [(quantity, self.quantity_enclosing)]
+        if property is not None and not property["is_implicit"]:
+            enclosed_spans.append((property, self.property_enclosing))
+        if entity is not None and not entity["is_implicit"]:
+            enclosed_spans.append((entity, self.entity_enclosing))
+        context_token_counter = self._get_context_token_counter(text, context, context_wo_enclosing, context_char_offset, enclosed_spans)
+
+        if max_prefix_token_count + distant_context_token_count + context_token_counter(context) <= self.chunk_size:
             # Skip. New input fits into the model. Do not chunk the context again.
             pass
         else:
@@ -539,22 +707,48 @@ class MeasurementContextExtraction:
             remaining_token_count = self.chunk_size-max_prefix_token_count-distant_context_token_count
 
             # Adapt semantic boundaries to the text character offset and the length of the context.
-            semantic_boundaries = semchunk.adapt_semantic_boundaries(semantic_boundaries, context_char_offset, len(context), added_chars_len=total_symbol_len, added_chars_end_pos=centering_char_offsets[1])
+            semantic_boundaries = adapt_semantic_boundaries(semantic_boundaries, context_char_offset, len(context), added_chars_len=total_symbol_len, added_chars_end_pos=centering_char_offsets[1])
             
-            (new_context_char_offset, _), context = semchunk.get_single_centered_chunk(context, centering_char_offsets=centering_char_offsets, chunk_size=remaining_token_count, semantic_boundaries=semantic_boundaries,token_counter=self.token_counter, offsets=True)
+            (new_context_char_offset, _), context = semchunk.get_single_centered_chunk(context, centering_char_offsets=centering_char_offsets, chunk_size=remaining_token_count, semantic_boundaries=semantic_boundaries,token_counter=context_token_counter, offsets=True)
             context_char_offset += new_context_char_offset
             context_wo_enclosing = context_wo_enclosing[new_context_char_offset:new_context_char_offset+len(context)-total_symbol_len]
         
+        # The prefix and the distant context end with whitespace, hence, their token counts can be added up (exact if counts are additive over words).
+        context_token_count = distant_context_token_count + context_token_counter(context)
         llm_inputs = {}
         for q_key, question in qualifier_questions.items():
             llm_input = prefix.format(question=question) + distant_context + context            
             llm_inputs[q_key] = llm_input
-            if self.token_counter(llm_input) > self.chunk_size:
+            if prefix_token_counts[q_key] + context_token_count > self.chunk_size:
                 print("Warning: The input for the entity extraction is too long.")
         
         return llm_inputs, context, context_wo_enclosing, context_char_offset
 
 
+    def _get_context_token_counter(self, text, context, context_wo_enclosing, context_char_offset, enclosed_spans):
+        """
+        Get a token counter for a context with enclosed spans and its chunks, which counts their tokens
+        from the prefix sums of the token counts of the words in the text (see TokenCounter.for_text()).
+        Falls back to the token counter of the model if the text is not given or the context cannot be 
+        reconstructed from the text and the enclosings of the spans.
+        """
+        if text is None:
+            return self.token_counter
+        
+        span = (context_char_offset, context_char_offset + len(context_wo_enclosing))
+        insertions = []
+        for annotation, enclosing in enclosed_spans:
+            if not span[0] <= annotation["start"] <= annotation["end"] <= span[1]:
+                return self.token_counter
+            insertions.extend([(annotation["start"], enclosing[0]), (annotation["end"], enclosing[1])])
+        
+        context_token_counter = self.token_counter.for_text(text, span=span, insertions=insertions)
+        if getattr(context_token_counter, "text", None) != context:
+            return self.token_counter
+        
+        return context_token_counter
+
+
     def _pack_predictions_into_output_format(self, quantities, properties, entities, qualifiers, property_inputs, entity_inputs, qualifier_inputs, add_curation_fields=False, return_llm_inputs=False):
         """
         Pack model predictions into the output format of quantitative statements.
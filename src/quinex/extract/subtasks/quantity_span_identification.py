@@ -1,4 +1,5 @@
 import re
+import threading
 from time import time
 from spacy import Language
 
@@ -9,11 +10,18 @@ from quinex_utils.functions.boolean_checks import contains_any_number, is_relati
 from quinex_utils.functions.extract_quantity_modifiers import GazetteerBasedQuantityModifierExtractor
 
 from quinex import msg
-from quinex.extract.utils.transformers import load_transformers_pipe, get_text_chunking_helper
+from quinex.extract.utils.transformers import load_transformers_pipe, get_text_chunking_helper, MaxTokenCounter
+from quinex.extract.utils.caching import CachedQuantityParser
+from quinex.extract.utils.cascade import CascadePipe, get_token_classification_confidence, get_cascade_stats
+from quinex.extract.utils.regions import is_within_regions
 
 
 
 
+DIGIT_REGEX = re.compile(r"\d")
+LETTER_WORD_REGEX = re.compile(r"[^\W\d_]+")
+# First words of known constants (e.g., "speed" of "speed of light").
+CONSTANT_FIRST_WORDS = {constant.split()[0] for constant in PHYSICAL_CONSTANTS_LOWERED if len(constant.split()) > 0}
 blacklisted_special_chars = [".", ",", ";", ":", "-", "_" "!", "?", "&", "(", "{", "[", "]", "}", ")", "'", '"', "=", "+", "*", "/", "\\", "|", "<", ">", "^", "#", "@", "~", "`"]
 ONLY_SPECIAL_CHARS = re.compile(r"^[" + re.escape("".join(blacklisted_special_chars)) + r"]*$")
 
@@ -83,6 +91,30 @@ def filter_quantity_spans(quantity_spans):
     return quantity_spans
 
 
+def may_contain_quantity(text: str) -> bool:
+    """
+    Check if a text may contain a quantity, that is, if it contains any of the following:
+     - a digit or other numeric char (e.g., "½" or "²")
+     - a number word or imprecise quantity
+     - a word of a known constant
+    
+    Used to skip chunks without any quantity cue instead of passing them to the model.
+    """
+    if DIGIT_REGEX.search(text) or any(char.isnumeric() for char in text):
+        return True
+    
+    # Search the whole text, as imprecise quantities may consist of multiple words (e.g., "a large number of").
+    text = text.lower()
+    if CONTAINS_NUMBER_WORD_OR_IMPRECISE_QUANTITY_REGEX.search(text):
+        return True
+
+    for word in set(LETTER_WORD_REGEX.findall(text)):
+        if word in PHYSICAL_CONSTANTS_LOWERED or word in CONSTANT_FIRST_WORDS:
+            return True
+    
+    return False
+
+
 def filter_garbage_quantity_spans(quantity_spans):
     """
     Remove quantity spans that only consists of certain special symbols, whitespace or are empty.
@@ -202,6 +234,10 @@ class QuantitySpanIdentification:
         devices (list): List of devices to use for processing (e.g., ["cpu"], ["cuda:0", "cuda:1"]).
         batch_size (int): Batch size for processing.
         dtype (str): Data type for model weights. E.g., "auto", "float16", "float32".
+        inference_backend (str): "pipeline" to use transformers pipelines, "torch" to use the lean inference engines with identical outputs, or "onnx"/"onnx-int8" to use ONNX Runtime (optionally with int8 weights).
+        parse_cache_size (int): Maximum number of quantity surfaces whose parse results are cached. Set to 0 to disable caching.
+        cascade_model_name_or_path (str): If given, this smaller model is applied first (its tokenizer may differ, as both models predict the spans of the same chunk, which is sized for both) and only chunks with a token whose predicted tag has a probability below `cascade_threshold` are processed again with the model.
+        cascade_threshold (float): Minimum probability of the predicted tag of all tokens of a chunk (including tokens outside of quantity spans) to keep the predictions of the smaller model.
         verbose (bool): If True, print verbose messages.
         debug (bool): If True, perform additional checks for debugging.
     """
@@ -213,6 +249,10 @@ class QuantitySpanIdentification:
             devices: list=["cpu"],
             batch_size: int=8,
             dtype: str="auto",
+            inference_backend: str="pipeline",
+            parse_cache_size: int=100_000,
+            cascade_model_name_or_path: str=None,
+            cascade_threshold: float=0.9,
             verbose: bool=False,
             debug: bool=False
         ):
@@ -221,11 +261,31 @@ class QuantitySpanIdentification:
         self.debug = debug
         self.token_counter, self.chunk_size = get_text_chunking_helper(model_name_or_path, task="token-classification")
 
-        # Load quantity parser.
+        # Load quantity parser and cache its results as quantity surfaces repeat heavily.
         self.quantity_parser = FastSymbolicQuantityParser(verbose=verbose)
+        if parse_cache_size:
+            self.quantity_parser = CachedQuantityParser(self.quantity_parser, max_size=parse_cache_size)
 
         # Load parallel quantity span identification pipelines.
-        self.quantity_pipelines = [load_transformers_pipe("token-classification", model_name_or_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose) for device in devices]
+        self.quantity_pipelines = [load_transformers_pipe("token-classification", model_name_or_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, backend=inference_backend) for device in devices]
+
+        # Apply a smaller model first and only the model to chunks the smaller one is unsure about.
+        if cascade_model_name_or_path is not None:
+            # Chunks are passed unchanged to both models, hence, they must fit into either of them.
+            cascade_token_counter, cascade_chunk_size = get_text_chunking_helper(cascade_model_name_or_path, task="token-classification")
+            self.chunk_size = min(self.chunk_size, cascade_chunk_size)
+            if cascade_token_counter.tokenizer.get_vocab() != self.token_counter.tokenizer.get_vocab():
+                self.token_counter = MaxTokenCounter([self.token_counter, cascade_token_counter])
+
+            self.quantity_pipelines = [
+                CascadePipe(
+                    # The lean inference engine also returns the tag probabilities of all tokens.
+                    load_transformers_pipe("token-classification", cascade_model_name_or_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, backend="torch", return_scores=True),
+                    pipe, 
+                    cascade_threshold, 
+                    get_token_classification_confidence
+                ) for device, pipe in zip(devices, self.quantity_pipelines)
+            ]
         
         # Load spaCy NLP pipeline.
         if spacy_pipeline is None:
@@ -242,8 +302,42 @@ class QuantitySpanIdentification:
         # Load quantity modifier extractor.
         self.qmod_extractor = GazetteerBasedQuantityModifierExtractor()
 
+        # Statistics of the chunk prefilter.
+        self.nbr_prefiltered_chunks = 0
+        self.nbr_skipped_chunks = 0
+        self._prefilter_stats_lock = threading.Lock()
 
-    def __call__(self, batch, device_rank, doc, skip_imprecise_quantities=False, filter=False, soft_filter=True, post_process=True, add_curation_fields=False):
+
+    def get_cascade_stats(self) -> dict:
+        """Get the number of chunks and the number of chunks escalated to the larger model if a cascade is used."""
+        return get_cascade_stats(self.quantity_pipelines)
+
+
+    def prefilter_chunks(self, chunks: list[tuple], report: bool=True) -> list[tuple]:
+        """
+        Remove chunks that cannot contain any quantity, because they do not contain any digit, 
+        number word, imprecise quantity, or constant (see may_contain_quantity()).
+
+        Args:
+            chunks (list): List of tuples (char_offset, text_chunk) as returned by semchunk.
+            report (bool): Whether to print how many chunks were skipped.
+
+        Returns:
+            list: The chunks that may contain quantities.
+        """
+        kept_chunks = [chunk for chunk in chunks if may_contain_quantity(chunk[1])]
+        nbr_skipped = len(chunks) - len(kept_chunks)
+        with self._prefilter_stats_lock:
+            self.nbr_prefiltered_chunks += len(chunks)
+            self.nbr_skipped_chunks += nbr_skipped
+
+        if report and nbr_skipped > 0:
+            msg.text(f"Skipped {nbr_skipped} of {len(chunks)} chunks without any digit, number word, or constant.", color="grey")
+
+        return kept_chunks
+
+
+    def __call__(self, batch, device_rank, doc, skip_imprecise_quantities=False, filter=False, soft_filter=True, post_process=True, add_curation_fields=False, group_by_chunk=False, normalize=True, allowed_regions=None):
         """
         Identify all quantities in a given chunk of text and normalize them.
 
@@ -252,18 +346,30 @@ class QuantitySpanIdentification:
                           start and end char as int (begin, end) indicating the position of the chunk
                           in the original text and text_chunk is the text of the chunk as str.
             device_rank (int): The rank of the device to use for processing.
-            doc (spacy.Doc): The spaCy document object of the original text.
+            doc (spacy.Doc or list): The spaCy document object of the original text. If the chunks
+                          stem from different texts, a list with one spaCy document per chunk.
             skip_imprecise_quantities (bool): If True, imprecise quantities are skipped.
             filter (bool): If True, only quantities with numbers are returned.
             soft_filter (bool): If True, quantity spans that only consist of special characters or whitespace are removed.            
             post_process (bool): If True, trailing commas and whitespaces are removed and adjecent and overlapping quantity spans are merged.
             add_curation_fields (bool): If True, additional fields for later manual curation are added to the output.
+            group_by_chunk (bool): If True, return one list of quantity spans per chunk instead of a flat list.
+            normalize (bool): If False, quantity modifiers are not added and quantities are not normalized, for example, to do 
+                          so once for all quantities of the document with normalize_quantities_of_document(). Imprecise 
+                          quantities can then only be skipped in that step.
+            allowed_regions (list, optional): Normalized (start, end) char spans of the original text (see get_allowed_regions()). 
+                          If given, quantities that are not completely within one of them are removed.
 
         Returns:
             list: List of identified and normalized quantity spans with their char offsets in the original text.
         """
         tic = time()
 
+        # Get the spaCy document each chunk belongs to.
+        docs = doc if isinstance(doc, list) else [doc] * len(batch)
+        if len(docs) != len(batch):
+            raise ValueError("If a list of spaCy documents is given, it must contain one document per chunk.")
+
         # Remove whitespaces. Only trailing ones to not affect char offsets.
         chunks = [chunk.rstrip() for _, chunk in batch]
 
@@ -274,7 +380,7 @@ class QuantitySpanIdentification:
         quantity_spans_per_chunk = self._identify_quantity_spans(chunks, device_rank)
 
         pp_quantity_spans_per_chunk = []
-        for quantity_spans, ((char_offset, _), chunk) in zip(quantity_spans_per_chunk, batch):
+        for quantity_spans, ((char_offset, _), chunk), chunk_doc in zip(quantity_spans_per_chunk, batch, docs):
 
             if pre_filter_imprecise_quantities:=False:                     
                 # Pre-filter imprecise quantities before using the quantity parser result for actual filtering.
@@ -302,42 +408,113 @@ class QuantitySpanIdentification:
             if len(quantity_spans) > 0:  
                 quantity_spans = add_char_offset(quantity_spans, char_offset)                                 
 
+            if allowed_regions is not None:
+                # Remove quantities outside the regions to extract from (e.g., in reference lists).
+                quantity_spans = [q for q in quantity_spans if is_within_regions(q["start"], q["end"], allowed_regions)]
+
+            if not normalize:
+                # Remember the chunk to normalize the quantities with the same text later on.
+                for q in quantity_spans:
+                    q["chunk_char_offsets"] = char_offset
+
+            if len(quantity_spans) > 0 and normalize:
+
                 # -------------------------
                 #  Add quantity modifiers
                 # -------------------------
                 # TODO: Use already created doc and not create doc from text again. Therefore, add 
                 #       tokenizer changes of qmod_extractor spaCy pipeline to quinex main spaCy pipeline.
-                qmods, quantity_spans = self.qmod_extractor(doc.text, quantity_spans)
+                qmods, quantity_spans = self.qmod_extractor(chunk_doc.text, quantity_spans)
 
                 # -------------------------
                 #    Normalize quantity
                 # -------------------------
                 quantity_spans = self._parse_and_normalize_quantity_spans(quantity_spans, chunk, add_curation_fields=add_curation_fields)
 
-            pp_quantity_spans_per_chunk.extend(quantity_spans)
+            pp_quantity_spans_per_chunk.append(quantity_spans)
 
         if self.verbose:
             msg.good("Quantity span identification done in", round(time()-tic, 3), "s.")
 
+        # Optinally, skip imprecise quantities such as 'several trees'.
+        if skip_imprecise_quantities and normalize:
+            quantities_per_chunk = self._skip_imprecise_quantities(pp_quantity_spans_per_chunk)
+        else:
+            quantities_per_chunk = pp_quantity_spans_per_chunk
+
+        if group_by_chunk:
+            return quantities_per_chunk
+        else:
+            return [q for quantities in quantities_per_chunk for q in quantities]
+    
+
+    def normalize_quantities_of_document(self, quantity_spans, doc, skip_imprecise_quantities=False, add_curation_fields=False, summarized_output=True):
+        """
+        Add quantity modifiers to the quantity spans found in all chunks of a document and normalize them.
+
+        In contrast to doing so for each chunk, the quantity modifiers are extracted in a single pass over the 
+        document instead of processing the text of the document again for each chunk. The quantities are 
+        normalized with the text of the chunk they were found in, as when normalizing them per chunk.
+
+        Args:
+            quantity_spans (list): Quantity spans identified with normalize=False with char offsets relative to the document
+                                   and the char offsets of the chunk they were found in as "chunk_char_offsets".
+            doc (spacy.Doc): The spaCy document object of the original text (e.g., created by Quinex.preprocess()).
+            skip_imprecise_quantities (bool): If True, imprecise quantities are skipped.
+            add_curation_fields (bool): If True, additional fields for later manual curation are added to the output.
+            summarized_output (bool): If True, the normalized quantity structure is simplified.
+
+        Returns:
+            list: List of normalized quantity spans.
+        """
+        if len(quantity_spans) == 0:
+            return []
+
+        # Get the chunk each quantity was found in.
+        chunk_per_quantity_start = {}
+        for q in quantity_spans:
+            char_offset = q.pop("chunk_char_offsets", None)
+            chunk_per_quantity_start[q["start"]] = char_offset
+
+        # Add quantity modifiers.
+        _, quantity_spans = self.qmod_extractor(doc.text, quantity_spans)
+        
+        # Normalize quantities with the text of their chunks (without trailing whitespace as in __call__).
+        normalized_quantity_spans = []
+        for q in quantity_spans:
+            char_offset = chunk_per_quantity_start.get(q["start"])
+            chunk = doc.text[char_offset[0]:char_offset[1]].rstrip() if char_offset is not None else doc.text
+            normalized_quantity_spans.extend(self._parse_and_normalize_quantity_spans([q], chunk, add_curation_fields=add_curation_fields, summarized_output=summarized_output))
+        quantity_spans = normalized_quantity_spans
+
         # Optinally, skip imprecise quantities such as 'several trees'.
         if skip_imprecise_quantities:
+            quantity_spans = self._skip_imprecise_quantities([quantity_spans])[0]
+
+        return quantity_spans
+
+
+    def _skip_imprecise_quantities(self, quantities_per_chunk):
+        """
+        Remove imprecise quantities such as 'several trees' from the normalized quantities of each chunk.
+        """
+        precise_quantities_per_chunk = []
+        imprecise_quantities_surfaces = []
+        for quantity_spans in quantities_per_chunk:
             quantities = []
-            imprecise_quantities_surfaces = []
-            for q in pp_quantity_spans_per_chunk:
+            for q in quantity_spans:
                 if all(ind_q["value"]["normalized"]["is_imprecise"] for ind_q in q["normalized"]["individual_quantities"]["normalized"]):
                     imprecise_quantities_surfaces.append(q["text"])                    
                     continue
                 else:
                     quantities.append(q)
+            precise_quantities_per_chunk.append(quantities)
 
-            if len(imprecise_quantities_surfaces) > 0:
-                msg.text("Ignoring the following imprecise quantitities (set skip_imprecise_quantities=False to disable): " + str(imprecise_quantities_surfaces), color="grey")
-                
-        else:
-            quantities = pp_quantity_spans_per_chunk
+        if len(imprecise_quantities_surfaces) > 0:
+            msg.text("Ignoring the following imprecise quantitities (set skip_imprecise_quantities=False to disable): " + str(imprecise_quantities_surfaces), color="grey")
+
+        return precise_quantities_per_chunk
 
-        return quantities
-    
 
     def _parse_and_normalize_quantity_spans(self, quantity_spans, chunk, add_curation_fields=False, summarized_output=True):
         """
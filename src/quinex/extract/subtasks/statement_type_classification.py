@@ -1,7 +1,6 @@
-import semchunk
 from time import time
-from text_processing_utils.highlight_context import enclose_with_special_symbol
 from quinex.extract.utils.transformers import load_transformers_pipe, get_text_chunking_helper
+from quinex.extract.utils.documents import get_document_per_quantity, get_centered_chunk_with_enclosed_span
 from quinex import msg
 
 
@@ -37,15 +36,16 @@ class StatementTypeClassification:
      
     """
     
-    def __init__(self, model_path, clf_quantity_enclosing=("🍏", "🍏"), devices=["cpu"], batch_size=8, dtype="auto", verbose=False, debug=False): 
+    def __init__(self, model_path, clf_quantity_enclosing=("🍏", "🍏"), devices=["cpu"], batch_size=8, dtype="auto", inference_backend="pipeline", window_first_marking=True, verbose=False, debug=False): 
             
         self.verbose = verbose
         self.debug = debug
+        self.window_first_marking = window_first_marking
         self.token_counter, self.chunk_size = get_text_chunking_helper(model_path, task="text-classification")
         self.clf_quantity_enclosing = clf_quantity_enclosing
 
         # Load parallel statement classification pipelines.
-        self.statement_clf_pipelines = [load_transformers_pipe("text-classification", model_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose) for device in devices]
+        self.statement_clf_pipelines = [load_transformers_pipe("text-classification", model_path, device, batch_size=batch_size, dtype=dtype, verbose=verbose, backend=inference_backend) for device in devices]
 
 
     def __call__(self, quantity_batch, device_rank, text, semantic_boundaries, add_curation_fields=False):       
@@ -54,30 +54,33 @@ class StatementTypeClassification:
 
             quantities = quantity_batch
 
+            # Get the text and semantic boundaries each quantity stems from. 
+            texts, semantic_boundaries = get_document_per_quantity(quantities, text, semantic_boundaries)
+
             # ====================================
             #   Perform statement classification
             # ====================================
             statement_clf_inputs = []
-            for quantity in quantities:            
+            for quantity, text, semantic_boundaries_ in zip(quantities, texts, semantic_boundaries):            
                 
+                # Take chunk size smaller than the maximum model input size as the training examples were fairly small.
+                chunk_size = 200 # TODO: Change chunk size with new training data.
+
                 try:    
                     quantity_offset = (quantity["start"], quantity["end"])
-                    statement_clf_context, _ = enclose_with_special_symbol(
+                    _, statement_clf_context = get_centered_chunk_with_enclosed_span(
                         text,
                         quantity_offset,
-                        start_symbol=self.clf_quantity_enclosing[0],
-                        end_symbol=self.clf_quantity_enclosing[1],        
+                        self.clf_quantity_enclosing,
+                        chunk_size,
+                        self.token_counter,
+                        semantic_boundaries_,
+                        window_first=self.window_first_marking
                     )
 
                 except Exception as e:
                     print("Quantity that caused error:", quantity)
                     raise print(f"Error in statement classification: {e}")
-                                
-                # Take chunk size smaller than the maximum model input size as the training examples were fairly small.
-                chunk_size = 200 # TODO: Change chunk size with new training data.
-                
-                centering_span = (quantity_offset[0], quantity_offset[1]+len(self.clf_quantity_enclosing[0])+len(self.clf_quantity_enclosing[1]))                
-                statement_clf_context = semchunk.get_single_centered_chunk(statement_clf_context, centering_char_offsets=centering_span, chunk_size=chunk_size, token_counter=self.token_counter, semantic_boundaries=semantic_boundaries, offsets=False)
 
                 statement_clf_inputs.append(statement_clf_context)
 
@@ -0,0 +1,83 @@
+def sort_by_length(inputs: list, length=len) -> tuple[list, list[int]]:
+    """
+    Sort inputs by length so that inputs of similar length end up in the same batch
+    and less padding is needed.
+
+    Args:
+        inputs (list): Model inputs.
+        length (callable): Function returning the length of an input (e.g., its token count).
+
+    Returns:
+        tuple: Sorted inputs and the original index of each sorted input (see `restore_order`).
+    """
+    order = sorted(range(len(inputs)), key=lambda i: length(inputs[i]))
+    return [inputs[i] for i in order], order
+
+
+def restore_order(items: list, order: list[int]) -> list:
+    """Restore the original order of items that were sorted with `sort_by_length`."""
+    restored = [None] * len(items)
+    for item, i in zip(items, order):
+        restored[i] = item
+    return restored
+
+
+def get_token_budget_batches(inputs: list, max_batch_tokens: int, max_batch_size: int, length=len) -> list[list]:
+    """
+    Split inputs into consecutive batches such that the padded size of each batch,
+    that is, the number of inputs times the length of the longest input, does not
+    exceed the token budget. Inputs should be sorted by length beforehand.
+
+    Args:
+        inputs (list): Model inputs.
+        max_batch_tokens (int): Maximum number of (padded) tokens per batch.
+        max_batch_size (int): Maximum number of inputs per batch.
+        length (callable): Function returning the length of an input (e.g., its token count).
+
+    Returns:
+        list: Batches of inputs. Each batch contains at least one input.
+    """
+    batches = []
+    batch = []
+    max_length = 0
+    for input in inputs:
+        input_length = length(input)
+        new_max_length = max(max_length, input_length)
+        if len(batch) > 0 and (len(batch) >= max_batch_size or (len(batch) + 1) * new_max_length > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+            new_max_length = input_length
+        batch.append(input)
+        max_length = new_max_length
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+def apply_pipe_sorted_by_length(pipe, inputs: list, length=len, max_batch_tokens: int=None) -> list:
+    """
+    Apply a transformers pipeline to inputs sorted by length and return
+    the predictions in the original order of the inputs.
+
+    Args:
+        pipe: Transformers pipeline.
+        inputs (list): Model inputs.
+        length (callable): Function returning the length of an input (e.g., its token count).
+        max_batch_tokens (int, optional): If given, the inputs are split into batches under
+                        this token budget instead of batches with the batch size of the pipeline.
+
+    Returns:
+        list: Predictions in the original order of the inputs.
+    """
+    sorted_inputs, order = sort_by_length(inputs, length)
+
+    if max_batch_tokens is None:
+        predictions = pipe(sorted_inputs)
+    else:
+        predictions = []
+        for batch in get_token_budget_batches(sorted_inputs, max_batch_tokens, pipe._batch_size or 1, length):
+            predictions.extend(pipe(batch, batch_size=len(batch)))
+
+    return restore_order(predictions, order)
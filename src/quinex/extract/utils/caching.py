@@ -0,0 +1,117 @@
+import copy
+import threading
+from collections import OrderedDict
+from importlib.metadata import version, PackageNotFoundError
+
+
+class LRUCache:
+    """
+    Thread-safe cache that evicts the least recently used entries if it is full.
+
+    Args:
+        max_size (int): Maximum number of entries.
+    """
+
+    def __init__(self, max_size: int=10_000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key, default=None):
+        """Get the cached value for the key or the default if the key is not cached."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            else:
+                self.misses += 1
+                return default
+
+
+    def put(self, key, value):
+        """Cache the value for the key."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups that were answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedQuantityParser:
+    """
+    Quantity parser that caches the parse results of quantity surfaces, which repeat heavily 
+    in a corpus (e.g., "10 %", "2020", or "several"). Results are cached per surface and 
+    parser version. Copies of the cached results are returned, so that they can be modified.
+    Other attributes are passed through to the wrapped parser.
+
+    Args:
+        quantity_parser (FastSymbolicQuantityParser, optional): Parser to wrap. Defaults to a new FastSymbolicQuantityParser.
+        max_size (int): Maximum number of cached surfaces.
+        verbose (bool): If True, print verbose messages of a new parser.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, quantity_parser=None, max_size: int=100_000, verbose: bool=False):
+        if quantity_parser is None:
+            from quinex_utils.parsers.quantity_parser import FastSymbolicQuantityParser
+            quantity_parser = FastSymbolicQuantityParser(verbose=verbose)
+
+        self.quantity_parser = quantity_parser
+        self.cache = LRUCache(max_size)
+        try:
+            self.parser_version = version("quinex-utils")
+        except PackageNotFoundError:
+            self.parser_version = None
+
+
+    def parse(self, text: str, *args, **kwargs) -> dict:
+        """Parse the quantity surface or get a copy of the cached result. Calls with further arguments are not cached."""
+        if len(args) > 0 or len(kwargs) > 0:
+            return self.quantity_parser.parse(text, *args, **kwargs)
+
+        key = (text, self.parser_version)
+        result = self.cache.get(key, self._MISSING)
+        if result is self._MISSING:
+            result = self.quantity_parser.parse(text)
+            self.cache.put(key, result)
+
+        return copy.deepcopy(result)
+
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of surfaces whose parse result was taken from the cache."""
+        return self.cache.hit_rate
+
+
+    def get_stats(self) -> dict:
+        """Get the cache statistics."""
+        return {"hits": self.cache.hits, "misses": self.cache.misses, "hit_rate": self.hit_rate, "size": len(self.cache)}
+
+
+    def __getattr__(self, name):
+        return getattr(self.quantity_parser, name)
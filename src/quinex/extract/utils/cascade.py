@@ -0,0 +1,79 @@
+"""
+Model cascades: a smaller model is applied first and only the inputs whose prediction it
+is not confident about are passed on to a larger model (escalated).
+"""
+import threading
+
+
+
+def get_token_classification_confidence(prediction: list[dict]) -> float:
+    """
+    Confidence of a token classification prediction, i.e., the lowest probability of the predicted label of
+    any token including the "O" tag (requires the "torch" backend with `return_scores`, see Entities). Unlike 
+    the scores of the predicted entities, this also reflects tokens that may belong to a missed entity.
+    """
+    return prediction.score
+
+
+def get_generation_confidence(prediction: dict) -> float:
+    """Confidence of a text generation prediction, i.e., the length-normalized probability of the generated text."""
+    return prediction["score"]
+
+
+class CascadePipe:
+    """
+    Applies a pipeline and re-applies a larger pipeline to the inputs whose predictions
+    have a confidence below the threshold. Can be used like the pipeline.
+
+    Args:
+        pipe: Pipeline of the smaller model.
+        escalation_pipe: Pipeline of the larger model.
+        threshold (float): Inputs with a confidence below this threshold are escalated.
+        get_confidence (callable): Function that returns the confidence of a prediction of the smaller model.
+    """
+
+    def __init__(self, pipe, escalation_pipe, threshold: float, get_confidence):
+        self.pipe = pipe
+        self.escalation_pipe = escalation_pipe
+        self.threshold = threshold
+        self.get_confidence = get_confidence
+        self.nbr_inputs = 0
+        self.nbr_escalated_inputs = 0
+        self._stats_lock = threading.Lock()
+
+
+    def __call__(self, inputs: list, **kwargs) -> list:
+        predictions = list(self.pipe(inputs, **kwargs))
+
+        # Re-apply the larger model to the inputs the smaller one is unsure about.
+        escalated_indices = [i for i, prediction in enumerate(predictions) if self.get_confidence(prediction) < self.threshold]
+        if len(escalated_indices) > 0:
+            escalated_predictions = self.escalation_pipe([inputs[i] for i in escalated_indices], **kwargs)
+            for i, prediction in zip(escalated_indices, escalated_predictions):
+                predictions[i] = prediction
+
+        with self._stats_lock:
+            self.nbr_inputs += len(inputs)
+            self.nbr_escalated_inputs += len(escalated_indices)
+
+        return predictions
+
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+
+def get_cascade_stats(pipes: list) -> dict:
+    """
+    Get the number of inputs and escalated inputs of the cascades among the given
+    pipelines. Pipelines that occur multiple times are only counted once.
+    """
+    cascades = {id(pipe): pipe for pipe in pipes if isinstance(pipe, CascadePipe)}.values()
+    nbr_inputs = sum(cascade.nbr_inputs for cascade in cascades)
+    nbr_escalated_inputs = sum(cascade.nbr_escalated_inputs for cascade in cascades)
+
+    return {
+        "inputs": nbr_inputs,
+        "escalated_inputs": nbr_escalated_inputs,
+        "escalation_rate": nbr_escalated_inputs / nbr_inputs if nbr_inputs > 0 else 0.0,
+    }
@@ -0,0 +1,176 @@
+"""
+Constrained decoding for extractive answers. At each generation step, the decoder may only
+generate tokens that continue a span of the context given in the input (or of a few allowed
+answers) and the EOS token. The tokens that continue a span are looked up in a trie of the 
+surfaces of all tokens. Hence, generation stops as soon as the answer cannot be extended
+to a longer span of the context, and answers are always copied from the input.
+"""
+import re
+import unicodedata
+from quinex.extract.utils.caching import LRUCache
+
+
+
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+# Separates the context and the allowed answers in the text answers are copied from.
+SEGMENT_SEPARATOR = "\x00"
+
+# Properties that are often not mentioned in the context, as they are implied by the unit of the quantity.
+IMPLICIT_ANSWERS = [
+    "temperature", "pressure", "mass", "weight", "length", "distance", "area", "volume", "time", "duration", 
+    "speed", "velocity", "power", "energy", "voltage", "current", "frequency", "density", "concentration", 
+    "efficiency", "share", "cost", "price", "number", "amount", "capacity", "age",
+]
+
+
+def normalize_for_matching(text: str) -> str:
+    """Normalize a text like the T5 tokenizer does (NFKC, whitespace runs become a single space)."""
+    return WHITESPACE_REGEX.sub(" ", unicodedata.normalize("NFKC", text))
+
+
+def get_context(model_input: str) -> str:
+    """Get the context of a model input of the form "question: ... context: ..."."""
+    _, separator, context = model_input.partition(" context: ")
+    return context if separator else model_input
+
+
+def get_question(model_input: str) -> str:
+    """Get the question of a model input of the form "question: ... context: ..."."""
+    question, separator, _ = model_input.partition(" context: ")
+    return question.removeprefix("question: ") if separator else ""
+
+
+class ContextSpanConstraint:
+    """
+    Restricts the tokens a T5 decoder may generate to continuations of spans of the context
+    of each input. Use `get_prefix_allowed_tokens_fn()` to get the function passed to
+    `model.generate()` as `prefix_allowed_tokens_fn` for a batch of inputs. Requires greedy
+    decoding or sampling (not beam search), as the batch index must refer to the input.
+
+    The first token of an answer may start anywhere in the context and its first letter may
+    have a different case (as when locating answers with `locate_span_in_context()`).
+
+    Args:
+        tokenizer: Tokenizer of the model (SentencePiece).
+        allowed_answers (list, optional): Answers that may be generated even if they are not in the
+                        context (e.g., implicit answers).
+        allowed_answers_question_prefix (str, optional): If given, the allowed answers may only be generated 
+                        for questions starting with this prefix (e.g., the property question).
+        cache_size (int): Number of contexts whose allowed first tokens are cached.
+    """
+
+    def __init__(self, tokenizer, allowed_answers: list[str]=None, allowed_answers_question_prefix: str=None, cache_size: int=1024):
+        self.eos_token_id = tokenizer.eos_token_id
+        self.allowed_answers = [normalize_for_matching(answer) for answer in allowed_answers or []]
+        self.allowed_answers_question_prefix = allowed_answers_question_prefix
+
+        # Map the surface of each token to its ids (the SentencePiece word boundary marker becomes a space).
+        special_ids = set(tokenizer.all_special_ids)
+        self.token_surfaces = {}
+        self.surface_to_ids = {}
+        for token_id, token in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+            if token_id in special_ids or token is None:
+                continue
+            surface = token.replace("▁", " ")
+            self.token_surfaces[token_id] = surface
+            self.surface_to_ids.setdefault(surface, []).append(token_id)
+
+        # Trie of the token surfaces. Each node maps a char to its child node and None to the ids of the tokens ending there.
+        self.trie = {}
+        for surface, token_ids in self.surface_to_ids.items():
+            node = self.trie
+            for char in surface:
+                node = node.setdefault(char, {})
+            node[None] = token_ids
+
+        self._first_token_cache = LRUCache(cache_size)
+
+
+    def get_prefix_allowed_tokens_fn(self, model_inputs: list[str]):
+        """Get the function that returns the allowed next tokens for the given batch of inputs."""
+        matching_texts = [self.get_matching_text(model_input) for model_input in model_inputs]
+
+        def prefix_allowed_tokens_fn(batch_id: int, input_ids) -> list[int]:
+            # Skip the decoder start token.
+            generated_ids = input_ids.tolist()[1:]
+            return self.get_allowed_tokens(matching_texts[batch_id], generated_ids)
+
+        return prefix_allowed_tokens_fn
+
+
+    def get_matching_text(self, model_input: str) -> str:
+        """Get the text the answer to the model input is copied from, that is, its context and, if allowed for its question, the allowed answers."""
+        context = normalize_for_matching(get_context(model_input))
+        if len(self.allowed_answers) == 0 or (self.allowed_answers_question_prefix is not None and not get_question(model_input).startswith(self.allowed_answers_question_prefix)):
+            return context
+        
+        return SEGMENT_SEPARATOR.join([context] + self.allowed_answers)
+    
+
+    def get_allowed_tokens(self, matching_text: str, generated_ids: list[int]) -> list[int]:
+        """Get the tokens that continue the generated answer such that it is still a span of the matching text."""
+        if len(generated_ids) == 0:
+            return self._get_first_tokens(matching_text)
+        elif generated_ids[-1] == self.eos_token_id:
+            return [self.eos_token_id]
+
+        # Leading whitespace is removed when decoding.
+        answer = "".join(self.token_surfaces.get(token_id, "") for token_id in generated_ids).lstrip(" ")
+
+        allowed_ids = {self.eos_token_id}
+        for end in self._find_ends(matching_text, answer):
+            self._add_tokens_along(self.trie, matching_text, end, allowed_ids)
+
+        return list(allowed_ids)
+
+
+    def _add_tokens_along(self, node: dict, matching_text: str, start: int, allowed_ids: set):
+        """Add the ids of the tokens whose surfaces continue the path to the trie node with the matching text from `start`."""
+        for pos in range(start, len(matching_text)):
+            node = node.get(matching_text[pos])
+            if node is None:
+                return
+            allowed_ids.update(node.get(None, ()))
+
+
+    def _find_ends(self, matching_text: str, answer: str) -> set[int]:
+        """Char offsets in the matching text at which the answer (optionally with the case of its first letter swapped) ends."""
+        ends = set()
+        if len(answer) == 0:
+            return ends
+
+        for variant in {answer, answer[0].swapcase() + answer[1:]}:
+            start = matching_text.find(variant)
+            while start != -1:
+                ends.add(start + len(variant))
+                start = matching_text.find(variant, start + 1)
+
+        return ends
+
+
+    def _get_first_tokens(self, matching_text: str) -> list[int]:
+        """Tokens that start a span anywhere in the matching text."""
+        allowed_ids = self._first_token_cache.get(matching_text)
+        if allowed_ids is not None:
+            return allowed_ids
+
+        allowed_ids = {self.eos_token_id}
+        # Tokens starting with a word boundary marker also start the answer, as the leading whitespace is removed.
+        start_nodes = [self.trie, self.trie.get(" ", {})]
+        for start, char in enumerate(matching_text):
+            # The case of the first letter may differ (swapping it may give multiple chars, e.g., "ß" -> "SS").
+            for first_chars in {char, char.swapcase()}:
+                for node in start_nodes:
+                    for first_char in first_chars:
+                        node = node.get(first_char)
+                        if node is None:
+                            break
+                    else:
+                        allowed_ids.update(node.get(None, ()))
+                        self._add_tokens_along(node, matching_text, start + 1, allowed_ids)
+
+        allowed_ids = list(allowed_ids)
+        self._first_token_cache.put(matching_text, allowed_ids)
+
+        return allowed_ids
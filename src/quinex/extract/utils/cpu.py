@@ -0,0 +1,164 @@
+"""
+Plan how the CPU cores are split between the workers of the models when running on CPU.
+Without a plan, each worker uses all cores for the intra-op parallelism of torch, so that
+concurrent workers oversubscribe the cores. With a plan, each worker gets its own set of
+cores, which are taken from the same NUMA node where possible.
+"""
+import os
+from pathlib import Path
+import torch
+
+
+def get_available_cpus() -> list[int]:
+    """Get the IDs of the CPUs this process is allowed to run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    """Parse a Linux CPU list such as "0-3,8,10-11"."""
+    cpus = []
+    for part in cpu_list.strip().split(","):
+        if part == "":
+            continue
+        elif "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+
+    return cpus
+
+
+def get_numa_nodes(cpus: list[int]=None) -> list[list[int]]:
+    """
+    Get the given CPUs grouped by NUMA node. Falls back to a single node if the
+    NUMA topology is not available (e.g., on other platforms than Linux).
+    """
+    cpus = cpus or get_available_cpus()
+    available = set(cpus)
+    nodes = []
+    for node_dir in sorted(Path("/sys/devices/system/node").glob("node[0-9]*"), key=lambda p: int(p.name[4:])):
+        try:
+            node_cpus = [cpu for cpu in parse_cpu_list((node_dir / "cpulist").read_text()) if cpu in available]
+        except (OSError, ValueError):
+            continue
+        if len(node_cpus) > 0:
+            nodes.append(node_cpus)
+
+    # Add CPUs not listed in any node to the last node.
+    listed = set(cpu for node in nodes for cpu in node)
+    unlisted = [cpu for cpu in cpus if cpu not in listed]
+    if len(nodes) == 0:
+        nodes = [unlisted]
+    elif len(unlisted) > 0:
+        nodes[-1].extend(unlisted)
+
+    return nodes
+
+
+def _split_evenly(items: list, n_parts: int) -> list[list]:
+    """Split items into n_parts consecutive parts whose sizes differ by at most one."""
+    size, remainder = divmod(len(items), n_parts)
+    parts = []
+    start = 0
+    for i in range(n_parts):
+        end = start + size + (1 if i < remainder else 0)
+        parts.append(items[start:end])
+        start = end
+
+    return parts
+
+
+def _distribute_proportionally(n: int, weights: list[int]) -> list[int]:
+    """Distribute n items proportionally to the weights (largest remainder method)."""
+    total = sum(weights)
+    quotas = [n * w / total for w in weights]
+    counts = [int(q) for q in quotas]
+    by_remainder = sorted(range(len(weights)), key=lambda i: quotas[i] - counts[i], reverse=True)
+    for i in by_remainder[:n - sum(counts)]:
+        counts[i] += 1
+
+    return counts
+
+
+def plan_cpu_layout(n_workers: dict[str, int], cpus: list[int]=None, numa_nodes: list[list[int]]=None) -> dict[str, list[list[int]]]:
+    """
+    Split the available CPU cores between the workers of the models.
+
+    Workers are distributed over the NUMA nodes proportionally to their number of cores and
+    the cores of each node are split evenly between its workers, so that a worker does not
+    access the memory of another node. If there are fewer workers than NUMA nodes, workers
+    span multiple nodes. If there are more workers than cores, cores are shared.
+
+    Args:
+        n_workers (dict): Number of workers per model, e.g., {"quantity_model": 1, "context_model": 3}.
+        cpus (list, optional): IDs of the CPUs to use. Defaults to all available CPUs.
+        numa_nodes (list, optional): CPU IDs grouped by NUMA node. Defaults to the NUMA topology of the system.
+
+    Returns:
+        dict: For each model, a list with the CPU IDs of each worker rank.
+    """
+    cpus = cpus or get_available_cpus()
+    numa_nodes = numa_nodes or get_numa_nodes(cpus)
+    workers = [(model_key, rank) for model_key, n in n_workers.items() for rank in range(n)]
+    if len(workers) == 0:
+        return {}
+
+    if len(workers) > len(cpus):
+        # Oversubscribe, each worker gets a single core.
+        groups = [[cpus[i % len(cpus)]] for i in range(len(workers))]
+    elif len(workers) >= len(numa_nodes):
+        groups = []
+        workers_per_node = _distribute_proportionally(len(workers), [len(node) for node in numa_nodes])
+        for node, nbr_workers in zip(numa_nodes, workers_per_node):
+            if nbr_workers > 0:
+                groups.extend(_split_evenly(node, nbr_workers))
+    else:
+        groups = _split_evenly([cpu for node in numa_nodes for cpu in node], len(workers))
+
+    # Interleave the workers of the models such that the workers of a model are spread over the nodes.
+    workers.sort(key=lambda worker: (worker[1], list(n_workers).index(worker[0])))
+    layout = {model_key: [None] * n for model_key, n in n_workers.items()}
+    for (model_key, rank), group in zip(workers, groups):
+        layout[model_key][rank] = group
+
+    return layout
+
+
+def apply_cpu_assignment(cpus: list[int], pin: bool=False):
+    """
+    Limit the intra-op threads of torch in the calling thread to the number of assigned CPUs
+    and optionally pin the calling thread (and the threads it starts) to them (Linux only).
+    """
+    torch.set_num_threads(len(cpus))
+    if pin and hasattr(os, "sched_setaffinity"):
+        # On Linux, PID 0 refers to the calling thread only.
+        os.sched_setaffinity(0, cpus)
+
+
+def format_cpu_layout(layout: dict[str, list[list[int]]], numa_nodes: list[list[int]]=None) -> list[tuple]:
+    """Get the rows of a table showing the cores, number of threads, and NUMA nodes of each worker."""
+    numa_nodes = numa_nodes or get_numa_nodes()
+    node_of_cpu = {cpu: i for i, node in enumerate(numa_nodes) for cpu in node}
+    rows = []
+    for model_key, groups in layout.items():
+        for rank, cpus in enumerate(groups):
+            nodes = sorted(set(node_of_cpu.get(cpu, "?") for cpu in cpus), key=str)
+            rows.append((model_key, rank, len(cpus), _format_cpu_list(cpus), ",".join(str(node) for node in nodes)))
+
+    return rows
+
+
+def _format_cpu_list(cpus: list[int]) -> str:
+    """Format CPU IDs as a Linux CPU list such as "0-3,8"."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if len(ranges) > 0 and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ",".join(f"{first}-{last}" if first != last else str(first) for first, last in ranges)
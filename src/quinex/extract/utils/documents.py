@@ -0,0 +1,200 @@
+import semchunk
+from bisect import bisect_left, bisect_right
+from text_processing_utils.highlight_context import enclose_with_special_symbol
+
+
+def get_document_per_quantity(quantities: list[dict], text, semantic_boundaries) -> tuple[list[str], list]:
+    """
+    Get the text and the semantic boundaries of the document each quantity stems from.
+
+    Args:
+        quantities (list): List of quantity spans.
+        text (str or list): Either the text all quantities stem from or a list with
+                            the text of the document of each quantity (e.g., if a batch
+                            of quantities is collected from multiple documents).
+        semantic_boundaries (list): Semantic boundaries of the text or, if a list of texts
+                            is given, a list with the semantic boundaries of each text.
+
+    Returns:
+        tuple: List of texts and list of semantic boundaries, each with one entry per quantity.
+    """
+    if isinstance(text, str):
+        # All quantities stem from the same document.
+        return [text] * len(quantities), [semantic_boundaries] * len(quantities)
+    elif len(text) == len(quantities) == len(semantic_boundaries):
+        # Quantities stem from different documents.
+        return list(text), list(semantic_boundaries)
+    else:
+        raise ValueError("If a list of texts is given, it must contain one text and one set of semantic boundaries per quantity.")
+
+
+def _find_break(text: str, begin: int, end: int) -> int:
+    """
+    Find the position right after the last paragraph break, line break, or whitespace (in this 
+    order of preference) in text[begin:end]. Returns None if there is no whitespace at all.
+    """
+    for separator in ["\n\n", "\n", " "]:
+        idx = text.rfind(separator, begin, end)
+        if idx != -1:
+            return idx + len(separator)
+
+    return None
+
+
+def _find_whitespace(text: str, begin: int, end: int, last: bool=True) -> int:
+    """Find the position right after the last (or first) whitespace in text[begin:end]. Returns None if there is none."""
+    if last:
+        idx = max(text.rfind(separator, begin, end) for separator in ["\n", " "])
+    else:
+        idx = min((i for i in (text.find(separator, begin, end) for separator in ["\n", " "]) if i != -1), default=-1)
+
+    return idx + 1 if idx != -1 else None
+
+
+def get_windows(text: str, window_size: int, overlap: int=0) -> list[tuple[int, int, int, int]]:
+    """
+    Split a long text into windows that can be processed one after another.
+
+    Each window has a core which is not overlapping with the cores of other windows. The cores
+    end at paragraph breaks if possible. Each window is extended by the overlap on both sides
+    to provide the context of the text close to the borders of its core.
+
+    Args:
+        text (str): The text to split.
+        window_size (int): Max. number of chars of the core of each window.
+        overlap (int): Number of chars by which each window is extended on both sides.
+
+    Returns:
+        list: Tuples of (start, core_start, core_end, end) char offsets for each window.
+    """
+    if window_size < 1:
+        raise ValueError("Window size must be greater than 0.")
+
+    windows = []
+    core_start = 0
+    while core_start < len(text):
+
+        # End core at a break in the second half of the window.
+        if len(text) - core_start <= window_size:
+            core_end = len(text)
+        else:
+            core_end = _find_break(text, core_start + window_size // 2, core_start + window_size) or core_start + window_size
+
+        # Extend window by the overlap without splitting words.
+        if core_start == 0 or overlap == 0:
+            start = core_start
+        else:
+            start = _find_whitespace(text, max(0, core_start - overlap), core_start, last=False) or max(0, core_start - overlap)
+        if core_end == len(text) or overlap == 0:
+            end = core_end
+        else:
+            end = _find_whitespace(text, core_end, min(len(text), core_end + overlap)) or min(len(text), core_end + overlap)
+
+        windows.append((start, core_start, core_end, end))
+        core_start = core_end
+
+    return windows
+
+
+def shift_char_offsets(prediction: dict, char_offset: int) -> dict:
+    """
+    Shift the char offsets of all explicit annotations of a prediction (i.e., a quantitative
+    statement, a classified quantity, or a quantity) by the given offset. Implicit and empty 
+    annotations are not shifted, as their offsets do not refer to the text.
+    """
+    if "claim" in prediction:
+        annotations = list(prediction["claim"].values()) + list(prediction.get("qualifiers", {}).values())
+    elif "quantity" in prediction:
+        annotations = [prediction["quantity"]]
+    else:
+        annotations = [prediction]
+
+    for annotation in annotations:
+        if annotation is not None and annotation.get("is_implicit") is False:
+            annotation["start"] += char_offset
+            annotation["end"] += char_offset
+
+    return prediction
+
+
+def get_quantity_start(prediction: dict) -> int:
+    """Get the start char offset of the quantity of a prediction (see shift_char_offsets)."""
+    if "claim" in prediction:
+        return prediction["claim"]["quantity"]["start"]
+    elif "quantity" in prediction:
+        return prediction["quantity"]["start"]
+    else:
+        return prediction["start"]
+
+
+def adapt_semantic_boundaries(semantic_boundaries, char_offset: int, length: int, **kwargs) -> list:
+    """
+    Adapt the semantic boundaries of a text to a window of it with the given char offset 
+    and length (see semchunk.adapt_semantic_boundaries()). Only the boundaries within the 
+    window and the closest ones around it are adapted instead of all boundaries of the text.
+    They are looked up by bisection, as the boundaries of each level are sorted.
+    """
+    window_semantic_boundaries = []
+    for boundaries in semantic_boundaries:
+        first = max(bisect_right(boundaries, char_offset) - 1, 0)
+        last = bisect_left(boundaries, char_offset + length) + 1
+        window_semantic_boundaries.append(boundaries[first:last])
+
+    return semchunk.adapt_semantic_boundaries(window_semantic_boundaries, char_offset, length, **kwargs)
+
+
+def get_centered_chunk_with_enclosed_span(text: str, span: tuple[int, int], enclosing: tuple[str, str], chunk_size: int, token_counter, semantic_boundaries, window_first: bool=True) -> tuple[int, str]:
+    """
+    Enclose a span of a text in special symbols and get the most meaningful chunk of the 
+    text centered around the span that still fits into the given number of tokens.
+
+    If `window_first` is True, the special symbols are only inserted into a window of the text 
+    around the span, which contains any chunk that could fit (see TokenCounter.get_window()),
+    instead of into a copy of the whole text for each span. The chunk is the same as when
+    enclosing the span in the whole text. If the chunk touches a border of the window, it may
+    have been cut by the window, hence, the window is enlarged until it does not. The whole 
+    text is only used if the window cannot be determined.
+
+    Args:
+        text (str): The text.
+        span (tuple): Char offsets of the span to enclose.
+        enclosing (tuple): Start and end symbol to enclose the span in.
+        chunk_size (int): Maximum number of tokens of the chunk.
+        token_counter (TokenCounter): Token counter of the model.
+        semantic_boundaries: Semantic boundaries of the text.
+        window_first (bool, optional): Whether to select a window of the text before enclosing the span.
+
+    Returns:
+        tuple: Char offset of the chunk in the text with the enclosed span and the chunk.
+    """
+    start, end = span
+    insertions = [(start, enclosing[0]), (end, enclosing[1])]
+    centering_span = (start, end + len(enclosing[0]) + len(enclosing[1]))
+
+    # Zero-width spans are not enclosed, so the window would not match the text.
+    max_token_count = chunk_size
+    while window_first and start != end:
+        window = token_counter.get_window(text, span, max_token_count)
+        if window is None:
+            break
+
+        window_start, window_end = window
+        window_token_counter = token_counter.for_text(text, span=window, insertions=insertions)
+        window_text = window_token_counter.text
+        window_centering_span = (centering_span[0] - window_start, centering_span[1] - window_start)
+        window_semantic_boundaries = adapt_semantic_boundaries(semantic_boundaries, window_start, len(window_text), added_chars_len=0, added_chars_end_pos=window_centering_span[1])
+        (chunk_char_offset, _), chunk = semchunk.get_single_centered_chunk(window_text, centering_char_offsets=window_centering_span, chunk_size=chunk_size, token_counter=window_token_counter, semantic_boundaries=window_semantic_boundaries, offsets=True)
+        
+        # The chunk could have been cut by the window if it reaches its border within the text.
+        touches_window_start = chunk_char_offset == 0 and window_start > 0
+        touches_window_end = chunk_char_offset + len(chunk) == len(window_text) and window_end < len(text)
+        if not (touches_window_start or touches_window_end):
+            return window_start + chunk_char_offset, chunk
+        
+        max_token_count *= 2
+
+    # Enclose the span in the whole text.
+    text_w_enclosing, _ = enclose_with_special_symbol(text, span, start_symbol=enclosing[0], end_symbol=enclosing[1])
+    (chunk_char_offset, _), chunk = semchunk.get_single_centered_chunk(text_w_enclosing, centering_char_offsets=centering_span, chunk_size=chunk_size, token_counter=token_counter, semantic_boundaries=semantic_boundaries, offsets=True)
+
+    return chunk_char_offset, chunk
@@ -0,0 +1,263 @@
+"""
+Lean inference engines that run the models directly on tensors instead of through the
+transformers pipelines. They tokenize each batch once (with offsets), run the model under
+torch.inference_mode(), and post-process the outputs in NumPy. The outputs are identical
+to the ones of the corresponding transformers pipelines in load_transformers_pipe().
+"""
+import numpy as np
+import torch
+
+
+class InferenceEngine:
+    """
+    Base class of the inference engines. Like a transformers pipeline, an engine is called with
+    a list of texts and processes them in batches of the given batch size.
+
+    Args:
+        model: Transformers model.
+        tokenizer: Transformers tokenizer of the model.
+        device (str): Device to run the model on (e.g., "cpu" or "cuda:0").
+        batch_size (int): Number of texts per batch.
+    """
+
+    def __init__(self, model, tokenizer, device="cpu", batch_size: int=8):
+        self.device = torch.device(f"cuda:{device}" if isinstance(device, int) and device >= 0 else "cpu" if isinstance(device, int) else device)
+        self.model = model.to(self.device)
+        self.model.eval()
+        self.tokenizer = tokenizer
+        self._batch_size = batch_size
+
+
+    def __call__(self, inputs, batch_size: int=None, **kwargs):
+
+        single_input = isinstance(inputs, str)
+        if single_input:
+            inputs = [inputs]
+
+        batch_size = batch_size or self._batch_size
+        outputs = []
+        for i in range(0, len(inputs), batch_size):
+            outputs.extend(self._process_batch(inputs[i:i+batch_size], **kwargs))
+
+        return outputs[0] if single_input else outputs
+
+
+    def _process_batch(self, texts: list[str], **kwargs) -> list:
+        raise NotImplementedError
+
+
+    def _to_device(self, encodings, keys: list[str]) -> dict:
+        return {key: encodings[key].to(self.device) for key in keys if key in encodings}
+
+
+class Entities(list):
+    """
+    Entities predicted for a text with the confidence of the prediction as `score`, that is, the lowest
+    probability of the predicted label of any token (including tokens with the "O" tag). Thus, the 
+    confidence is also low if a token is likely part of an entity that was not predicted.
+    """
+
+    def __init__(self, entities: list[dict], score: float):
+        super().__init__(entities)
+        self.score = score
+
+
+class TokenClassificationEngine(InferenceEngine):
+    """
+    Token classification with the "simple" aggregation strategy of the transformers pipeline,
+    that is, consecutive tokens with the same tag are grouped into one entity unless a token
+    has a "B-" tag. Entities with the "O" tag are ignored. Requires a fast tokenizer.
+
+    Args:
+        ignore_labels (list): Tags of the entities to ignore.
+        return_scores (bool): Whether to return the entities of each text as `Entities` with the 
+                        confidence of the prediction based on the label probabilities of all tokens.
+    """
+
+    def __init__(self, model, tokenizer, device="cpu", batch_size: int=8, ignore_labels: list[str]=["O"], return_scores: bool=False):
+        super().__init__(model, tokenizer, device, batch_size)
+        if not tokenizer.is_fast:
+            raise ValueError("Token classification requires a fast tokenizer to get the char offsets of the tokens.")
+
+        self.ignore_labels = ignore_labels
+        self.return_scores = return_scores
+
+        # Look up tables of the tag (e.g., "QUANTITY" of "B-QUANTITY") and whether a label starts a new entity.
+        id2label = model.config.id2label
+        self.labels = [id2label[i] for i in range(len(id2label))]
+        self.entity_groups = [label.split("-", 1)[-1] for label in self.labels]
+        tags = [label[2:] if label.startswith(("B-", "I-")) else label for label in self.labels]
+        tag_ids = {tag: i for i, tag in enumerate(dict.fromkeys(tags))}
+        self.tag_ids = np.array([tag_ids[tag] for tag in tags])
+        self.is_begin_label = np.array([label.startswith("B-") for label in self.labels])
+
+
+    def _process_batch(self, texts: list[str]) -> list[list[dict]]:
+
+        encodings = self.tokenizer(texts, padding=True, truncation=True, return_special_tokens_mask=True, return_offsets_mapping=True, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.model(**self._to_device(encodings, ["input_ids", "attention_mask", "token_type_ids"]))[0]
+
+        # Softmax over labels.
+        logits = logits.cpu().numpy()
+        maxes = np.max(logits, axis=-1, keepdims=True)
+        shifted_exp = np.exp(logits - maxes)
+        scores = shifted_exp / shifted_exp.sum(axis=-1, keepdims=True)
+        label_ids = scores.argmax(axis=-1)
+
+        special_tokens_mask = encodings["special_tokens_mask"].numpy().astype(bool)
+        offset_mapping = encodings["offset_mapping"].numpy()
+        input_ids = encodings["input_ids"].numpy()
+
+        predictions = [self._decode_entities(text, scores[i], label_ids[i], input_ids[i], offset_mapping[i], special_tokens_mask[i]) for i, text in enumerate(texts)]
+        if self.return_scores:
+            # Lowest probability of the predicted label of the (non-special) tokens of each text.
+            top_scores = np.where(special_tokens_mask, 1.0, scores.max(axis=-1))
+            predictions = [Entities(entities, float(top_scores[i].min(initial=1.0))) for i, entities in enumerate(predictions)]
+
+        return predictions
+
+
+    def _decode_entities(self, text, scores, label_ids, input_ids, offset_mapping, special_tokens_mask) -> list[dict]:
+        """Group the BIO tags of the (non-special) tokens of a text into char-level entity spans."""
+
+        token_indices = np.flatnonzero(~special_tokens_mask)
+        if len(token_indices) == 0:
+            return []
+
+        label_ids = label_ids[token_indices]
+        token_scores = scores[token_indices, label_ids]
+        starts = offset_mapping[token_indices, 0]
+        ends = offset_mapping[token_indices, 1]
+
+        # A new entity starts if the tag changes or a token has a "B-" tag.
+        tag_ids = self.tag_ids[label_ids]
+        is_group_start = np.empty(len(token_indices), dtype=bool)
+        is_group_start[0] = True
+        is_group_start[1:] = (tag_ids[1:] != tag_ids[:-1]) | self.is_begin_label[label_ids[1:]]
+        group_starts = np.flatnonzero(is_group_start)
+        group_ends = np.append(group_starts[1:], len(token_indices))
+
+        entities = []
+        for group_start, group_end in zip(group_starts, group_ends):
+            entity_group = self.entity_groups[label_ids[group_start]]
+            if entity_group in self.ignore_labels:
+                continue
+
+            tokens = [self._get_token(text, input_ids[token_indices[i]], starts[i], ends[i]) for i in range(group_start, group_end)]
+            entities.append({
+                "entity_group": entity_group,
+                "score": np.mean(np.nanmean(token_scores[group_start:group_end])),
+                "word": self.tokenizer.convert_tokens_to_string(tokens),
+                "start": int(starts[group_start]),
+                "end": int(ends[group_end-1]),
+            })
+
+        return entities
+
+
+    def _get_token(self, text, input_id, start, end) -> str:
+        """Get the token string, where unknown tokens are replaced by the text they stem from."""
+        if int(input_id) == self.tokenizer.unk_token_id:
+            return text[start:end]
+        else:
+            return self.tokenizer.convert_ids_to_tokens(int(input_id))
+
+
+class TextClassificationEngine(InferenceEngine):
+    """
+    Text classification returning the scores of all labels sorted in descending order.
+    Scores are computed with a sigmoid for multi-label classification and a softmax otherwise.
+    """
+
+    def __init__(self, model, tokenizer, device="cpu", batch_size: int=8):
+        super().__init__(model, tokenizer, device, batch_size)
+        config = model.config
+        if config.problem_type == "multi_label_classification" or config.num_labels == 1:
+            self.function_to_apply = "sigmoid"
+        elif config.problem_type == "single_label_classification" or config.num_labels > 1:
+            self.function_to_apply = "softmax"
+        else:
+            self.function_to_apply = getattr(config, "function_to_apply", "none")
+
+
+    def _process_batch(self, texts: list[str]) -> list[list[dict]]:
+
+        encodings = self.tokenizer(texts, padding=True, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.model(**self._to_device(encodings, ["input_ids", "attention_mask", "token_type_ids"]))[0]
+
+        logits = logits.cpu().numpy()
+        if self.function_to_apply == "sigmoid":
+            scores = 1.0 / (1.0 + np.exp(-logits))
+        elif self.function_to_apply == "softmax":
+            maxes = np.max(logits, axis=-1, keepdims=True)
+            shifted_exp = np.exp(logits - maxes)
+            scores = shifted_exp / shifted_exp.sum(axis=-1, keepdims=True)
+        else:
+            scores = logits
+
+        predictions = []
+        for text_scores in scores:
+            prediction = [{"label": self.model.config.id2label[i], "score": score.item()} for i, score in enumerate(text_scores)]
+            prediction.sort(key=lambda x: x["score"], reverse=True)
+            predictions.append(prediction)
+
+        return predictions
+
+
+class Text2TextGenerationEngine(InferenceEngine):
+    """
+    Text-to-text generation returning the generated text without special tokens.
+
+    Args:
+        max_new_tokens (int): Maximum number of tokens to generate per text.
+        assistant_model (optional): Smaller model of the same family that drafts tokens verified by 
+                        the model (assisted generation), which requires a batch size of 1.
+        context_constraint (ContextSpanConstraint, optional): If given, only spans of the context of 
+                        each input can be generated (see quinex/extract/utils/constrained_decoding.py).
+        return_scores (bool): Whether to also return the length-normalized probability of each 
+                        generated text (i.e., the geometric mean of its token probabilities) as "score".
+    """
+
+    def __init__(self, model, tokenizer, device="cpu", batch_size: int=8, max_new_tokens: int=50, assistant_model=None, context_constraint=None, return_scores: bool=False):
+        super().__init__(model, tokenizer, device, batch_size)
+        self.max_new_tokens = max_new_tokens
+        self.assistant_model = assistant_model
+        self.context_constraint = context_constraint
+        self.return_scores = return_scores
+        self.prefix = model.config.prefix if model.config.prefix is not None else ""
+
+
+    def _process_batch(self, texts: list[str], **generate_kwargs) -> list[dict]:
+
+        encodings = self.tokenizer([self.prefix + text for text in texts], padding=True, return_tensors="pt")
+        generate_kwargs = {"max_new_tokens": self.max_new_tokens, **generate_kwargs}
+        if self.assistant_model is not None:
+            generate_kwargs["assistant_model"] = self.assistant_model
+        if self.context_constraint is not None:
+            generate_kwargs["prefix_allowed_tokens_fn"] = self.context_constraint.get_prefix_allowed_tokens_fn(texts)
+        with torch.inference_mode():
+            if self.return_scores:
+                outputs = self.model.generate(**self._to_device(encodings, ["input_ids", "attention_mask"]), output_scores=True, return_dict_in_generate=True, **generate_kwargs)
+                output_ids = outputs.sequences
+                scores = self._get_sequence_scores(outputs)
+            else:
+                output_ids = self.model.generate(**self._to_device(encodings, ["input_ids", "attention_mask"]), **generate_kwargs)
+
+        predictions = [{"generated_text": self.tokenizer.decode(ids, skip_special_tokens=True, clean_up_tokenization_spaces=False)} for ids in output_ids]
+        if self.return_scores:
+            for prediction, score in zip(predictions, scores):
+                prediction["score"] = score
+
+        return predictions
+
+
+    def _get_sequence_scores(self, outputs) -> list[float]:
+        """Geometric mean of the probabilities of the generated tokens of each sequence (padding after EOS is ignored)."""
+        log_probs = self.model.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)
+        is_generated = outputs.sequences[:, 1:] != self.tokenizer.pad_token_id
+        log_probs = torch.where(is_generated, log_probs, torch.zeros_like(log_probs))
+        mean_log_probs = log_probs.sum(dim=1) / is_generated.sum(dim=1).clamp(min=1)
+        
+        return torch.exp(mean_log_probs).tolist()
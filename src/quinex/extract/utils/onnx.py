@@ -0,0 +1,123 @@
+"""
+Export the models to ONNX and run them with ONNX Runtime, optionally with dynamic int8 quantization.
+Exported (and quantized) models are cached on disk so that they are only exported once per model.
+Requires the "onnx" extra (pip install quinex[onnx]).
+"""
+import os
+from pathlib import Path
+
+try:
+    from optimum.onnxruntime import (
+        ORTModelForTokenClassification,
+        ORTModelForSequenceClassification,
+        ORTModelForSeq2SeqLM,
+        ORTQuantizer,
+    )
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    ORTModelForTokenClassification = None
+    ORTModelForSequenceClassification = None
+    ORTModelForSeq2SeqLM = None
+    ORTQuantizer = None
+    AutoQuantizationConfig = None
+
+
+# ONNX files of each model class. The T5 model consists of an encoder, a decoder,
+# and a decoder that reuses the past key values of previous decoding steps.
+ONNX_FILE_NAMES = {
+    "token-classification": {"file_name": "model.onnx"},
+    "text-classification": {"file_name": "model.onnx"},
+    "text2text-generation": {
+        "encoder_file_name": "encoder_model.onnx",
+        "decoder_file_name": "decoder_model.onnx",
+        "decoder_with_past_file_name": "decoder_with_past_model.onnx"
+    },
+}
+
+
+def get_onnx_cache_dir(model_path: str, quantize: bool=False) -> Path:
+    """
+    Get the directory the exported ONNX model is cached in. Defaults to ~/.cache/quinex/onnx/
+    and can be changed with the environment variable QUINEX_ONNX_CACHE_DIR.
+    """
+    cache_root = Path(os.environ.get("QUINEX_ONNX_CACHE_DIR", Path.home() / ".cache" / "quinex" / "onnx"))
+    return cache_root / model_path.replace("/", "--") / ("int8" if quantize else "fp32")
+
+
+def _get_ort_model_class(task: str):
+    if ORTModelForSeq2SeqLM is None:
+        raise ImportError("ONNX Runtime backend not available. Please install it with 'pip install quinex[onnx]'.")
+
+    if task == "token-classification":
+        return ORTModelForTokenClassification
+    elif task == "text-classification":
+        return ORTModelForSequenceClassification
+    elif task == "text2text-generation":
+        return ORTModelForSeq2SeqLM
+    else:
+        raise ValueError(f"Task {task} not supported.")
+
+
+def export_to_onnx(task: str, model_path: str, quantize: bool=False, local_files_only: bool=False, verbose: bool=False) -> Path:
+    """
+    Export a model to ONNX and optionally quantize its weights to int8 with dynamic quantization.
+    Nothing is done if the model is already cached.
+
+    Args:
+        task (str): Task of the model ("token-classification", "text-classification" or "text2text-generation").
+        model_path (str): Name of the model on HuggingFace or path to it.
+        quantize (bool): Whether to quantize the model weights to int8.
+        local_files_only (bool): Whether to only use local files to load the model.
+        verbose (bool): Whether to print progress messages.
+
+    Returns:
+        Path: Directory with the exported model.
+    """
+    ort_model_class = _get_ort_model_class(task)
+    export_dir = get_onnx_cache_dir(model_path, quantize=False)
+    onnx_files = list(ONNX_FILE_NAMES[task].values())
+
+    # Export model with past key values for generation.
+    if not all((export_dir / f).exists() for f in onnx_files):
+        if verbose:
+            print(f"Exporting {model_path} to ONNX...")
+        kwargs = {"use_cache": True} if task == "text2text-generation" else {}
+        ort_model = ort_model_class.from_pretrained(model_path, export=True, local_files_only=local_files_only, **kwargs)
+        ort_model.save_pretrained(export_dir)
+
+    if not quantize:
+        return export_dir
+
+    # Quantize weights of each ONNX file.
+    quantized_dir = get_onnx_cache_dir(model_path, quantize=True)
+    if not all((quantized_dir / f).exists() for f in onnx_files):
+        if verbose:
+            print(f"Quantizing ONNX model of {model_path} to int8...")
+        quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        for onnx_file in onnx_files:
+            quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=onnx_file)
+            quantizer.quantize(save_dir=quantized_dir, quantization_config=quantization_config, file_suffix="")
+
+        # Copy config files needed to load the model.
+        for config_file in export_dir.glob("*.json"):
+            if not (quantized_dir / config_file.name).exists():
+                (quantized_dir / config_file.name).write_bytes(config_file.read_bytes())
+
+    return quantized_dir
+
+
+def load_onnx_model(task: str, model_path: str, device="cpu", quantize: bool=False, local_files_only: bool=False, verbose: bool=False):
+    """
+    Load an ONNX Runtime model that can be used in place of the PyTorch model in a transformers pipeline.
+    The model is exported (and quantized) first if it is not cached yet.
+    """
+    ort_model_class = _get_ort_model_class(task)
+    model_dir = export_to_onnx(task, model_path, quantize=quantize, local_files_only=local_files_only, verbose=verbose)
+    kwargs = {"use_cache": True} if task == "text2text-generation" else {}
+    if str(device).startswith("cuda"):
+        kwargs["provider"] = "CUDAExecutionProvider"
+        kwargs["provider_options"] = {"device_id": int(str(device).split(":")[1]) if ":" in str(device) else 0}
+    else:
+        kwargs["provider"] = "CPUExecutionProvider"
+
+    return ort_model_class.from_pretrained(model_dir, **ONNX_FILE_NAMES[task], **kwargs)
@@ -0,0 +1,68 @@
+"""
+Restrict the extraction to regions of a text (e.g., to skip reference lists, funding statements,
+or affiliations of papers). Regions are given as char spans, either as (start, end) tuples or as
+dicts with "start" and "end" keys, and always refer to the whole text.
+"""
+from bisect import bisect_right
+
+
+def normalize_regions(regions) -> list[tuple[int, int]]:
+    """Get the regions as sorted list of non-overlapping (start, end) tuples. Empty regions are removed."""
+    spans = []
+    for region in regions:
+        start, end = (region["start"], region["end"]) if isinstance(region, dict) else region
+        if start < end:
+            spans.append((start, end))
+
+    merged = []
+    for start, end in sorted(spans):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def get_allowed_regions(text_length: int, include_regions=None, exclude_regions=None) -> list[tuple[int, int]]:
+    """
+    Get the regions of a text to extract from, that is, the include regions (or the whole text if
+    none are given) without the exclude regions. Returns None if the extraction is not restricted.
+    """
+    if include_regions is None and exclude_regions is None:
+        return None
+
+    allowed = normalize_regions(include_regions) if include_regions is not None else [(0, text_length)]
+    for excluded_start, excluded_end in normalize_regions(exclude_regions or []):
+        remaining = []
+        for start, end in allowed:
+            if excluded_end <= start or end <= excluded_start:
+                remaining.append((start, end))
+            else:
+                if start < excluded_start:
+                    remaining.append((start, excluded_start))
+                if excluded_end < end:
+                    remaining.append((excluded_end, end))
+        allowed = remaining
+
+    return allowed
+
+
+def overlaps_regions(start: int, end: int, regions: list[tuple[int, int]]) -> bool:
+    """Check if the span overlaps any of the (normalized) regions."""
+    idx = bisect_right(regions, (start, float("inf"))) - 1
+    if idx >= 0 and regions[idx][1] > start:
+        return True
+
+    return idx + 1 < len(regions) and regions[idx + 1][0] < end
+
+
+def is_within_regions(start: int, end: int, regions: list[tuple[int, int]]) -> bool:
+    """Check if the span lies completely within one of the (normalized) regions."""
+    idx = bisect_right(regions, (start, float("inf"))) - 1
+    return idx >= 0 and regions[idx][0] <= start and end <= regions[idx][1]
+
+
+def shift_regions(regions: list[tuple[int, int]], start: int, end: int) -> list[tuple[int, int]]:
+    """Clip the regions to the window text[start:end] and shift them to be relative to the window."""
+    return [(max(s, start) - start, min(e, end) - start) for s, e in regions if s < end and e > start]
@@ -1,4 +1,13 @@
+import re
+import copy
 import math
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import accumulate
+import torch
 from transformers import (
     pipeline,
     T5Tokenizer,
@@ -7,38 +16,238 @@ from transformers import (
     AutoModelForSequenceClassification,
     T5ForConditionalGeneration
 )
+from quinex.extract.utils.inference import TokenClassificationEngine, TextClassificationEngine, Text2TextGenerationEngine
+from quinex.extract.utils.constrained_decoding import ContextSpanConstraint
 
 
-def load_transformers_pipe(task, model_path, device, batch_size=8, dtype="auto", verbose=False, max_new_tokens: int=50, local_files_only: bool=False):
+# Models and tokenizers that are already loaded. Models are shared by all pipelines on the same 
+# device. Tokenizers are copied for each pipeline, as they must not be used by multiple threads at once.
+_loaded_models = {}
+_loaded_tokenizers = {}
+_loading_locks = {}
+_registry_lock = threading.Lock()
+
+# Number of tracked users of each loaded model and tokenizer (see track_loaded_models()).
+_reference_counts = {}
+_tracking = threading.local()
+
+
+def _get_or_load(registry: dict, key: tuple, load):
+    """Get an object from the registry or load it if it is not loaded yet. Each object is only loaded once."""
+    with _registry_lock:
+        loading_lock = _loading_locks.setdefault(key, threading.Lock())
+
+    with loading_lock:
+        if key not in registry:
+            registry[key] = load()
+        loaded = registry[key]
+
+    references = getattr(_tracking, "references", None)
+    if references is not None:
+        with _registry_lock:
+            _reference_counts[key] = _reference_counts.get(key, 0) + 1
+        references.append((registry, key))
+
+    return loaded
+
+
+@contextmanager
+def track_loaded_models():
+    """
+    Record the models and tokenizers that are loaded or reused in this thread within the context, 
+    so that they can be released with release_loaded_models() once they are not used anymore:
+
+        with track_loaded_models() as references:
+            pipe = load_transformers_pipe(...)
+        ...
+        release_loaded_models(references)
+    """
+    previous_references = getattr(_tracking, "references", None)
+    _tracking.references = []
+    try:
+        yield _tracking.references
+    finally:
+        references = _tracking.references
+        _tracking.references = previous_references
+        if previous_references is not None:
+            # Nested tracking also records the references in the enclosing context (release only one of them).
+            previous_references.extend(references)
+
+
+def release_loaded_models(references: list):
+    """
+    Release the models and tokenizers recorded with track_loaded_models(). They are removed from the 
+    registry once all their tracked users released them, so that their memory is freed as soon as 
+    the pipelines using them are not referenced anymore. Untracked users do not keep them loaded.
+    """
+    with _registry_lock:
+        for registry, key in references:
+            _reference_counts[key] = _reference_counts.get(key, 1) - 1
+            if _reference_counts[key] <= 0:
+                del _reference_counts[key]
+                registry.pop(key, None)
+                _loading_locks.pop(key, None)
+
+
+def load_tokenizer(task, model_path, local_files_only: bool=False):
+    """
+    Load the tokenizer for the given model and task. The tokenizer is only loaded 
+    once per model and a copy is returned on each call.
+    """
+    def load():
+        if task == "text2text-generation":
+            return T5Tokenizer.from_pretrained(model_path, use_fast=True, local_files_only=local_files_only, legacy=False)
+        elif task in ["token-classification", "text-classification"]:
+            return AutoTokenizer.from_pretrained(model_path, use_fast=True, local_files_only=local_files_only)
+        else:
+            raise ValueError(f"Task {task} not supported.")
+    
+    tokenizer = _get_or_load(_loaded_tokenizers, (task, model_path, local_files_only), load)
+
+    return copy.deepcopy(tokenizer)
+
+
+def load_model(task, model_path, device, local_files_only: bool=False):
+    """
+    Load the model for the given task. The model is only loaded once per device 
+    and shared by all pipelines on that device.
+    """
+    def load():
+        if task == "token-classification":
+            return AutoModelForTokenClassification.from_pretrained(model_path, local_files_only=local_files_only)
+        elif task == "text-classification":
+            return AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=local_files_only)
+        elif task == "text2text-generation":
+            return T5ForConditionalGeneration.from_pretrained(model_path, local_files_only=local_files_only)
+        else:
+            raise ValueError(f"Task {task} not supported.")
+    
+    return _get_or_load(_loaded_models, (task, model_path, str(device), local_files_only), load)
+
+
+def load_onnx_model_once(task, model_path, device, quantize: bool=False, local_files_only: bool=False, verbose: bool=False):
+    """
+    Load the model exported to ONNX (see quinex/extract/utils/onnx.py). The model is only 
+    loaded once per device and shared by all pipelines on that device.
+    """
+    from quinex.extract.utils.onnx import load_onnx_model
+    load = lambda: load_onnx_model(task, model_path, device, quantize=quantize, local_files_only=local_files_only, verbose=verbose)
+    
+    return _get_or_load(_loaded_models, ("onnx-int8" if quantize else "onnx", task, model_path, str(device), local_files_only), load)
+
+
+def clear_loaded_models():
+    """Remove all loaded models and tokenizers from the registry to free the memory once they are not used anymore."""
+    with _registry_lock:
+        _loaded_models.clear()
+        _loaded_tokenizers.clear()
+        _loading_locks.clear()
+        _reference_counts.clear()
+
+
+def check_same_tokenizer(model_path, other_model_path, task="text2text-generation", local_files_only: bool=False):
+    """
+    Check that a model can be used together with another one, for example, to draft tokens 
+    for it (assisted generation) or in a cascade, that is, both have the same tokenizer 
+    vocabulary. Raises a ValueError otherwise.
+    """
+    vocab = load_tokenizer(task, model_path, local_files_only=local_files_only).get_vocab()
+    other_vocab = load_tokenizer(task, other_model_path, local_files_only=local_files_only).get_vocab()
+    if vocab != other_vocab:
+        raise ValueError(f"Model {other_model_path} cannot be used together with {model_path}, as their tokenizers differ. Use a model of the same family.")
+
+
+def load_transformers_pipe(task, model_path, device, batch_size=8, dtype="auto", verbose=False, max_new_tokens: int=50, local_files_only: bool=False, backend: str="pipeline", assistant_model_path: str=None, constrain_to_context: bool=False, allowed_answers: list[str]=None, allowed_answers_question_prefix: str=None, return_scores: bool=False):
     """
     Load model, tokenizer and create a pipeline object.
+
+    Pipelines of the same model on the same device share the model weights, hence, 
+    multiple workers per device do not need additional memory for the model. On GPUs,
+    each pipeline runs on its own CUDA stream so that the workers can run concurrently.
+
+    The backend "pipeline" wraps the model in a transformers pipeline. The backend "torch"
+    uses a lean inference engine instead (see quinex/extract/utils/inference.py), which
+    gives the same outputs without the overhead of the pipeline. The backends "onnx" and 
+    "onnx-int8" run the model exported to ONNX with ONNX Runtime, the latter with weights 
+    quantized to int8 (see quinex/extract/utils/onnx.py).
+
+    If an assistant model is given for text-to-text generation, it drafts the generated tokens,
+    which are then verified by the model in a single forward pass (assisted generation). With
+    greedy decoding, the outputs are the same as without the assistant model. Assisted generation 
+    only supports a batch size of 1 and is not available for the ONNX backends.
+
+    With `constrain_to_context`, text-to-text generation can only generate spans of the context
+    of each input of the form "question: ... context: ..." and the given allowed answers, which can 
+    be limited to questions starting with `allowed_answers_question_prefix` (see quinex/extract/utils/constrained_decoding.py). This is only available for the "torch" 
+    backend, which knows the input each generated sequence belongs to.
+
+    With `return_scores`, text-to-text generation also returns the length-normalized probability 
+    of each generated text as "score" and token classification returns the entities of each text 
+    with the lowest probability of the predicted label of any token as `score` (only for the "torch" backend).
     """
     
     # Get tokenizer and model.
+    tokenizer = load_tokenizer(task, model_path, local_files_only=local_files_only)
+    if backend in ["onnx", "onnx-int8"]:
+        model = load_onnx_model_once(task, model_path, device, quantize=backend=="onnx-int8", local_files_only=local_files_only, verbose=verbose)
+    else:
+        model = load_model(task, model_path, device, local_files_only=local_files_only)
     if task == "token-classification":
-        tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True, local_files_only=local_files_only, model_max_length=512)
-        model = AutoModelForTokenClassification.from_pretrained(model_path, local_files_only=local_files_only)
+        tokenizer.model_max_length = 512
         kwargs = {"aggregation_strategy": "simple"}
     elif task == "text-classification":
-        tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True, local_files_only=local_files_only)
-        model =  AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=local_files_only)
         kwargs = {"top_k": None}
     elif task == "text2text-generation":
-        tokenizer = T5Tokenizer.from_pretrained(model_path, use_fast=True, local_files_only=local_files_only, legacy=False)
-        model = T5ForConditionalGeneration.from_pretrained(model_path, local_files_only=local_files_only)
         kwargs = {"max_new_tokens": max_new_tokens}        
+
+    if assistant_model_path is not None:
+        if task != "text2text-generation" or backend in ["onnx", "onnx-int8"]:
+            raise ValueError(f"Assisted generation is not supported for task {task} with backend {backend}.")
+        
+        # The assistant model shares its weights with other pipelines on the same device just like the model.
+        kwargs["assistant_model"] = load_model(task, assistant_model_path, device, local_files_only=local_files_only).to(device)
+        batch_size = 1
+
+    if constrain_to_context and (task != "text2text-generation" or backend != "torch"):
+        raise ValueError(f"Constrained decoding is only supported for text2text-generation with the torch backend, not for task {task} with backend {backend}.")
+    
+    if return_scores and (task not in ["token-classification", "text2text-generation"] or backend != "torch"):
+        raise ValueError(f"Returning scores of predictions is only supported for token-classification and text2text-generation with the torch backend, not for task {task} with backend {backend}.")
+
+    if backend == "pipeline":
+        new_pipe = pipeline(
+            task=task,
+            model=model,
+            tokenizer=tokenizer,
+            batch_size=batch_size,
+            torch_dtype=dtype,
+            device=device,
+            **kwargs
+        )
+    elif backend in ["onnx", "onnx-int8"]:
+        from optimum.pipelines import pipeline as ort_pipeline
+        new_pipe = ort_pipeline(
+            task=task,
+            model=model,
+            tokenizer=tokenizer,
+            accelerator="ort",
+            batch_size=batch_size,
+            device=device,
+            **kwargs
+        )
+    elif backend == "torch":
+        if task == "token-classification":
+            new_pipe = TokenClassificationEngine(model, tokenizer, device=device, batch_size=batch_size, return_scores=return_scores)
+        elif task == "text-classification":
+            new_pipe = TextClassificationEngine(model, tokenizer, device=device, batch_size=batch_size)
+        else:
+            new_pipe = Text2TextGenerationEngine(model, tokenizer, device=device, batch_size=batch_size, max_new_tokens=max_new_tokens, assistant_model=kwargs.get("assistant_model"), context_constraint=ContextSpanConstraint(tokenizer, allowed_answers, allowed_answers_question_prefix) if constrain_to_context else None, return_scores=return_scores)
     else:
-        raise ValueError(f"Task {task} not supported.")
-
-    new_pipe = pipeline(
-        task=task,
-        model=model,
-        tokenizer=tokenizer,
-        batch_size=batch_size,
-        torch_dtype=dtype,
-        device=device,
-        **kwargs
-    )
+        raise ValueError(f"Backend {backend} not supported.")
+
+    if str(device).startswith("cuda") and backend not in ["onnx", "onnx-int8"]:
+        # Run each pipeline on its own stream.
+        new_pipe = CUDAStreamPipe(new_pipe, torch.cuda.Stream(device=device))
 
     if verbose:
         print(f'Loaded {task} model on device "{device}" ✅')
@@ -46,18 +255,35 @@ def load_transformers_pipe(task, model_path, device, batch_size=8, dtype="auto",
     return new_pipe
 
 
+class CUDAStreamPipe:
+    """
+    Wraps a pipeline such that it runs on the given CUDA stream. Pipelines sharing 
+    the same model on one GPU can thus process batches concurrently.
+    """
+
+    def __init__(self, pipe, stream):
+        self.pipe = pipe
+        self.stream = stream
+
+
+    def __call__(self, *args, **kwargs):
+        with torch.cuda.stream(self.stream):
+            outputs = self.pipe(*args, **kwargs)
+        self.stream.synchronize()
+        return outputs
+    
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+
 def get_text_chunking_helper(model_name, task, local_files_only: bool=False):
     """
     Get a helper function that counts the number of tokens in a text.
     """
 
     # Load tokenizer.
-    if task == "text2text-generation":
-        tokenizer = T5Tokenizer.from_pretrained(model_name, use_fast=True, legacy=False, local_files_only=local_files_only)
-    elif task in ["token-classification", "text-classification"]:
-        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, local_files_only=local_files_only)
-    else:
-        raise ValueError(f"Task {task} not supported.")
+    tokenizer = load_tokenizer(task, model_name, local_files_only=local_files_only)
     
     # Check if tokenizer max length is power of two .
     if math.log2(tokenizer.model_max_length) % 1 != 0:
@@ -71,11 +297,328 @@ def get_text_chunking_helper(model_name, task, local_files_only: bool=False):
     tokenizer.model_max_length = 1_000_000_000
 
     # Get a function that counts the number of tokens in a text.
-    token_counter = lambda text: len(tokenizer.tokenize(text))
+    token_counter = TokenCounter(tokenizer)
 
     return token_counter, max_chunk_size
 
 
+WORD_REGEX = re.compile(r"\S+")
+
+
+class TokenCounter:
+    """
+    Counts the number of tokens in a text with caching.
+
+    Can be used as a drop-in replacement for `lambda text: len(tokenizer.tokenize(text))`. 
+    Token counts are cached in an LRU cache. Moreover, if no token of the tokenizer
+    spans whitespace (e.g., SentencePiece or WordPiece tokenizers), the token count of a 
+    text is the sum of the token counts of its words. In this case, `for_text()` returns
+    a counter bound to a document that answers the token count of slices of the document
+    from prefix sums of the token counts of its words instead of tokenizing them again.
+
+    Args:
+        tokenizer: Tokenizer used for counting.
+        cache_size (int): Maximum number of texts and of words whose token counts are cached.
+        max_cached_documents (int): Maximum number of documents whose word token counts are kept. Documents
+                        are identified by the string object, so keep the same object while processing a document.
+    """
+
+    # Texts used to check whether the token count of a text is the sum of the token counts of its words.
+    PROBE_TEXTS = [
+        "The bottom giraffe would be exposed to a pressure of more than 10^5 Pa (see Figure 3).",
+        "In 2045,  the  hydrogen demand of\tGermany\nis estimated at 1.2e3 TWh/a.",
+        " Forschungszentrum Jülich operates JUWELS, a 73 PFLOPS supercomputer ",
+    ]
+
+    def __init__(self, tokenizer, cache_size: int=2**16, max_cached_documents: int=4):
+        self.tokenizer = tokenizer
+        self._count_text = lru_cache(maxsize=cache_size)(self._tokenize_and_count)
+        self._count_word = lru_cache(maxsize=cache_size)(self._tokenize_and_count)
+        self._documents = OrderedDict()
+        self._max_cached_documents = max_cached_documents
+        self._lock = threading.Lock()
+        self.counts_are_additive_over_words = all(self._count_text(t) == self.count_words(t) for t in self.PROBE_TEXTS)
+
+
+    def __call__(self, text: str) -> int:
+        return self._count_text(text)
+
+
+    def _tokenize_and_count(self, text: str) -> int:
+        return len(self.tokenizer.tokenize(text))
+
+
+    def count_words(self, text: str) -> int:
+        """Count the tokens of a text as the sum of the token counts of its words."""
+        return sum(self._count_word(word) for word in WORD_REGEX.findall(text))
+
+
+    def for_text(self, text: str, span: tuple[int, int]=None, insertions: list[tuple[int, str]]=None):
+        """
+        Get a token counter for slices of the given text.
+
+        Args:
+            text (str): The document.
+            span (tuple, optional): Char offsets of the part of the document to count slices of.
+            insertions (list, optional): Char offsets in the document and strings inserted at 
+                        these offsets (e.g., special symbols to enclose a quantity).
+
+        Returns:
+            callable: Token counter for slices of the part of the text with insertions, which
+                      falls back to this counter for any other text.
+        """
+        if not self.counts_are_additive_over_words:
+            return self
+        
+        document = self._get_document(text)
+        if document is None:
+            return self
+        
+        return DocumentTokenCounter(document, span, insertions)
+    
+
+    def get_window(self, text: str, span: tuple[int, int], max_token_count: int):
+        """
+        Get a window of the text around a span that contains any slice of the text that 
+        contains the span and has at most `max_token_count` tokens. The words the span 
+        starts and ends in are not counted, as strings may be inserted into them.
+
+        Returns:
+            tuple: Char offsets of the window or None if the token counts of slices of 
+                   the text cannot be computed from the token counts of its words.
+        """
+        if not self.counts_are_additive_over_words:
+            return None
+        
+        document = self._get_document(text)
+        if document is None:
+            return None
+        
+        return document.get_window(span[0], span[1], max_token_count)
+    
+
+    def _get_document(self, text: str):
+        """Get the word token counts of a document, which are computed once per document."""
+        # Look up documents by identity to avoid comparing long texts. The text is 
+        # kept with the entry, so its id cannot be reused by another object.
+        key = id(text)
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is not None and entry[0] is text:
+                self._documents.move_to_end(key)
+                return entry[1]
+        
+        document = _DocumentWordTokenCounts(text, self)
+        if not document.is_valid:
+            document = None
+
+        with self._lock:
+            self._documents[key] = (text, document)
+            self._documents.move_to_end(key)
+            if len(self._documents) > self._max_cached_documents:
+                self._documents.popitem(last=False)
+
+        return document
+    
+
+class MaxTokenCounter:
+    """
+    Counts the tokens of a text as the maximum of the token counts of several token counters, 
+    for example, to size chunks that are passed to models with different tokenizers. Can be 
+    used like a TokenCounter for chunking.
+
+    Args:
+        token_counters (list): Token counters (see TokenCounter).
+    """
+
+    def __init__(self, token_counters: list):
+        self.token_counters = token_counters
+
+
+    def __call__(self, text: str) -> int:
+        return max(token_counter(text) for token_counter in self.token_counters)
+
+
+    def for_text(self, text: str, span: tuple[int, int]=None, insertions: list[tuple[int, str]]=None):
+        """Get a token counter for slices of the given text (see TokenCounter.for_text())."""
+        token_counters = [token_counter.for_text(text, span, insertions) for token_counter in self.token_counters]
+        return lambda text: max(token_counter(text) for token_counter in token_counters)
+
+
+class _DocumentWordTokenCounts:
+    """Char offsets and prefix sums of the token counts of the words in a document."""
+    
+    def __init__(self, text: str, token_counter: TokenCounter):
+        self.text = text
+        self.token_counter = token_counter
+        self.word_starts = []
+        self.word_ends = []
+        word_token_counts = []
+        for match in WORD_REGEX.finditer(text):
+            self.word_starts.append(match.start())
+            self.word_ends.append(match.end())
+            word_token_counts.append(token_counter._count_word(match.group()))
+        self.cumulative_token_counts = [0] + list(accumulate(word_token_counts))
 
+        # Make sure that the token count of the document is the sum of the token counts of its words.
+        self.is_valid = self.cumulative_token_counts[-1] == token_counter._tokenize_and_count(text)
 
 
+    def count(self, start: int, end: int) -> int:
+        """Token count of text[start:end]."""
+        if start >= end:
+            return 0
+        
+        # Words that are completely within the slice.
+        first = bisect_left(self.word_starts, start)
+        last = bisect_right(self.word_ends, end)
+        token_count = self.cumulative_token_counts[last] - self.cumulative_token_counts[first] if last > first else 0
+
+        # Word cut by the start of the slice.
+        if first > 0 and self.word_ends[first-1] > start:
+            token_count += self.token_counter._count_word(self.text[start:min(self.word_ends[first-1], end)])
+
+        # Word cut by the end of the slice.
+        if last < len(self.word_starts) and start <= self.word_starts[last] < end:
+            token_count += self.token_counter._count_word(self.text[self.word_starts[last]:end])
+
+        return token_count
+    
+
+    def get_window(self, start: int, end: int, max_token_count: int) -> tuple[int, int]:
+        """
+        Char offsets of the smallest window around text[start:end] that ends with whole words 
+        on both sides such that any slice reaching beyond it has more than `max_token_count` 
+        tokens in the words that are completely before `start` or after `end`.
+        """        
+        # Words ending right at the start or beginning right at the end are not counted.
+        last_before = bisect_left(self.word_ends, start) - 1
+        first_after = bisect_right(self.word_starts, end)
+
+        # First word such that the words from it until the span have too many tokens.
+        idx = bisect_left(self.cumulative_token_counts, self.cumulative_token_counts[last_before+1] - max_token_count) - 1
+        window_start = self.word_starts[idx] if idx >= 0 else 0
+
+        # Last word such that the words from the span until it have too many tokens.
+        idx = bisect_right(self.cumulative_token_counts, self.cumulative_token_counts[first_after] + max_token_count) - 1
+        window_end = self.word_ends[idx] if idx < len(self.word_ends) else len(self.text)
+
+        return window_start, window_end
+
+
+class DocumentTokenCounter:
+    """
+    Token counter for slices of (a part of) a document with strings inserted at 
+    given char offsets. Texts that are not such slices are counted by the fallback
+    token counter. Use `TokenCounter.for_text()` to create it.
+    """
+
+    def __init__(self, document: _DocumentWordTokenCounts, span: tuple[int, int]=None, insertions: list[tuple[int, str]]=None):
+        self.document = document
+        self.token_counter = document.token_counter
+        span = (0, len(document.text)) if span is None else span
+        insertions = sorted(insertions or [], key=lambda x: x[0])
+
+        # Put together the text and remember where its parts stem from.
+        parts = []
+        self._raw_parts = [] # (char offset in text, char offset in document, length)
+        self._dirty_spans = [] # Char offsets of the words with inserted strings in the text.
+        text_pos = 0
+        doc_pos = span[0]
+        for insertion_pos, inserted in insertions:
+            if not span[0] <= insertion_pos <= span[1]:
+                raise ValueError(f"Insertion at {insertion_pos} is outside of span {span}.")
+            parts.append(document.text[doc_pos:insertion_pos])
+            self._raw_parts.append((text_pos, doc_pos, insertion_pos-doc_pos))
+            text_pos += insertion_pos - doc_pos
+            doc_pos = insertion_pos
+            parts.append(inserted)
+            self._dirty_spans.append((text_pos, text_pos + len(inserted)))
+            text_pos += len(inserted)
+        parts.append(document.text[doc_pos:span[1]])
+        self._raw_parts.append((text_pos, doc_pos, span[1]-doc_pos))
+        self.text = "".join(parts)
+
+        # Extend the inserted strings to the words they are part of and merge overlapping ones.
+        dirty_spans = []
+        for start, end in self._dirty_spans:
+            while start > 0 and not self.text[start-1].isspace():
+                start -= 1
+            while end < len(self.text) and not self.text[end].isspace():
+                end += 1
+            if dirty_spans and start <= dirty_spans[-1][1]:
+                dirty_spans[-1] = (dirty_spans[-1][0], max(end, dirty_spans[-1][1]))
+            else:
+                dirty_spans.append((start, end))
+        self._dirty_spans = dirty_spans
+
+
+    def __call__(self, text: str) -> int:
+        start = self.text.find(text) if len(text) > 0 else -1
+        if start == -1:
+            return self.token_counter(text)
+        else:
+            return self.count(start, start + len(text))
+        
+
+    def count(self, start: int, end: int) -> int:
+        """Token count of self.text[start:end]."""
+
+        # Count words with inserted strings separately.
+        token_count = 0
+        pos = start
+        for dirty_start, dirty_end in self._dirty_spans:
+            if dirty_end <= pos:
+                continue
+            if dirty_start >= end:
+                break
+            token_count += self._count_clean(pos, dirty_start)
+            token_count += self.token_counter.count_words(self.text[max(pos, dirty_start):min(end, dirty_end)])
+            pos = dirty_end
+        token_count += self._count_clean(pos, end)
+        
+        return token_count
+
+
+    def _count_clean(self, start: int, end: int) -> int:
+        """Token count of a slice of self.text without inserted strings."""
+        for text_pos, doc_pos, length in self._raw_parts:
+            if text_pos <= start and end <= text_pos + length:
+                return self.document.count(doc_pos + start - text_pos, doc_pos + end - text_pos)
+        
+        return 0 if start >= end else self.token_counter.count_words(self.text[start:end])
+
+
+class CompiledPromptTemplate:
+    """
+    Prompt template whose token count is precomputed for its fixed parts. 
+
+    The token count of a filled-in prompt is the precomputed token count of the words 
+    of the template without slots plus the token counts of the words with filled slots.
+    If the token counts of the tokenizer are not additive over words, the filled-in 
+    prompt is counted as a whole.
+
+    Args:
+        template (str): Template with slots in curly braces (e.g., "Which property is characterized by {quantity_span}?").
+        token_counter (TokenCounter): Token counter of the model the prompt is for.
+    """
+
+    def __init__(self, template: str, token_counter: TokenCounter):
+        self.template = template
+        self.token_counter = token_counter
+        words = WORD_REGEX.findall(template)
+        self.words_with_slots = [w for w in words if "{" in w]
+        self.fixed_token_count = sum(token_counter._count_word(w) for w in words if "{" not in w)
+
+
+    def format(self, **slots) -> str:
+        """Fill in the slots of the template."""
+        return self.template.format(**slots)
+    
+
+    def count_tokens(self, **slots) -> int:
+        """Token count of the template with filled in slots."""
+        if self.token_counter.counts_are_additive_over_words:
+            return self.fixed_token_count + sum(self.token_counter.count_words(w.format(**slots)) for w in self.words_with_slots)
+        else:
+            return self.token_counter(self.format(**slots))
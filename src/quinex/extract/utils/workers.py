@@ -0,0 +1,63 @@
+import threading
+import concurrent.futures
+from queue import Queue
+
+
+
+class WorkerPool:
+    """
+    Long-lived pool of workers, where each worker is bound to one model pipeline (e.g., one per device).
+
+    Tasks are submitted without specifying a worker. As soon as a worker is free, it takes the next
+    task from the shared queue and passes its rank to the task. Thus, each pipeline is only used by one
+    task at a time and the same workers are reused across calls instead of setting up new threads.
+
+    Args:
+        n_workers (int): Number of workers, that is, the number of pipelines the tasks are distributed over.
+        name (str): Name used as prefix for the worker threads.
+        rank_kwarg (str): Name of the keyword argument the worker rank is passed to the task as.
+        initializer (callable, optional): Called in each worker thread when it is started.
+        rank_initializer (callable, optional): Called with the rank as argument whenever a worker thread 
+            takes over a rank it did not process before (e.g., to set the CPU cores of the rank).
+    """
+
+    def __init__(self, n_workers: int, name: str="worker", rank_kwarg: str="device_rank", initializer=None, rank_initializer=None):
+
+        if n_workers < 1:
+            raise ValueError("Number of workers must be greater than 0.")
+
+        self.n_workers = n_workers
+        self.rank_kwarg = rank_kwarg
+        self.rank_initializer = rank_initializer
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix=name, initializer=initializer)
+        self._thread_state = threading.local()
+
+        # Ranks of the workers that are currently not processing a task.
+        self._free_ranks = Queue()
+        for rank in range(n_workers):
+            self._free_ranks.put(rank)
+
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Submit a task to the pool. The task is called as fn(*args, **kwargs)
+        with the rank of the worker executing it added to the keyword arguments.
+        """
+        return self._executor.submit(self._run, fn, *args, **kwargs)
+
+
+    def _run(self, fn, *args, **kwargs):
+        # There are as many threads as ranks, hence, a free rank is always available.
+        rank = self._free_ranks.get()
+        try:
+            if self.rank_initializer is not None and getattr(self._thread_state, "rank", None) != rank:
+                self.rank_initializer(rank)
+                self._thread_state.rank = rank
+            return fn(*args, **{self.rank_kwarg: rank}, **kwargs)
+        finally:
+            self._free_ranks.put(rank)
+
+
+    def shutdown(self, wait: bool=True):
+        """Shut down the workers after all submitted tasks are done."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,93 @@
+"""
+Process corpora with multiple processes to use all cores of a CPU node. The threads of a single
+pipeline share one GIL, which serializes the post-processing in Python (e.g., parsing and normalizing
+quantities). Here, each worker process owns a copy of the pipeline instead. The processes are forked
+after the models are loaded, so that the model weights are shared copy-on-write and not duplicated.
+Forking a process with running threads is unsafe (e.g., a lock held by another thread is never 
+released in the child). Hence, the workers of the pipeline are shut down before forking and 
+started again in the parent and in each worker process afterwards.
+"""
+import gc
+import os
+import multiprocessing
+from typing import Iterable
+import torch
+
+
+# Pipeline inherited by the forked worker processes.
+_worker_quinex = None
+_worker_kwargs = {}
+
+
+def get_nbr_available_cpus() -> int:
+    """Number of CPUs this process is allowed to run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(threads_per_process: int, kwargs: dict):
+    global _worker_kwargs
+    _worker_kwargs = kwargs
+
+    # Avoid oversubscription of cores by the intra-op threads of each process.
+    torch.set_num_threads(threads_per_process)
+
+    # The CPU layout of the pipeline was planned for all cores, whereas each process only gets its share.
+    _worker_quinex.cpu_layout = None
+
+    # Threads are not inherited by forked processes, hence, the workers of the pipeline are started again.
+    _worker_quinex._start_worker_pools()
+
+
+def _process_text(text: str) -> list[dict]:
+    return _worker_quinex(text, **_worker_kwargs)
+
+
+def map_texts(quinex, texts: Iterable[str], n_processes: int=None, threads_per_process: int=None, chunksize: int=1, **kwargs):
+    """
+    Apply the pipeline to the given texts in parallel processes and yield the results in input order.
+
+    Args:
+        quinex (Quinex): Pipeline with all models on CPU.
+        texts (Iterable[str]): Input texts.
+        n_processes (int, optional): Number of worker processes. Defaults to the number of available CPUs.
+        threads_per_process (int, optional): Number of torch threads per process. Defaults to the available CPUs divided by n_processes.
+        chunksize (int): Number of texts sent to a process at once.
+        **kwargs: Passed to Quinex.__call__ (e.g., skip_imprecise_quantities=True).
+
+    Yields:
+        list: Extracted quantitative statements of each text.
+    """
+    global _worker_quinex
+
+    if not quinex.use_cpu:
+        raise ValueError("Processing texts in parallel processes is only supported on CPU (use_cpu=True). On GPUs, use parallel_worker_device_map instead.")
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("Processing texts in parallel processes requires the fork start method, which is not available on this platform.")
+
+    nbr_cpus = get_nbr_available_cpus()
+    n_processes = n_processes or nbr_cpus
+    threads_per_process = threads_per_process or max(1, nbr_cpus // n_processes)
+
+    # Load all models before forking such that they are shared by the processes.
+    for name in quinex._model_factories:
+        quinex._get_model(name)
+
+    # Move the objects of the parent process to the permanent generation so that the garbage
+    # collector does not touch (and thus copy) their memory pages in the worker processes.
+    _worker_quinex = quinex
+    quinex._stop_worker_pools()
+    gc.collect()
+    gc.freeze()
+    try:
+        context = multiprocessing.get_context("fork")
+        pool = context.Pool(n_processes, initializer=_init_worker, initargs=(threads_per_process, kwargs))
+    finally:
+        gc.unfreeze()
+        quinex._start_worker_pools()
+
+    with pool:
+        yield from pool.imap(_process_text, texts, chunksize=chunksize)
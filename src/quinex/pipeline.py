@@ -1,16 +1,33 @@
 
+import asyncio
 from time import time
+import threading
 import concurrent.futures
 from queue import Queue
+from typing import Iterable
 import pandas as pd
 import torch
 import spacy
 import semchunk
 from text_processing_utils.batches import get_batches_of_roughly_equal_size
 from quinex import __version__, msg
+from quinex.config.presets import models as model_presets
 from quinex.extract.subtasks.quantity_span_identification import QuantitySpanIdentification
 from quinex.extract.subtasks.measurement_context_extraction import MeasurementContextExtraction
 from quinex.extract.subtasks.statement_type_classification import StatementTypeClassification
+from quinex.extract.utils.workers import WorkerPool
+from quinex.extract.utils.transformers import track_loaded_models, release_loaded_models
+from quinex.extract.utils.cpu import plan_cpu_layout, apply_cpu_assignment, format_cpu_layout
+from quinex.extract.utils.documents import get_windows, shift_char_offsets, get_quantity_start
+from quinex.extract.utils.constrained_decoding import IMPLICIT_ANSWERS
+from quinex.extract.utils.regions import get_allowed_regions, overlaps_regions, shift_regions
+
+
+# spaCy components that can be used for sentence boundary detection.
+SENTENCE_SEGMENTERS = ["parser", "senter", "sentencizer"]
+
+# Minimum confidence of the smaller models of a cascade to keep their predictions.
+DEFAULT_CASCADE_THRESHOLDS = {"quantity_model": 0.9, "context_model": 0.8}
 
 
 class Quinex:
@@ -19,7 +36,10 @@ class Quinex:
         # Models        
         quantity_model_name: str="JuelichSystemsAnalysis/quinex-quantity-v0-124M",
         context_model_name: str="JuelichSystemsAnalysis/quinex-context-v0-783M",
+        context_assistant_model_name: str=None, # If given, a smaller context model of the same family (e.g., JuelichSystemsAnalysis/quinex-context-v0-77M) drafts the answers of the context model (assisted generation, same answers as without it, one input at a time).
         statement_clf_model_name: str="JuelichSystemsAnalysis/quinex-statement-clf-v0-125M",
+        cascade_model_preset: str=None, # If given (e.g., "tiny" or "small"), the quantity and context models of this preset are applied first and only inputs they are unsure about are processed again with quantity_model_name and context_model_name.
+        cascade_thresholds: dict=None, # Minimum confidence of the smaller models to keep their predictions (lowest tag probability of any token per chunk and length-normalized answer probability). Given values override the defaults (see DEFAULT_CASCADE_THRESHOLDS).
         spacy_model_name: str="en_core_web_md",
         # Tasks
         enable_quantity_extraction: bool=True,
@@ -31,8 +51,20 @@ class Quinex:
         # Settings        
         max_new_tokens: int=50, # Maximum number of new tokens to generate for context extraction.
         sentence_by_sentence: bool=False, # Whether to process texts sentence by sentence instead of using larger chunks.
+        prefilter_chunks: bool=False, # Whether to skip chunks without any digit, number word, or constant instead of passing them to the quantity model.
+        window_size: int=None, # If given, texts longer than this number of chars are processed window by window in __call__ and stream() to keep the memory usage flat for very long texts (e.g., books).
+        window_overlap: int=5_000, # Number of chars by which each window is extended on both sides to provide context for the text at its borders.
+        sentence_segmenter: str="parser", # spaCy component used for sentence boundary detection: "parser" (most accurate), "senter" (statistical, faster), or "sentencizer" (rule-based, fastest).
+        extract_quantity_modifiers_per_document: bool=False, # Whether to extract quantity modifiers once per document instead of once per chunk. Faster for long texts, but context extraction only starts after all quantities are identified.
+        inference_backend: str="pipeline", # Either "pipeline" to use transformers pipelines, "torch" to use lean inference engines with identical outputs but less overhead, or "onnx"/"onnx-int8" to use ONNX Runtime (requires quinex[onnx]).
+        constrained_decoding: bool=False, # Whether the context model can only generate spans of its context (requires inference_backend "torch").
+        implicit_answers: list=None, # Answers to the property question the context model can generate with constrained decoding even if they are not in the context. Defaults to common properties implied by units (see IMPLICIT_ANSWERS in quinex/extract/utils/constrained_decoding.py). Pass an empty list to only allow spans of the context.
+        parallel_model_loading: bool=True, # Whether to load spaCy and the models concurrently to speed up initialization.
+        lazy_loading: bool=False, # Whether to load each model only when it is used for the first time.
         # Devices
-        use_cpu: bool=True, # If True, use CPU for all models and ignore parallel_worker_device_map.
+        use_cpu: bool=True, # If True, use CPU for all models and ignore parallel_worker_device_map unless plan_cpu_threads is True.
+        plan_cpu_threads: bool=False, # If True and use_cpu, use n_workers of parallel_worker_device_map on CPU and split the available cores between all workers instead of letting each worker use all cores.
+        pin_cpu_cores: bool=False, # If True and plan_cpu_threads, pin the threads of each worker to its cores (Linux only).
         parallel_worker_device_map: dict={
             'quantity_model': {'n_workers': 1, 'gpu_device_ranks': [0], 'batch_size': 256}, 
             'context_model': {'n_workers': 3, 'gpu_device_ranks': [0], 'batch_size': 64}, 
@@ -56,7 +88,17 @@ class Quinex:
         use_fp16 = False        
         dtype = torch.bfloat16 if use_fp16 else "auto"        
         self.sentence_by_sentence = sentence_by_sentence
+        self.extract_quantity_modifiers_per_document = extract_quantity_modifiers_per_document
+        self.prefilter_chunks = prefilter_chunks
+        self.window_size = window_size
+        self.window_overlap = window_overlap
         self.empty_dict_for_empty_prediction = empty_dict_for_empty_prediction
+        cascade_models = getattr(model_presets, cascade_model_preset) if cascade_model_preset is not None else {}
+        self.use_cascade = cascade_model_preset is not None
+        unknown_keys = set(cascade_thresholds or {}) - set(DEFAULT_CASCADE_THRESHOLDS)
+        if len(unknown_keys) > 0:
+            raise ValueError(f"Unknown keys in cascade_thresholds: {sorted(unknown_keys)}. Valid keys are {list(DEFAULT_CASCADE_THRESHOLDS)}.")
+        cascade_thresholds = {**DEFAULT_CASCADE_THRESHOLDS, **(cascade_thresholds or {})}
         
         # Tasks to perform.
         self.enable_quantity_extraction = enable_quantity_extraction
@@ -65,56 +107,93 @@ class Quinex:
         self.enable_statement_classification = enable_statement_classification
 
         # Get device info for parallel processing.
-        self.parallel_devices, self.nbr_parallel_workers, self.batch_sizes = self._get_device_info(parallel_worker_device_map, use_cpu)
-        
-        # Load spaCy NLP pipeline. Only "tok2vec" and "parser" are required for sentence boundary detection.
-        spacy_exclude_comps = ["entity_linker", "entity_ruler", "textcat", "textcat_multilabel", "lemmatizer", 
-            "trainable_lemmatizer", "morphologizer", "attribute_ruler", "senter", "sentencizer", "ner", 
-            "transformers", "tagger"]
-        self.nlp = spacy.load(spacy_model_name, exclude=spacy_exclude_comps)
+        self.parallel_devices, self.nbr_parallel_workers, self.batch_sizes = self._get_device_info(parallel_worker_device_map, use_cpu, plan_cpu_threads)
+
+        # Split the CPU cores between the workers of the enabled models.
+        self.pin_cpu_cores = pin_cpu_cores
+        if use_cpu and plan_cpu_threads:
+            self.cpu_layout = plan_cpu_layout({model_key: self.nbr_parallel_workers[model_key] for model_key, is_enabled in [
+                ("quantity_model", self.enable_quantity_extraction), 
+                ("context_model", self.enable_context_extraction), 
+                ("statement_clf_model", self.enable_statement_classification)
+            ] if is_enabled})
+            if verbose:
+                self.print_cpu_layout()
+        else:
+            self.cpu_layout = None
         
-        # Load quantity extraction pipeline.
+        # Functions to load spaCy and the models of the enabled tasks.
+        if sentence_segmenter not in SENTENCE_SEGMENTERS:
+            raise ValueError(f"Sentence segmenter must be one of {SENTENCE_SEGMENTERS}, got {sentence_segmenter}.")
+        self._model_factories = {"nlp": lambda: self._load_spacy_pipeline(spacy_model_name, sentence_segmenter)}
         if self.enable_quantity_extraction:
-            self.quantity_identifier = QuantitySpanIdentification(
+            self._model_factories["quantity_identifier"] = lambda: self._load_model(
+                "Quantity span identification",
+                QuantitySpanIdentification,
                 quantity_model_name,
                 spacy_pipeline=self.nlp, 
                 devices=self.parallel_devices["quantity_model"], 
                 batch_size=self.batch_sizes["quantity_model"], 
                 dtype=dtype, 
+                inference_backend=inference_backend,
+                cascade_model_name_or_path=cascade_models.get("quantity_model_name"),
+                cascade_threshold=cascade_thresholds["quantity_model"],
                 verbose=verbose, 
                 debug=debug
             )
-            if self.verbose:
-                msg.good(f"Quantity span identification model loaded!")
-        else:
-            self.quantity_identifier = None
-        
-        # Load context extraction pipeline.
-        if self.enable_context_extraction:            
-            self.measurement_context_extractor = MeasurementContextExtraction(
+        if self.enable_context_extraction:
+            self._model_factories["measurement_context_extractor"] = lambda: self._load_model(
+                "Measurement context extraction",
+                MeasurementContextExtraction,
                 context_model_name, 
                 devices=self.parallel_devices["context_model"], 
                 batch_size=self.batch_sizes["context_model"], 
                 max_new_tokens=max_new_tokens, 
+                assistant_model_path=context_assistant_model_name,
+                constrained_decoding=constrained_decoding,
+                implicit_answers=IMPLICIT_ANSWERS if implicit_answers is None else implicit_answers,
+                cascade_model_path=cascade_models.get("context_model_name"),
+                cascade_threshold=cascade_thresholds["context_model"],
                 enable_qualifier_extraction=self.enable_qualifier_extraction, 
                 empty_dict_for_empty_prediction=self.empty_dict_for_empty_prediction,
                 dtype=dtype, 
+                inference_backend=inference_backend,
+                qualifier_rank_initializers=self._get_qualifier_rank_initializers(),
                 verbose=verbose, 
                 debug=debug
             )
-            if self.verbose:
-                msg.good(f"Measurement context extraction model loaded!")
-        else:
-            self.measurement_context_extractor = None
+        if self.enable_statement_classification:
+            self._model_factories["statement_type_classifier"] = lambda: self._load_model(
+                "Statement classification",
+                StatementTypeClassification,
+                statement_clf_model_name, 
+                devices=self.parallel_devices["statement_clf_model"], 
+                batch_size=self.batch_sizes["statement_clf_model"], 
+                dtype=dtype, 
+                inference_backend=inference_backend,
+                verbose=verbose, 
+                debug=debug
+            )
+        self._models = {}
+        self._model_locks = {name: threading.Lock() for name in self._model_factories}
+        # Shared models and tokenizers loaded by this instance, which are released on close().
+        self._model_references = []
 
-        # Load statement classifcation model
-        if self.enable_statement_classification:            
-            self.statement_type_classifier = StatementTypeClassification(statement_clf_model_name, devices=self.parallel_devices["statement_clf_model"], batch_size=self.batch_sizes["statement_clf_model"], dtype=dtype, verbose=verbose, debug=debug)
-            if self.verbose:
-                msg.good(f"Statement classification model loaded!")
+        # Load spaCy and the models.
+        if lazy_loading:
+            msg.text("Models are loaded on first use.", color="grey")
+        elif parallel_model_loading:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(self._model_factories), thread_name_prefix="model_loading") as executor:
+                for future in [executor.submit(self._get_model, name) for name in self._model_factories]:
+                    future.result()
         else:
-            self.statement_type_classifier = None        
+            for name in self._model_factories:
+                self._get_model(name)
         
+        # Set up long-lived workers for each model which are reused across calls. The qualifier
+        # extraction workers are set up by the context model when it is loaded.
+        self._start_worker_pools(restart_qualifier_workers=False)
+
         print(f"""
              .-----------------------.
             |   ___________________   |
@@ -144,6 +223,159 @@ class Quinex:
             msg.text("Note that using CPUs instead of GPUs (use_cpu=False) is significantly slower.", color="grey")
             
 
+    @property
+    def nlp(self):
+        """spaCy pipeline used for sentence boundary detection."""
+        return self._get_model("nlp")
+    
+
+    @property
+    def quantity_identifier(self):
+        return self._get_model("quantity_identifier")
+    
+
+    @property
+    def measurement_context_extractor(self):
+        return self._get_model("measurement_context_extractor")
+    
+
+    @property
+    def statement_type_classifier(self):
+        return self._get_model("statement_type_classifier")
+    
+
+    def _get_model(self, name: str):
+        """Get spaCy or a model by its attribute name and load it if it is not loaded yet. Returns None for disabled tasks."""
+        if name not in self._model_factories:
+            return None
+        
+        if name not in self._models:
+            with self._model_locks[name]:
+                if name not in self._models:
+                    with track_loaded_models() as references:
+                        self._models[name] = self._model_factories[name]()
+                    self._model_references.extend(references)
+
+        return self._models[name]
+    
+
+    def _load_spacy_pipeline(self, spacy_model_name: str, sentence_segmenter: str="parser"):
+        # Load spaCy NLP pipeline with only the components required for sentence boundary detection.
+        spacy_exclude_comps = ["entity_linker", "entity_ruler", "textcat", "textcat_multilabel", "lemmatizer", 
+            "trainable_lemmatizer", "morphologizer", "attribute_ruler", "ner", "transformers", "tagger"]
+        if sentence_segmenter == "parser":
+            # Use "tok2vec" and "parser".
+            return spacy.load(spacy_model_name, exclude=spacy_exclude_comps + ["senter", "sentencizer"])
+        elif sentence_segmenter == "senter":
+            # The "senter" has its own tok2vec layer, but is disabled by default.
+            nlp = spacy.load(spacy_model_name, exclude=spacy_exclude_comps + ["tok2vec", "parser", "sentencizer"])
+            nlp.enable_pipe("senter")
+            return nlp
+        elif sentence_segmenter == "sentencizer":
+            # Use the tokenizer of the model with rule-based sentence boundaries.
+            nlp = spacy.load(spacy_model_name, exclude=spacy_exclude_comps + ["tok2vec", "parser", "senter", "sentencizer"])
+            nlp.add_pipe("sentencizer")
+            return nlp
+        else:
+            raise ValueError(f"Sentence segmenter must be one of {SENTENCE_SEGMENTERS}, got {sentence_segmenter}.")
+    
+
+    def _load_model(self, description: str, model_class, *args, **kwargs):
+        model = model_class(*args, **kwargs)
+        if self.verbose:
+            msg.good(f"{description} model loaded!")
+        return model
+
+
+    def _start_worker_pools(self, restart_qualifier_workers: bool=True):
+        """Set up long-lived workers for each model. Also used to replace the workers in forked processes, which do not inherit threads."""
+        self.worker_pools = {}
+        for model_key, is_enabled in [("quantity_model", self.enable_quantity_extraction), ("context_model", self.enable_context_extraction), ("statement_clf_model", self.enable_statement_classification)]:
+            if is_enabled:
+                self.worker_pools[model_key] = WorkerPool(self.nbr_parallel_workers[model_key], name=model_key, rank_initializer=self._get_cpu_rank_initializer(model_key))
+
+        # Restart the qualifier extraction workers of the context model if it is loaded already. 
+        # Otherwise, they are started with the rank initializers when the model is loaded.
+        if restart_qualifier_workers and self._models.get("measurement_context_extractor") is not None:
+            self._models["measurement_context_extractor"]._start_worker_pools(self._get_qualifier_rank_initializers())
+
+
+    def _stop_worker_pools(self):
+        """Shut down the workers of each model and the qualifier extraction workers after their tasks are done."""
+        for pool in self.worker_pools.values():
+            pool.shutdown()
+        
+        # Do not load the context model just to close it.
+        if self._models.get("measurement_context_extractor") is not None:
+            self._models["measurement_context_extractor"].close()
+
+        self.worker_pools = {}
+
+
+    def _get_qualifier_rank_initializers(self):
+        """
+        Get functions that apply the planned CPU cores of each context extraction worker rank to the calling thread.
+        Qualifiers are extracted with the cores of the context extraction worker that waits for them.
+        """
+        if self.cpu_layout is None:
+            return None
+        
+        return [lambda _, cpus=cpus: apply_cpu_assignment(cpus, pin=self.pin_cpu_cores) for cpus in self.cpu_layout["context_model"]]
+
+
+    def _get_cpu_rank_initializer(self, model_key: str):
+        """Get a function that applies the planned CPU cores of a worker rank of the given model to the calling thread."""
+        if self.cpu_layout is None:
+            return None
+        
+        return lambda rank: apply_cpu_assignment(self.cpu_layout[model_key][rank], pin=self.pin_cpu_cores)
+
+
+    def close(self):
+        """
+        Shut down the workers of the pipeline and release the shared models it loaded. The models 
+        are freed once no other Quinex instance uses them and this instance is not referenced anymore.
+        Alternatively, use the pipeline as a context manager:
+        
+            with Quinex() as quinex:
+                qclaims = quinex(text)
+        """
+        self._stop_worker_pools()
+        release_loaded_models(self._model_references)
+        self._model_references = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def print_cpu_layout(self):
+        """Print how the CPU cores are split between the workers of the models."""
+        if self.cpu_layout is None:
+            msg.warn("No CPU layout planned. Set use_cpu=True and plan_cpu_threads=True to split the cores between the workers.")
+        else:
+            msg.info("CPU cores per worker:")
+            msg.table(format_cpu_layout(self.cpu_layout), header=("Model", "Rank", "Threads", "Cores", "NUMA nodes"), divider=True)
+
+
+    def get_cascade_stats(self) -> dict:
+        """
+        Get how many inputs of the quantity and context model were processed and how many 
+        of them were escalated from the smaller to the larger model if a cascade is used.
+        """
+        stats = {}
+        if self.enable_quantity_extraction:
+            stats["quantity_model"] = self.quantity_identifier.get_cascade_stats()
+        if self.enable_context_extraction:
+            stats["context_model"] = self.measurement_context_extractor.get_cascade_stats()
+
+        return stats
+
+
     def print_gpu_memory_usage(self):
         if self.use_cpu:
             msg.warn("GPU memory usage not available if models are run on CPU.")
@@ -169,15 +401,51 @@ class Quinex:
             print("Number of chars:", len(text))
             print("Number of words:", len(doc))
 
-        # For quantity extraction, we split the text into 
-        # meaningful chunks that fit into the quantity model.        
+        semantic_boundaries = self._get_semantic_boundaries(doc)
+
+        return doc, semantic_boundaries
+
+
+    def preprocess_many(self, texts: Iterable[str], batch_size: int=64, n_process: int=1) -> list[tuple]:
+        """
+        Preprocess multiple texts at once. The texts are processed in batches with nlp.pipe(),
+        which is much faster than calling preprocess() for each of many short texts.
+
+        Args:
+            texts (Iterable[str]): Input texts.
+            batch_size (int): Number of texts spaCy processes at once.
+            n_process (int): Number of processes spaCy uses.
+
+        Returns:
+            list: Tuple of spaCy Doc and semantic boundaries for each text.
+        """
+        return [(doc, self._get_semantic_boundaries(doc)) for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+
+    def _get_semantic_boundaries(self, doc):
+        """
+        Get the semantic boundaries at which the text is split into 
+        meaningful chunks that fit into the quantity model.
+        """
         chunk_at = ["paragraphs", "sentences", "subparts", "tokens"]
         if self.sentence_by_sentence:            
             chunk_at.remove("paragraphs")
 
-        semantic_boundaries = semchunk.get_semantic_bounderies(doc, ordered_semantic_chunk_types=chunk_at)
+        return semchunk.get_semantic_bounderies(doc, ordered_semantic_chunk_types=chunk_at)
 
-        return doc, semantic_boundaries
+
+    def _get_quantity_chunks(self, text: str, semantic_boundaries, report: bool=True, allowed_regions: list=None) -> list[tuple]:
+        """
+        Split text into chunks that fit into the quantity model. Chunks outside the allowed regions 
+        (see get_allowed_regions()) and, optionally, chunks without any quantity cue are skipped.
+        """
+        chunks = semchunk.chunk(text, chunk_size=self.quantity_identifier.chunk_size, token_counter=self.quantity_identifier.token_counter.for_text(text), semantic_boundaries=semantic_boundaries, non_destructive=True, offsets=True, as_tuples=True)
+        if allowed_regions is not None:
+            chunks = [chunk for chunk in chunks if overlaps_regions(chunk[0][0], chunk[0][1], allowed_regions)]
+        if self.prefilter_chunks:
+            chunks = self.quantity_identifier.prefilter_chunks(chunks, report=report)
+
+        return chunks
 
 
     def get_quantities(self, text: str, skip_imprecise_quantities: bool=False, add_curation_fields: bool=False):
@@ -193,13 +461,20 @@ class Quinex:
             doc, semantic_boundaries = self.preprocess(text)
 
             # Get chunks.        
-            q_chunks = semchunk.chunk(text, chunk_size=self.quantity_identifier.chunk_size, token_counter=self.quantity_identifier.token_counter, semantic_boundaries=semantic_boundaries, non_destructive=True, offsets=True, as_tuples=True)
+            q_chunks = self._get_quantity_chunks(text, semantic_boundaries)
+            if len(q_chunks) == 0:
+                # All chunks were skipped by the prefilter.
+                msg.good(f"Identified 0 quantities in {round(time()-start, 3)} s.")
+                return []
 
             # Get batches of chunks.        
             q_batches = get_batches_of_roughly_equal_size(q_chunks, self.batch_sizes["quantity_model"])
             quantities = []
             for q_batch in q_batches:
-                quantities.extend(self.quantity_identifier(q_batch, 0, doc, skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields))
+                quantities.extend(self.quantity_identifier(q_batch, 0, doc, skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields, normalize=not self.extract_quantity_modifiers_per_document))
+            
+            if self.extract_quantity_modifiers_per_document:
+                quantities = self.quantity_identifier.normalize_quantities_of_document(quantities, doc, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields)
             
             msg.good(f"Identified {len(quantities)} quantities in {round(time()-start, 3)} s.")
             return quantities
@@ -219,11 +494,20 @@ class Quinex:
             doc, semantic_boundaries = self.preprocess(text)
             
             # Get quantities.            
-            q_chunks = semchunk.chunk(text, chunk_size=self.quantity_identifier.chunk_size, token_counter=self.quantity_identifier.token_counter, semantic_boundaries=semantic_boundaries, non_destructive=True, offsets=True, as_tuples=True)
+            q_chunks = self._get_quantity_chunks(text, semantic_boundaries)
+            if len(q_chunks) == 0:
+                # All chunks were skipped by the prefilter.
+                return []
             q_batches = get_batches_of_roughly_equal_size(q_chunks, self.batch_sizes["quantity_model"])
             quantities = []
             for i, q_batch in enumerate(q_batches):
-                quantities.extend(self.quantity_identifier(q_batch, i % self.nbr_parallel_workers["quantity_model"], doc, skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields))
+                quantities.extend(self.quantity_identifier(q_batch, i % self.nbr_parallel_workers["quantity_model"], doc, skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields, normalize=not self.extract_quantity_modifiers_per_document))
+
+            if self.extract_quantity_modifiers_per_document:
+                quantities = self.quantity_identifier.normalize_quantities_of_document(quantities, doc, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields)
+
+            if len(quantities) == 0:
+                return []
 
             # Get measurement context.
             c_batches = get_batches_of_roughly_equal_size(quantities, self.batch_sizes["context_model"])            
@@ -249,6 +533,9 @@ class Quinex:
         if 'normalized' in quantity:
             # Quantity is already normalized.
             quantity_spans = [quantity]
+        elif self.extract_quantity_modifiers_per_document:
+            # Quantity is not yet normalized. Do so reusing the sentence boundaries of the already created doc.
+            quantity_spans = self.quantity_identifier.normalize_quantities_of_document([quantity], doc, add_curation_fields=False, summarized_output=False)
         else:
             # Quantity is not yet normalized. Do so.
             # TODO: Use already created doc and not create doc from text again.
@@ -257,11 +544,9 @@ class Quinex:
             quantity_spans = self.quantity_identifier._parse_and_normalize_quantity_spans(quantity_spans, text, add_curation_fields=False, summarized_output=False)                
 
         # Perform context extraction and statement classification.
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.nbr_parallel_workers["context_model"]) as executor_b, \
-            concurrent.futures.ThreadPoolExecutor(max_workers=self.nbr_parallel_workers["statement_clf_model"]) as executor_c:            
-            context_future = executor_b.submit(self.measurement_context_extractor, quantity_spans, 0, text, semantic_boundaries, return_llm_inputs=return_llm_inputs, add_curation_fields=add_curation_fields)
-            if self.enable_statement_classification:
-                classification_future = executor_c.submit(self.statement_type_classifier, quantity_spans, 0, text, semantic_boundaries, add_curation_fields=add_curation_fields)
+        context_future = self.worker_pools["context_model"].submit(self.measurement_context_extractor, quantity_spans, text=text, semantic_boundaries=semantic_boundaries, return_llm_inputs=return_llm_inputs, add_curation_fields=add_curation_fields)
+        if self.enable_statement_classification:
+            classification_future = self.worker_pools["statement_clf_model"].submit(self.statement_type_classifier, quantity_spans, text=text, semantic_boundaries=semantic_boundaries, add_curation_fields=add_curation_fields)
         
         # Ensure all tasks are completed.
         concurrent.futures.wait([context_future])
@@ -285,7 +570,7 @@ class Quinex:
         return quantitative_statement
     
 
-    def __call__(self, text, skip_imprecise_quantities: bool=False, add_curation_fields: bool=False, return_llm_inputs: bool=False):
+    def __call__(self, text, skip_imprecise_quantities: bool=False, add_curation_fields: bool=False, return_llm_inputs: bool=False, include_regions: list=None, exclude_regions: list=None):
         """
         Apply pipeline to the given text.
 
@@ -294,6 +579,8 @@ class Quinex:
             skip_imprecise_quantities (bool): Whether to skip imprecise quantities (e.g., "several trees")
             add_curation_fields (bool): Whether to add curation fields to the output (for annotation purposes).
             return_llm_inputs (bool): Whether to return the model inputs used for context extraction (for debugging purposes).
+            include_regions (list, optional): Char spans of the text to extract quantities from, as (start, end) tuples or dicts with "start" and "end". Defaults to the whole text.
+            exclude_regions (list, optional): Char spans of the text to skip (e.g., reference lists or funding statements). Quantities overlapping them are ignored, whereas they may still serve as context.
             
         Returns:
             list: List of extracted quantitative statements.
@@ -329,6 +616,104 @@ class Quinex:
 
         """
 
+        predictions = []
+        for batch_predictions in self._generate_batches(text, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields, return_llm_inputs=return_llm_inputs, include_regions=include_regions, exclude_regions=exclude_regions, in_order=True):
+            predictions.extend(batch_predictions)
+            
+        return predictions
+
+
+    def stream(self, text, skip_imprecise_quantities: bool=False, add_curation_fields: bool=False, return_llm_inputs: bool=False, include_regions: list=None, exclude_regions: list=None, yield_batches: bool=False):
+        """
+        Apply pipeline to the given text and yield the results as soon as they are ready.
+
+        In contrast to `__call__`, results are not collected until the whole text is processed. 
+        Instead, each quantitative statement is yielded as soon as the context extraction and 
+        statement classification of its batch are done. Hence, the first results are available 
+        early and finished results do not have to be held in memory until the end. The order 
+        of the results is not guaranteed to follow the order of the quantities in the text.
+
+        Args:
+            text (str): Input text.
+            skip_imprecise_quantities (bool): Whether to skip imprecise quantities (e.g., "several trees")
+            add_curation_fields (bool): Whether to add curation fields to the output (for annotation purposes).
+            return_llm_inputs (bool): Whether to return the model inputs used for context extraction (for debugging purposes).
+            include_regions (list, optional): Char spans of the text to extract quantities from, as (start, end) tuples or dicts with "start" and "end". Defaults to the whole text.
+            exclude_regions (list, optional): Char spans of the text to skip (e.g., reference lists or funding statements). Quantities overlapping them are ignored, whereas they may still serve as context.
+            yield_batches (bool): Whether to yield lists of quantitative statements per finished batch instead of single statements.
+
+        Yields:
+            dict or list: Extracted quantitative statement or, if yield_batches is True, list of extracted quantitative statements.
+        """
+        for batch_predictions in self._generate_batches(text, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields, return_llm_inputs=return_llm_inputs, include_regions=include_regions, exclude_regions=exclude_regions, in_order=False):
+            if yield_batches:
+                yield batch_predictions
+            else:
+                yield from batch_predictions
+
+
+    async def astream(self, text, **kwargs):
+        """
+        Asynchronous variant of `stream` (e.g., for server-sent events in web services).
+        The pipeline runs in a separate thread so that the event loop is not blocked.
+        Takes the same arguments as `stream`.
+        """
+        loop = asyncio.get_running_loop()
+        generator = self.stream(text, **kwargs)
+        end_of_stream = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, generator, end_of_stream)
+                if item is end_of_stream:
+                    break
+                yield item
+        finally:
+            await loop.run_in_executor(None, generator.close)
+
+
+    def _generate_window_batches(self, text, in_order: bool=True, allowed_regions: list=None, **kwargs):
+        """
+        Apply pipeline to a long text window by window and yield the results of each batch of quantities.
+        Only one window is preprocessed at a time, so that the memory usage does not grow with the text length.
+        The quantities of each window are limited to those in its core before their context is analyzed and the 
+        char offsets of the results refer to the whole text. Windows whose core is outside the allowed regions 
+        (see get_allowed_regions()) are skipped.
+        For the other arguments, see `_generate_batches`.
+        """
+        windows = get_windows(text, self.window_size, self.window_overlap)
+        msg.text(f"Processing text with {len(text)} chars in {len(windows)} windows...", color="blue")
+        for start, core_start, core_end, end in windows:
+            if allowed_regions is not None and not overlaps_regions(core_start, core_end, allowed_regions):
+                continue
+            window_regions = shift_regions(allowed_regions, start, end) if allowed_regions is not None else None
+            for batch_predictions in self._generate_batches(text[start:end], in_order=in_order, use_windows=False, include_regions=window_regions, core_region=(core_start - start, core_end - start), **kwargs):
+                if len(batch_predictions) > 0:
+                    yield [shift_char_offsets(p, start) for p in batch_predictions]
+
+
+    def _generate_batches(self, text, skip_imprecise_quantities: bool=False, add_curation_fields: bool=False, return_llm_inputs: bool=False, include_regions: list=None, exclude_regions: list=None, in_order: bool=True, use_windows: bool=True, core_region: tuple=None):
+        """
+        Apply pipeline to the given text and yield the results of each batch of quantities
+        as soon as its context extraction and statement classification are done.
+
+        Args:
+            in_order (bool): Whether to yield batches in the order they were created 
+                             instead of the order they are finished.
+            use_windows (bool): Whether to process texts longer than the window size window by window.
+            core_region (tuple, optional): Char span (start, end) of the text. If given, only quantities starting 
+                                           within it are passed on to context extraction and statement classification.
+        
+        For the other arguments, see `__call__`.
+        """
+        # Get the regions of the text to extract quantities from.
+        allowed_regions = get_allowed_regions(len(text), include_regions, exclude_regions) if type(text) == str else None
+        if allowed_regions is not None and len(allowed_regions) == 0:
+            return
+
+        if use_windows and self.window_size is not None and type(text) == str and len(text) > self.window_size:
+            yield from self._generate_window_batches(text, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields, return_llm_inputs=return_llm_inputs, allowed_regions=allowed_regions, in_order=in_order)
+            return
+
         start_time = time()
         
         if self.batch_sizes["context_model"] != self.batch_sizes["statement_clf_model"]:
@@ -336,7 +721,7 @@ class Quinex:
         elif type(text) != str:
             raise ValueError("text must be a string.")
         elif len(text) == 0:
-            return []
+            return
         elif not self.enable_quantity_extraction:
             raise ValueError("Quantity spand identfication must be enabled to perform measurement context extraction and/or statement classification.")
         
@@ -344,7 +729,11 @@ class Quinex:
         doc, semantic_boundaries = self.preprocess(text)
 
         # Get chunks.        
-        q_chunks = semchunk.chunk(text, chunk_size=self.quantity_identifier.chunk_size, token_counter=self.quantity_identifier.token_counter, semantic_boundaries=semantic_boundaries, non_destructive=True, offsets=True, as_tuples=True)
+        q_chunks = self._get_quantity_chunks(text, semantic_boundaries, allowed_regions=allowed_regions)
+        if len(q_chunks) == 0:
+            # All chunks were skipped by the prefilter or are outside the allowed regions.
+            msg.good("Done! No quantities found.")
+            return
 
         # Get batches of chunks.        
         q_batches = get_batches_of_roughly_equal_size(q_chunks, self.batch_sizes["quantity_model"])
@@ -355,105 +744,283 @@ class Quinex:
         preproc_time = time() - start_time
         msg.text(f"Pre-processing done in {round(preproc_time, 3)} s.", color="grey")
         
-        context_extraction_results = []
-        classification_results = []
+        # Futures of context extraction and statement classification per batch of quantities.
+        pending_batches = []
+        is_in_core_region = lambda q: core_region is None or core_region[0] <= get_quantity_start(q) < core_region[1]
         quantities_queue = Queue()
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.nbr_parallel_workers["quantity_model"]) as executor_a, \
-            concurrent.futures.ThreadPoolExecutor(max_workers=self.nbr_parallel_workers["context_model"]) as executor_b, \
-            concurrent.futures.ThreadPoolExecutor(max_workers=self.nbr_parallel_workers["statement_clf_model"]) as executor_c:
+        nbr_predictions = 0
 
-            if self.verbose:
-                print(f"Set up parallel workers for quantity span identification, context extraction, and statement classification in {round(time()-start_time-preproc_time, 3)} s.")
-            
-            # Perform quantity span identification on batches on one or multiple devices in parallel.
-            quantity_futures = {executor_a.submit(self.quantity_identifier, q_batch, i % self.nbr_parallel_workers["quantity_model"], doc, skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields) for i, q_batch in enumerate(q_batches)}
+        # Perform quantity span identification on batches on one or multiple devices in parallel.
+        quantity_futures = {self.worker_pools["quantity_model"].submit(self.quantity_identifier, q_batch, doc=doc, skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields, normalize=not self.extract_quantity_modifiers_per_document, allowed_regions=allowed_regions) for q_batch in q_batches}
 
+        try:
             quantity_span_identification_completed = False
-            while quantity_futures:
+            while quantity_futures or pending_batches:
                 
-                # Collect completed tasks.
-                done, _ = concurrent.futures.wait(quantity_futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                # Wait for the next completed task unless a batch of quantities or a batch of results is ready already. 
+                # Only pending tasks are waited on, as finished ones would return immediately. If the batches are 
+                # yielded in order, only the first batch is relevant, as the following ones cannot be yielded before it.
+                waited_batches = pending_batches[:1] if in_order else pending_batches
+                is_ready = any(future.done() for future in quantity_futures) or any(all(future is None or future.done() for future in futures) for futures in waited_batches)
+                if not is_ready:
+                    batch_futures = {future for futures in waited_batches for future in futures if future is not None}
+                    concurrent.futures.wait({future for future in quantity_futures | batch_futures if not future.done()}, return_when=concurrent.futures.FIRST_COMPLETED)
+                done = {future for future in quantity_futures if future.done()}
                 
-                i = 0
                 for future in done:
                     
                     # Remove batch of found quantitites from set.
                     quantity_futures -= {future}
                     
-                    # Put quantities in queue.
+                    # Put quantities in queue. If quantities are normalized per document, 
+                    # all of them are needed for normalization and filtered afterwards.
                     for q in future.result():
-                        quantities_queue.put(q)
+                        if self.extract_quantity_modifiers_per_document or is_in_core_region(q):
+                            quantities_queue.put(q)
 
                     if len(quantity_futures) == 0:
                         quantity_span_identification_completed = True
+
+                        if self.extract_quantity_modifiers_per_document:
+                            # Add quantity modifiers and normalize all quantities of the document at once.
+                            quantities = [quantities_queue.get() for _ in range(quantities_queue.qsize())]
+                            quantities = self.quantity_identifier.normalize_quantities_of_document(quantities, doc, skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields)
+                            for q in filter(is_in_core_region, quantities):
+                                quantities_queue.put(q)
+
+                        # Release the spaCy Doc as it is only needed for quantity identification.
+                        doc = None
+
                         got_quantities_time = time() - start_time - preproc_time
                         msg.text(f"Identified {quantities_queue.qsize()} quantities in {round(got_quantities_time, 3)} s.", color="grey")
 
                         if not self.enable_context_extraction and not self.enable_statement_classification:                            
                             quantities = [quantities_queue.get() for _ in range(quantities_queue.qsize())]
                             msg.good(f"Done! Found {len(quantities)} quantities in {round(got_quantities_time, 3)} s.")
-                            return quantities
+                            yield quantities
+                            return
 
                     # Concurrently extract measurement context and classify statements as soon as a batch is ready 
                     # or quantity extraction is done and the last results did not fill a full batch.
-                    if quantities_queue.qsize() >= self.batch_sizes["context_model"] or quantity_span_identification_completed:                        
+                    # If quantities are normalized per document, we have to wait until all quantities are identified.
+                    batch_is_ready = quantities_queue.qsize() >= self.batch_sizes["context_model"] and not self.extract_quantity_modifiers_per_document
+                    if batch_is_ready or quantity_span_identification_completed:                        
                         while not quantities_queue.empty():
                             
-                            # Increment batch counter.
-                            i += 1
-
                             # Get batch of quantities.
                             batch_quantities = [quantities_queue.get() for _ in range(min(self.batch_sizes["context_model"], quantities_queue.qsize()))]
                             
+                            context_future = None
+                            classification_future = None
                             if self.enable_context_extraction:
                                 # Perform context extraction. 
-                                context_future = executor_b.submit(self.measurement_context_extractor, batch_quantities, i % self.nbr_parallel_workers["context_model"], text, semantic_boundaries, return_llm_inputs=return_llm_inputs, add_curation_fields=add_curation_fields)
-                                context_extraction_results.append(context_future)
+                                context_future = self.worker_pools["context_model"].submit(self.measurement_context_extractor, batch_quantities, text=text, semantic_boundaries=semantic_boundaries, return_llm_inputs=return_llm_inputs, add_curation_fields=add_curation_fields)
                             
                             if self.enable_statement_classification:
                                 # Perform statement classification in parallel.
-                                classification_future = executor_c.submit(self.statement_type_classifier, batch_quantities, i % self.nbr_parallel_workers["statement_clf_model"], text, semantic_boundaries, add_curation_fields=add_curation_fields)
-                                classification_results.append(classification_future)
+                                classification_future = self.worker_pools["statement_clf_model"].submit(self.statement_type_classifier, batch_quantities, text=text, semantic_boundaries=semantic_boundaries, add_curation_fields=add_curation_fields)
 
-        # Ensure all tasks are completed.
-        if self.enable_context_extraction:
-            concurrent.futures.wait(context_extraction_results)
-            processed_context_extraction_results = [future.result() for future in context_extraction_results]
-        
-        if self.enable_statement_classification:
-            concurrent.futures.wait(classification_results)
-            processed_classification_results = [future.result() for future in classification_results]
+                            pending_batches.append((context_future, classification_future))
+
+                # Yield the results of finished batches.
+                for futures in list(pending_batches):
+                    if all(future is None or future.done() for future in futures):
+                        pending_batches.remove(futures)
+                        batch_predictions = self._merge_batch_results(*futures)
+                        nbr_predictions += len(batch_predictions)
+                        yield batch_predictions
+                    elif in_order:
+                        break
+        finally:
+            # Do not start remaining tasks if the generator is closed early.
+            for future in quantity_futures | {future for futures in pending_batches for future in futures if future is not None}:
+                future.cancel()
 
         got_measurement_context_time = time() - start_time - got_quantities_time
         msg.text(f"Context analyzed in {round(got_measurement_context_time, 3)} s.", color="grey")
-        
-        if self.enable_context_extraction:
-            if self.enable_statement_classification:            
-                # Since we processed the batches in parallel and the order of results is not guranteed, we need to recombine the results.
-                processed_classification_results = [{(qc["quantity"]["start"], qc["quantity"]["end"]): qc["statement_classification"] for qc in batch_c} for batch_c in processed_classification_results]
-                for batch_b, batch_c in zip(processed_context_extraction_results, processed_classification_results):
-                    for quantitative_statement in batch_b:
-                        # Add statement classification results to quantities.            
-                        quantitative_statement["statement_classification"] = batch_c.pop((quantitative_statement["claim"]["quantity"]["start"], quantitative_statement["claim"]["quantity"]["end"]))
-                    
-                    assert len(batch_c) == 0            
 
-            predictions_per_batch = processed_context_extraction_results
+        if self.enable_context_extraction:
             message = "Done! Found {} quantitative statements in {} s."
         else:
-            predictions_per_batch = processed_classification_results
             message = "Done! Found and classified {} quantities in {} s."
+
+        msg.good(message.format(nbr_predictions, round(time()-start_time, 1)))
+
+
+    def _merge_batch_results(self, context_future, classification_future) -> list[dict]:
+        """Merge the context extraction and statement classification results of a batch of quantities."""
+
+        if context_future is None:
+            return classification_future.result()
+        
+        batch_predictions = context_future.result()
+        if classification_future is not None:
+            # Add statement classification results to quantities.
+            classifications = {(qc["quantity"]["start"], qc["quantity"]["end"]): qc["statement_classification"] for qc in classification_future.result()}
+            for quantitative_statement in batch_predictions:
+                quantitative_statement["statement_classification"] = classifications.pop((quantitative_statement["claim"]["quantity"]["start"], quantitative_statement["claim"]["quantity"]["end"]))
             
-        # Flatten batches of predictions.
-        predictions = [item for sublist in predictions_per_batch for item in sublist]
+            assert len(classifications) == 0
 
-        msg.good(message.format(len(predictions), round(time()-start_time, 1)))
+        return batch_predictions
+
+
+    def batch(self, texts: Iterable[str], skip_imprecise_quantities: bool=False, add_curation_fields: bool=False, return_llm_inputs: bool=False) -> list[list]:
+        """
+        Apply pipeline to multiple texts at once.
+
+        In contrast to calling the pipeline on each text individually, the chunks and quantities
+        of all texts are packed together into full batches for the quantity, context, and statement 
+        classification models. This is much faster for many short texts such as abstracts.
+
+        Args:
+            texts (Iterable[str]): Input texts.
+            skip_imprecise_quantities (bool): Whether to skip imprecise quantities (e.g., "several trees")
+            add_curation_fields (bool): Whether to add curation fields to the output (for annotation purposes).
+            return_llm_inputs (bool): Whether to return the model inputs used for context extraction (for debugging purposes).
+
+        Returns:
+            list: One list of extracted quantitative statements per text. The char offsets refer to the respective text.
+        """
+        start_time = time()
+
+        texts = list(texts)
+        if any(type(text) != str for text in texts):
+            raise ValueError("All texts must be strings.")
+        elif not self.enable_quantity_extraction:
+            raise ValueError("Quantity spand identfication must be enabled to perform measurement context extraction and/or statement classification.")
+        elif self.batch_sizes["context_model"] != self.batch_sizes["statement_clf_model"]:
+            msg.warn("The batch sizes for context extraction and statement classification are not equal. However, they are assumed to be equal. This may lead to suboptimal performance.")
+
+        print("")
+        msg.text(f"📚 Applying pipeline to {len(texts)} texts...", color="blue")
+
+        # Prepare texts. Empty texts are skipped.
+        doc_indices = [i for i, text in enumerate(texts) if len(text) > 0]
+        preprocessed = self.preprocess_many(texts[i] for i in doc_indices)
+        docs = {i: doc for i, (doc, _) in zip(doc_indices, preprocessed)}
+        semantic_boundaries = {i: boundaries for i, (_, boundaries) in zip(doc_indices, preprocessed)}
+
+        # Get chunks of all texts and remember which text they belong to.
+        q_chunks = []
+        nbr_skipped_chunks = self.quantity_identifier.nbr_skipped_chunks
+        for i in doc_indices:
+            chunks = self._get_quantity_chunks(texts[i], semantic_boundaries[i], report=False)
+            q_chunks.extend((i, chunk) for chunk in chunks)
+
+        if self.prefilter_chunks:
+            msg.text(f"Skipped {self.quantity_identifier.nbr_skipped_chunks - nbr_skipped_chunks} chunks without any digit, number word, or constant.", color="grey")
+
+        if len(q_chunks) == 0:
+            msg.good(f"Done! Found 0 quantitative statements in {len(texts)} texts in {round(time()-start_time, 1)} s.")
+            return [[] for _ in texts]
+
+        # Get batches of chunks across texts.
+        q_batches = get_batches_of_roughly_equal_size(q_chunks, self.batch_sizes["quantity_model"])
+
+        # Identify quantities.
+        quantity_futures = [self.worker_pools["quantity_model"].submit(self.quantity_identifier, [chunk for _, chunk in q_batch], doc=[docs[doc_idx] for doc_idx, _ in q_batch], skip_imprecise_quantities=skip_imprecise_quantities, filter=False, post_process=True, add_curation_fields=add_curation_fields, group_by_chunk=True, normalize=not self.extract_quantity_modifiers_per_document) for q_batch in q_batches]
+        
+        # Remember which text each quantity belongs to.
+        quantities = []
+        for q_batch, future in zip(q_batches, quantity_futures):
+            for (doc_idx, _), quantities_in_chunk in zip(q_batch, future.result()):
+                quantities.extend((doc_idx, q) for q in quantities_in_chunk)
+
+        if self.extract_quantity_modifiers_per_document:
+            # Add quantity modifiers and normalize the quantities of each text at once.
+            quantities_per_doc = {i: [] for i in doc_indices}
+            for doc_idx, q in quantities:
+                quantities_per_doc[doc_idx].append(q)
+            quantities = []
+            for doc_idx, quantities_in_doc in quantities_per_doc.items():
+                quantities_in_doc = self.quantity_identifier.normalize_quantities_of_document(quantities_in_doc, docs[doc_idx], skip_imprecise_quantities=skip_imprecise_quantities, add_curation_fields=add_curation_fields)
+                quantities.extend((doc_idx, q) for q in quantities_in_doc)
+
+        msg.text(f"Identified {len(quantities)} quantities in {round(time()-start_time, 3)} s.", color="grey")
+
+        if len(quantities) == 0:
+            msg.good(f"Done! Found 0 quantitative statements in {len(texts)} texts in {round(time()-start_time, 1)} s.")
+            return [[] for _ in texts]
+        
+        if not self.enable_context_extraction and not self.enable_statement_classification:
+            predictions = [(doc_idx, q) for doc_idx, q in quantities]
+        else:
+            # Get batches of quantities across texts.
+            c_batches = get_batches_of_roughly_equal_size(quantities, self.batch_sizes["context_model"])
             
-        return predictions
+            # Extract measurement context and classify statements.
+            context_futures = []
+            classification_futures = []
+            for c_batch in c_batches:
+                batch_quantities = [q for _, q in c_batch]
+                batch_texts = [texts[doc_idx] for doc_idx, _ in c_batch]
+                batch_semantic_boundaries = [semantic_boundaries[doc_idx] for doc_idx, _ in c_batch]
+                if self.enable_context_extraction:
+                    context_futures.append(self.worker_pools["context_model"].submit(self.measurement_context_extractor, batch_quantities, text=batch_texts, semantic_boundaries=batch_semantic_boundaries, return_llm_inputs=return_llm_inputs, add_curation_fields=add_curation_fields))
+                if self.enable_statement_classification:
+                    classification_futures.append(self.worker_pools["statement_clf_model"].submit(self.statement_type_classifier, batch_quantities, text=batch_texts, semantic_boundaries=batch_semantic_boundaries, add_curation_fields=add_curation_fields))
+            
+            predictions = []
+            for i, c_batch in enumerate(c_batches):
+                if self.enable_context_extraction:
+                    batch_predictions = context_futures[i].result()
+                    if self.enable_statement_classification:
+                        # Results of both models are in the same order as the quantities in the batch.
+                        for quantitative_statement, classification in zip(batch_predictions, classification_futures[i].result()):
+                            quantitative_statement["statement_classification"] = classification["statement_classification"]
+                else:
+                    batch_predictions = classification_futures[i].result()
+
+                predictions.extend((doc_idx, p) for (doc_idx, _), p in zip(c_batch, batch_predictions))
+
+        # Route predictions back to the texts they belong to.
+        predictions_per_text = [[] for _ in texts]
+        for doc_idx, p in predictions:
+            predictions_per_text[doc_idx].append(p)
+
+        if self.use_cascade:
+            for model_key, stats in self.get_cascade_stats().items():
+                msg.text(f"Escalated {stats['escalated_inputs']} of {stats['inputs']} inputs ({stats['escalation_rate']:.1%}) of the {model_key.replace('_', ' ')} to the larger model so far.", color="grey")
 
+        msg.good(f"Done! Found {len(predictions)} quantitative statements in {len(texts)} texts in {round(time()-start_time, 1)} s.")
 
-    def _get_device_info(self, parallel_worker_device_map, use_cpu):
-        if use_cpu:
+        return predictions_per_text
+
+
+    def map(self, texts: Iterable[str], n_processes: int=None, threads_per_process: int=None, chunksize: int=1, **kwargs):
+        """
+        Apply pipeline to many texts using multiple processes on CPU, each with its own copy of 
+        the pipeline. The model weights are shared between the processes. Use this to make use of 
+        all cores of a CPU node, as the threads of a single pipeline are limited by the GIL.
+
+            with Quinex(use_cpu=True) as quinex:
+                for qclaims in quinex.map(texts, n_processes=16):
+                    ...
+
+        Args:
+            texts (Iterable[str]): Input texts.
+            n_processes (int, optional): Number of worker processes. Defaults to the number of available CPUs.
+            threads_per_process (int, optional): Number of torch threads per process. Defaults to the available CPUs divided by n_processes.
+            chunksize (int): Number of texts sent to a process at once.
+            **kwargs: Passed to __call__ (e.g., skip_imprecise_quantities=True).
+
+        Yields:
+            list: Extracted quantitative statements of each text in input order.
+        """
+        from quinex.parallel import map_texts
+        yield from map_texts(self, texts, n_processes=n_processes, threads_per_process=threads_per_process, chunksize=chunksize, **kwargs)
+
+
+    def _get_device_info(self, parallel_worker_device_map, use_cpu, plan_cpu_threads: bool=False):
+        if use_cpu and plan_cpu_threads:
+            # Use the given number of workers on CPU. The cores are split between them later.
+            parallel_devices = {}
+            for model_name, device_info in parallel_worker_device_map.items():
+                if device_info["n_workers"] < 1:
+                    raise ValueError(f'Number of workers for {model_name} must be greater than 0.')
+                parallel_devices[model_name] = ["cpu"] * device_info["n_workers"]
+        elif use_cpu:
             # Use CPU without parallelization, assuming CPUs are only used for debugging.
             parallel_devices = {}
             for model_name in parallel_worker_device_map.keys():
@@ -0,0 +1,85 @@
+import pytest
+from quinex.extract.utils.transformers import load_transformers_pipe
+
+
+texts = [
+    "If you stack a gazillion giraffes, they would have a total height greater than 100 meters.",
+    "The bottom giraffe would be exposed to a pressure of more than 10^5 Pa (see Figure 3).",
+    "The liquefaction plants can produce LH2 by cooling hydrogen to −253 °C. This process is very energy-intensive, requiring up to 40% of the hydrogen's energy content (10–15 kWh/kgLH2) [25-28].",
+    "This is a test string without any quantitative claim.",
+    "In particular, a CO 2 uptake is observed when using SIFSIX-3-Cu (1.24 mmol⋅g -1 ) at 298 K adsorption temp. and 0.4 mbar partial pressure.",
+]
+
+
+def load_both_backends(task, model_name, **kwargs):
+    return [load_transformers_pipe(task, model_name, "cpu", batch_size=2, backend=backend, **kwargs) for backend in ["pipeline", "torch"]]
+
+
+def test_token_classification_parity():
+    """Test if the lean token classification engine gives the same quantity spans as the pipeline."""
+    pipe, engine = load_both_backends("token-classification", "JuelichSystemsAnalysis/quinex-quantity-v0-30M")
+    for expected, result in zip(pipe(texts), engine(texts)):
+        assert [(e["entity_group"], e["start"], e["end"], e["word"]) for e in result] == [(e["entity_group"], e["start"], e["end"], e["word"]) for e in expected]
+        assert [e["score"] for e in result] == pytest.approx([e["score"] for e in expected], rel=1e-5)
+
+
+def test_text_classification_parity():
+    """Test if the lean text classification engine gives the same labels and scores as the pipeline."""
+    pipe, engine = load_both_backends("text-classification", "JuelichSystemsAnalysis/quinex-statement-clf-v0-125M")
+    for expected, result in zip(pipe(texts), engine(texts)):
+        assert [e["label"] for e in result] == [e["label"] for e in expected]
+        assert [e["score"] for e in result] == pytest.approx([e["score"] for e in expected], rel=1e-5)
+
+
+def test_text2text_generation_parity():
+    """Test if the lean text2text generation engine generates the same texts as the pipeline."""
+    pipe, engine = load_both_backends("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-77M", max_new_tokens=50)
+    questions = [f"question: Which property or quality is characterized by {q}? context: {text}" for q, text in [("100 meters", texts[0]), ("10^5 Pa", texts[1]), ("−253 °C", texts[2]), ("40%", texts[2])]]
+    assert engine(questions) == pipe(questions)
+
+
+def test_assisted_generation_parity():
+    """Test if assisted generation with a smaller context model generates the same texts as the larger model alone."""
+    questions = [f"question: Which property or quality is characterized by {q}? context: {text}" for q, text in [("100 meters", texts[0]), ("10^5 Pa", texts[1]), ("−253 °C", texts[2]), ("40%", texts[2])]]
+    for backend in ["pipeline", "torch"]:
+        pipe = load_transformers_pipe("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-248M", "cpu", batch_size=2, backend=backend, max_new_tokens=50)
+        assisted_pipe = load_transformers_pipe("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-248M", "cpu", batch_size=2, backend=backend, max_new_tokens=50, assistant_model_path="JuelichSystemsAnalysis/quinex-context-v0-77M")
+        assert assisted_pipe(questions) == pipe(questions)
+
+
+def test_constrained_decoding():
+    """Test if constrained decoding only generates spans of the context."""
+    engine = load_transformers_pipe("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-77M", "cpu", batch_size=2, backend="torch", max_new_tokens=50, constrain_to_context=True)
+    contexts = [texts[0], texts[1], texts[2], texts[2]]
+    questions = [f"question: Which property or quality is characterized by {q}? context: {text}" for q, text in zip(["100 meters", "10^5 Pa", "−253 °C", "40%"], contexts)]
+    for prediction, context in zip(engine(questions), contexts):
+        surface = prediction["generated_text"].strip()
+        assert surface in context or surface[:1].swapcase() + surface[1:] in context
+
+
+def test_onnx_parity():
+    """Test if the ONNX Runtime backend gives the same predictions as the pipeline."""
+    pytest.importorskip("optimum.onnxruntime")
+
+    pipe, onnx_pipe = [load_transformers_pipe("token-classification", "JuelichSystemsAnalysis/quinex-quantity-v0-30M", "cpu", batch_size=2, backend=backend) for backend in ["pipeline", "onnx"]]
+    for expected, result in zip(pipe(texts), onnx_pipe(texts)):
+        assert [(e["entity_group"], e["start"], e["end"]) for e in result] == [(e["entity_group"], e["start"], e["end"]) for e in expected]
+        assert [e["score"] for e in result] == pytest.approx([e["score"] for e in expected], abs=1e-4)
+
+    pipe, onnx_pipe = [load_transformers_pipe("text-classification", "JuelichSystemsAnalysis/quinex-statement-clf-v0-125M", "cpu", batch_size=2, backend=backend) for backend in ["pipeline", "onnx"]]
+    for expected, result in zip(pipe(texts), onnx_pipe(texts)):
+        assert [e["label"] for e in result] == [e["label"] for e in expected]
+        assert [e["score"] for e in result] == pytest.approx([e["score"] for e in expected], abs=1e-4)
+
+    pipe, onnx_pipe = [load_transformers_pipe("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-77M", "cpu", batch_size=2, backend=backend, max_new_tokens=50) for backend in ["pipeline", "onnx"]]
+    questions = [f"question: Which property or quality is characterized by {q}? context: {text}" for q, text in [("100 meters", texts[0]), ("10^5 Pa", texts[1])]]
+    assert onnx_pipe(questions) == pipe(questions)
+
+
+def test_onnx_int8():
+    """Test if the int8 quantized ONNX models still find the quantities."""
+    pytest.importorskip("optimum.onnxruntime")
+
+    pipe, int8_pipe = [load_transformers_pipe("token-classification", "JuelichSystemsAnalysis/quinex-quantity-v0-30M", "cpu", batch_size=2, backend=backend) for backend in ["pipeline", "onnx-int8"]]
+    for expected, result in zip(pipe(texts), int8_pipe(texts)):
+        assert len(result) == len(expected)
@@ -1,7 +1,26 @@
 import re
 import json
+import time
+import threading
+import concurrent.futures
+import pytest
+import torch
 from pathlib import Path
 from quinex import Quinex
+from quinex.pipeline import SENTENCE_SEGMENTERS
+import spacy
+import semchunk
+from quinex.extract.utils.documents import get_centered_chunk_with_enclosed_span, adapt_semantic_boundaries
+from quinex.extract.subtasks.quantity_span_identification import may_contain_quantity
+from quinex.extract.utils.transformers import load_transformers_pipe, get_text_chunking_helper, _loaded_models
+from quinex.extract.utils.regions import normalize_regions, get_allowed_regions, overlaps_regions, is_within_regions, shift_regions
+from quinex.documents.papers.parse.helpers.transform import get_boilerplate_regions
+from quinex.extract.utils.constrained_decoding import IMPLICIT_ANSWERS
+from quinex.extract.utils.batches import sort_by_length, restore_order, get_token_budget_batches, apply_pipe_sorted_by_length
+from quinex.extract.utils.caching import CachedQuantityParser
+from quinex.extract.utils.workers import WorkerPool
+from quinex.extract.utils.cpu import plan_cpu_layout, format_cpu_layout
+from quinex.extract.utils.cascade import CascadePipe, get_token_classification_confidence, get_generation_confidence
 
 
 
@@ -77,6 +96,535 @@ def test_max_token_len_respected():
     assert quinex(long_test_str)
    
 
+def test_batch():
+    """Test if processing multiple texts at once gives the same results as processing them one by one."""
+    quinex = Quinex()
+    texts = [test_str, "", "This is a test string without any quantitative claim.", "The bottom giraffe is 5 meters tall."]
+    results = quinex.batch(texts, skip_imprecise_quantities=True)
+    assert len(results) == len(texts)
+    for text, result in zip(texts, results):
+        expected = quinex(text, skip_imprecise_quantities=True)
+        assert [qc["claim"]["quantity"]["text"] for qc in result] == [qc["claim"]["quantity"]["text"] for qc in expected]
+        for qc in result:
+            quantity = qc["claim"]["quantity"]
+            assert text[quantity["start"]:quantity["end"]] == quantity["text"]
+
+    # Batches without any chunk or quantity.
+    assert quinex.batch([]) == []
+    assert quinex.batch(["", ""]) == [[], []]
+    assert quinex.batch(["The sky is blue."]) == [[]]
+
+
+def test_map():
+    """Test if processing texts in parallel processes gives the same results as processing them one by one."""
+    quinex = Quinex()
+    texts = [test_str, "This is a test string without any quantitative claim.", "The bottom giraffe is 5 meters tall."]
+    expected = [quinex(text, skip_imprecise_quantities=True) for text in texts]
+    results = list(quinex.map(texts, n_processes=2, skip_imprecise_quantities=True))
+    assert json.dumps(results, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+    # The workers of the pipeline are started again after forking.
+    assert json.dumps(quinex(test_str, skip_imprecise_quantities=True), sort_keys=True) == json.dumps(expected[0], sort_keys=True)
+    quinex.close()
+
+
+def test_stream():
+    """Test if streaming the results gives the same quantitative statements as applying the pipeline at once."""
+    quinex = Quinex()
+    expected = quinex(test_str)
+    streamed = list(quinex.stream(test_str))
+    get_offsets = lambda qcs: sorted((qc["claim"]["quantity"]["start"], qc["claim"]["quantity"]["end"]) for qc in qcs)
+    assert get_offsets(streamed) == get_offsets(expected)
+
+
+def test_head_batch_finishes_last(monkeypatch):
+    """Test if the results are yielded in order without busy waiting if the first batch of quantities finishes last."""
+    worker_device_map = {
+        'quantity_model': {'n_workers': 1, 'gpu_device_ranks': [0], 'batch_size': 256},
+        'context_model': {'n_workers': 2, 'gpu_device_ranks': [0], 'batch_size': 1},
+        'qualifier_model': {'n_workers': 2, 'gpu_device_ranks': [0], 'batch_size': 1},
+        'statement_clf_model': {'n_workers': 1, 'gpu_device_ranks': [0], 'batch_size': 1},
+    }
+    quinex = Quinex(plan_cpu_threads=True, parallel_worker_device_map=worker_device_map)
+    expected = quinex(test_str, skip_imprecise_quantities=True)
+    assert len(expected) == 2
+
+    # Delay the context extraction of the first batch until the other one is done.
+    context_pool = quinex.worker_pools["context_model"]
+    submit = context_pool.submit
+    other_batch_done = threading.Event()
+    def submit_with_delay(fn, *args, **kwargs):
+        is_first_batch = not hasattr(submit_with_delay, "called")
+        submit_with_delay.called = True
+        def run(*args, **kwargs):
+            if is_first_batch:
+                other_batch_done.wait(timeout=10)
+                time.sleep(0.5)
+            result = fn(*args, **kwargs)
+            if not is_first_batch:
+                other_batch_done.set()
+            return result
+        return submit(run, *args, **kwargs)
+    monkeypatch.setattr(context_pool, "submit", submit_with_delay)
+
+    # Count how often the pipeline waits for tasks.
+    wait = concurrent.futures.wait
+    nbr_waits = [0]
+    def counting_wait(*args, **kwargs):
+        nbr_waits[0] += 1
+        return wait(*args, **kwargs)
+    monkeypatch.setattr(concurrent.futures, "wait", counting_wait)
+
+    result = quinex(test_str, skip_imprecise_quantities=True)
+    assert other_batch_done.is_set()
+    assert json.dumps(result, sort_keys=True) == json.dumps(expected, sort_keys=True)
+    assert nbr_waits[0] < 20
+
+
+def test_windowed_processing():
+    """Test if processing a long text window by window finds each quantity once with correct char offsets."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    quinex = Quinex(window_size=5_000, window_overlap=1_000)
+    result = quinex(long_test_str)
+    quantity_offsets = [(qc["claim"]["quantity"]["start"], qc["claim"]["quantity"]["end"]) for qc in result]
+    assert len(quantity_offsets) == len(set(quantity_offsets))
+    for qc in result:
+        for p in list(qc["claim"].values()) + list(qc["qualifiers"].values()):
+            if p is not None and p["is_implicit"] is False:
+                assert long_test_str[p["start"]:p["end"]] == p["text"]
+
+
+def test_window_first_marking():
+    """Test if enclosing quantities only within a window around them gives the same contexts and results as enclosing them in the whole text."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    quinex = Quinex(enable_statement_classification=True)
+    _, semantic_boundaries = quinex.preprocess(long_test_str)
+    quantities = quinex.get_quantities(long_test_str)
+    assert len(quantities) > 0
+    mce = quinex.measurement_context_extractor
+    stc = quinex.statement_type_classifier
+    for enclosing, chunk_size, token_counter in [(mce.quantity_enclosing, mce.chunk_size - 20, mce.token_counter), (stc.clf_quantity_enclosing, 200, stc.token_counter)]:
+        nbr_windows = 0
+        for q in quantities:
+            span = (q["start"], q["end"])
+            args = (long_test_str, span, enclosing, chunk_size, token_counter, semantic_boundaries)
+            assert get_centered_chunk_with_enclosed_span(*args, window_first=True) == get_centered_chunk_with_enclosed_span(*args, window_first=False)
+            window = token_counter.get_window(long_test_str, span, chunk_size)
+            if window is not None and window[1] - window[0] < len(long_test_str):
+                nbr_windows += 1
+        
+        # Make sure the chunks are actually selected within windows and not only in the whole text.
+        assert nbr_windows > 0
+
+    expected = quinex(long_test_str)
+    mce.window_first_marking = False
+    stc.window_first_marking = False
+    result = quinex(long_test_str)
+    assert json.dumps(result, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+def test_context_token_counter():
+    """Test if counting the tokens of contexts with enclosed spans based on the token counts of the words of the text gives the same counts."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    quinex = Quinex()
+    _, semantic_boundaries = quinex.preprocess(long_test_str)
+    mce = quinex.measurement_context_extractor
+    for q in quinex.get_quantities(long_test_str)[:50]:
+        _, context, context_wo_enclosing, context_char_offset = mce._get_property_input("Which property is characterized?", q, long_test_str, semantic_boundaries)
+        context_token_counter = mce._get_context_token_counter(long_test_str, context, context_wo_enclosing, context_char_offset, [(q, mce.quantity_enclosing)])
+        assert context_token_counter is not mce.token_counter
+        for start, end in [(0, len(context)), (0, len(context) // 2), (len(context) // 3, len(context))]:
+            assert context_token_counter(context[start:end]) == mce.token_counter(context[start:end])
+
+    # Only the word token counts of the most recent documents are kept.
+    token_counter = mce.token_counter
+    texts = [f"Document {i}: {test_str}" for i in range(token_counter._max_cached_documents + 2)]
+    for text in texts:
+        token_counter.for_text(text)
+    assert len(token_counter._documents) == token_counter._max_cached_documents
+    assert token_counter._get_document(texts[-1]) is token_counter._get_document(texts[-1])
+
+
+def test_prompt_template_token_count():
+    """Test if the precomputed token count of the question templates plus the token count of the context gives the token count of the whole prompt."""
+    quinex = Quinex()
+    _, semantic_boundaries = quinex.preprocess(test_str)
+    mce = quinex.measurement_context_extractor
+    assert {"property_question", "entity_question", "entity_question_fallback"} | set(mce.qualifier_question_keys) <= set(mce.prompt_templates)
+    for q in quinex.get_quantities(test_str):
+        _, context, _, _ = mce._get_property_input("Which property is characterized?", q, test_str, semantic_boundaries)
+        for property_span, entity_span in [("pressure", "the bottom giraffe"), ("hydrogen demand", "Germany's  industry")]:
+            # Unused slots are ignored by format().
+            slots = {"quantity_span": q["text"], "property_span": property_span, "entity_span": entity_span, "entity_or_property_span": entity_span, "is_or_are": "is"}
+            for template in mce.prompt_templates.values():
+                assert template.count_tokens(**slots) + mce.token_counter(context) == mce.token_counter(template.format(**slots) + context)
+
+
+def test_sentence_segmenters():
+    """Test if the sentence segmenters agree with the parser and if preprocessing many texts at once gives the same results as one by one."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    texts = [long_test_str, test_str, "The bottom giraffe is 5 meters tall."]
+    get_sentence_starts = lambda doc: {sent.start_char for sent in doc.sents}
+    kwargs = {"enable_quantity_extraction": False, "enable_context_extraction": False, "enable_qualifier_extraction": False, "enable_statement_classification": False}
+    quinex = {segmenter: Quinex(sentence_segmenter=segmenter, **kwargs) for segmenter in SENTENCE_SEGMENTERS}
+
+    # The parser gives the same semantic boundaries as the spaCy pipeline used before the segmenter was selectable.
+    nlp = spacy.load("en_core_web_md", exclude=["entity_linker", "entity_ruler", "textcat", "textcat_multilabel", "lemmatizer", 
+        "trainable_lemmatizer", "morphologizer", "attribute_ruler", "senter", "sentencizer", "ner", "transformers", "tagger"])
+    for text in texts:
+        assert quinex["parser"].preprocess(text)[1] == quinex["parser"]._get_semantic_boundaries(nlp(text))
+
+    reference_starts = get_sentence_starts(quinex["parser"].nlp(long_test_str))
+    for segmenter, quinex_ in quinex.items():
+        # Most sentence starts agree with the ones of the parser.
+        starts = get_sentence_starts(quinex_.nlp(long_test_str))
+        assert 2 * len(starts & reference_starts) / (len(starts) + len(reference_starts)) > 0.8
+
+        for (doc, semantic_boundaries), text in zip(quinex_.preprocess_many(texts, batch_size=2), texts):
+            expected_doc, expected_semantic_boundaries = quinex_.preprocess(text)
+            assert doc.text == text
+            assert get_sentence_starts(doc) == get_sentence_starts(expected_doc)
+            assert semantic_boundaries == expected_semantic_boundaries
+        quinex_.close()
+
+
+def test_adapt_semantic_boundaries():
+    """Test if adapting only the semantic boundaries around a window gives the same result as adapting all of them."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    _, semantic_boundaries = Quinex(enable_quantity_extraction=False, enable_context_extraction=False, enable_qualifier_extraction=False, enable_statement_classification=False).preprocess(long_test_str)
+    for char_offset in range(0, len(long_test_str), 997):
+        for length, added_chars_len in [(0, 0), (500, 0), (2_000, 4), (len(long_test_str), 8)]:
+            kwargs = {"added_chars_len": added_chars_len, "added_chars_end_pos": char_offset + length // 2}
+            expected = semchunk.adapt_semantic_boundaries(semantic_boundaries, char_offset, length, **kwargs)
+            assert adapt_semantic_boundaries(semantic_boundaries, char_offset, length, **kwargs) == expected
+
+
+def test_cascade():
+    """
+    Test if a cascade gives the results of the smaller model if nothing is escalated, those of the larger 
+    model if everything is, and only replaces the predictions of low confidence for thresholds in between.
+    """
+    kwargs = {"enable_context_extraction": False, "enable_qualifier_extraction": False}
+    get_offsets = lambda quantities: [(q["start"], q["end"]) for q in quantities]
+    small = get_offsets(Quinex(quantity_model_name="JuelichSystemsAnalysis/quinex-quantity-v0-30M", **kwargs).get_quantities(test_str))
+    large = get_offsets(Quinex(**kwargs).get_quantities(test_str))
+    for threshold, expected, escalation_rate in [(0.0, small, 0.0), (1.1, large, 1.0)]:
+        quinex = Quinex(cascade_model_preset="tiny", cascade_thresholds={"quantity_model": threshold, "context_model": threshold}, **kwargs)
+        assert get_offsets(quinex.get_quantities(test_str)) == expected
+        assert quinex.get_cascade_stats()["quantity_model"]["escalation_rate"] == escalation_rate
+
+    # Thresholds that are not given default to those of DEFAULT_CASCADE_THRESHOLDS.
+    quinex = Quinex(cascade_model_preset="tiny", cascade_thresholds={"quantity_model": 0.0}, **kwargs)
+    assert quinex.quantity_identifier.quantity_pipelines[0].threshold == 0.0
+
+    # The confidence of the quantity model is the lowest probability of the predicted tag of any token.
+    small_pipe = load_transformers_pipe("token-classification", "JuelichSystemsAnalysis/quinex-quantity-v0-30M", "cpu", batch_size=2, backend="torch", return_scores=True)
+    large_pipe = load_transformers_pipe("token-classification", "JuelichSystemsAnalysis/quinex-quantity-v0-124M", "cpu", batch_size=2, backend="torch")
+    chunks = [sentence + "." for sentence in test_str.split(". ")] + ["We had a dozen of problems to discuss and presented several solutions.", "This is a test string without any quantitative claim."]
+    confidences = [get_token_classification_confidence(prediction) for prediction in small_pipe(chunks)]
+    for chunk, confidence in zip(chunks, confidences):
+        encodings = small_pipe.tokenizer(chunk, return_special_tokens_mask=True, return_tensors="pt")
+        with torch.inference_mode():
+            probs = torch.softmax(small_pipe.model(input_ids=encodings["input_ids"], attention_mask=encodings["attention_mask"]).logits[0], dim=-1)
+        is_token = encodings["special_tokens_mask"][0] == 0
+        assert confidence == pytest.approx(probs.max(dim=-1).values[is_token].min().item(), rel=1e-5)
+    assert_only_low_confidence_escalated(small_pipe, large_pipe, chunks, confidences, get_token_classification_confidence)
+
+    # The confidence of the context model is the length-normalized probability of the generated answer.
+    small_pipe = load_transformers_pipe("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-77M", "cpu", batch_size=2, backend="torch", return_scores=True)
+    large_pipe = load_transformers_pipe("text2text-generation", "JuelichSystemsAnalysis/quinex-context-v0-248M", "cpu", batch_size=2, backend="torch")
+    questions = [f"question: {question} context: {test_str}" for question in ["Which property or quality is characterized by 100 meters?", "Which property or quality is characterized by 10^5 Pa?", "Which entity is characterized by 100 meters?", "Which entity is characterized by 10^5 Pa?", "Where is 10^5 Pa measured?"]]
+    predictions = small_pipe(questions)
+    confidences = [get_generation_confidence(prediction) for prediction in predictions]
+    tokenizer = small_pipe.tokenizer
+    for question, prediction, confidence in zip(questions, predictions, confidences):
+        # Score the generated answer (including EOS, without the decoder start token) with teacher forcing.
+        input_ids = tokenizer(small_pipe.prefix + question, return_tensors="pt")["input_ids"]
+        with torch.inference_mode():
+            labels = small_pipe.model.generate(input_ids=input_ids, max_new_tokens=small_pipe.max_new_tokens)[:, 1:]
+            log_probs = torch.log_softmax(small_pipe.model(input_ids=input_ids, labels=labels).logits[0], dim=-1)
+        assert tokenizer.decode(labels[0], skip_special_tokens=True, clean_up_tokenization_spaces=False) == prediction["generated_text"]
+        token_log_probs = log_probs.gather(-1, labels[0].unsqueeze(-1)).squeeze(-1)
+        assert confidence == pytest.approx(torch.exp(token_log_probs.mean()).item(), rel=1e-4)
+    assert_only_low_confidence_escalated(small_pipe, large_pipe, questions, confidences, get_generation_confidence)
+
+
+def assert_only_low_confidence_escalated(small_pipe, large_pipe, inputs, confidences, get_confidence):
+    """Check that a cascade with a threshold between the lowest and the highest confidence only replaces the predictions below it."""
+    assert min(confidences) < max(confidences)
+    threshold = sorted(confidences)[len(confidences) // 2]
+    small_predictions = small_pipe(inputs)
+    large_predictions = large_pipe(inputs)
+    cascade = CascadePipe(small_pipe, large_pipe, threshold, get_confidence)
+    get_output = lambda prediction: [(e["start"], e["end"]) for e in prediction] if isinstance(prediction, list) else prediction["generated_text"]
+    for prediction, small_prediction, large_prediction, confidence in zip(cascade(inputs), small_predictions, large_predictions, confidences):
+        assert get_output(prediction) == get_output(large_prediction if confidence < threshold else small_prediction)
+    assert 0 < cascade.nbr_escalated_inputs < len(inputs)
+    assert cascade.nbr_escalated_inputs == sum(confidence < threshold for confidence in confidences)
+
+
+def test_quantity_modifiers_per_document():
+    """Test if extracting quantity modifiers once per document gives the same quantities as doing so per chunk."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    kwargs = {"enable_context_extraction": False, "enable_qualifier_extraction": False}
+    for skip_imprecise_quantities in [False, True]:
+        expected = Quinex(**kwargs).get_quantities(long_test_str, skip_imprecise_quantities=skip_imprecise_quantities)
+        result = Quinex(extract_quantity_modifiers_per_document=True, **kwargs).get_quantities(long_test_str, skip_imprecise_quantities=skip_imprecise_quantities)
+        assert len(expected) > 0
+        assert json.dumps(result, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+def test_cascade_chunk_size():
+    """Test if the chunks of the quantity cascade fit into both models."""
+    with open(Path(__file__).parent / "test_paper.txt", "r") as f:
+        long_test_str = f.read()
+
+    quinex = Quinex(cascade_model_preset="tiny", enable_context_extraction=False, enable_qualifier_extraction=False)
+    _, semantic_boundaries = quinex.preprocess(long_test_str)
+    cascade_pipe = quinex.quantity_identifier.quantity_pipelines[0]
+    for pipe in [cascade_pipe.pipe, cascade_pipe.escalation_pipe]:
+        token_counter, chunk_size = get_text_chunking_helper(pipe.model.name_or_path, task="token-classification")
+        for (start, end), _ in quinex._get_quantity_chunks(long_test_str, semantic_boundaries):
+            assert token_counter(long_test_str[start:end]) <= chunk_size
+
+
+def test_prefilter_chunks():
+    """Test if skipping chunks without any quantity cue gives the same quantities."""
+    text = "This section describes the methodology used in the remainder of this study.\n\n" + test_str
+    expected = Quinex(enable_context_extraction=False, enable_qualifier_extraction=False).get_quantities(text)
+    result = Quinex(enable_context_extraction=False, enable_qualifier_extraction=False, prefilter_chunks=True).get_quantities(text)
+    assert [(q["start"], q["end"]) for q in result] == [(q["start"], q["end"]) for q in expected]
+
+    # All chunks of a text without any quantity cue are skipped.
+    quinex = Quinex(enable_qualifier_extraction=False, prefilter_chunks=True)
+    assert quinex.get_quantities("This section describes the methodology used in the remainder of this study.") == []
+    assert quinex.simple_call("This section describes the methodology used in the remainder of this study.") == []
+
+
+def test_prefilter_multi_word_imprecise_quantities():
+    """Test if chunks whose only quantity is an imprecise quantity of multiple words are not skipped."""
+    for text in ["They planted a large number of trees.", "We have lots of ideas.", "This requires a great deal of work.", "Add a small amount of salt."]:
+        assert may_contain_quantity(text)
+    assert not may_contain_quantity("This section describes the methodology used in the remainder of this study.")
+
+    text = "This section describes the methodology used in the remainder of this study.\n\nThey planted a large number of trees."
+    expected = Quinex(enable_context_extraction=False, enable_qualifier_extraction=False).get_quantities(text)
+    result = Quinex(enable_context_extraction=False, enable_qualifier_extraction=False, prefilter_chunks=True).get_quantities(text)
+    assert len(expected) > 0
+    assert [(q["start"], q["end"]) for q in result] == [(q["start"], q["end"]) for q in expected]
+
+
+def test_regions():
+    """Test the normalization, combination, and lookup of regions."""
+    assert normalize_regions([{"start": 50, "end": 60}, (10, 20), (15, 30), (30, 35), (40, 40)]) == [(10, 35), (50, 60)]
+    assert get_allowed_regions(100) is None
+    assert get_allowed_regions(100, exclude_regions=[{"start": 10, "end": 20}, (15, 30), (50, 60)]) == [(0, 10), (30, 50), (60, 100)]
+    assert get_allowed_regions(100, include_regions=[(0, 40), (70, 90)], exclude_regions=[(30, 80)]) == [(0, 30), (80, 90)]
+    assert get_allowed_regions(100, exclude_regions=[(0, 100)]) == []
+
+    regions = [(0, 10), (30, 50), (60, 100)]
+    assert is_within_regions(0, 10, regions)
+    assert is_within_regions(35, 40, regions)
+    assert not is_within_regions(5, 15, regions)
+    assert not is_within_regions(10, 30, regions)
+    assert not is_within_regions(45, 65, regions)
+    assert overlaps_regions(5, 15, regions)
+    assert overlaps_regions(45, 65, regions)
+    assert not overlaps_regions(10, 30, regions)
+
+    assert shift_regions(regions, 20, 70) == [(10, 30), (40, 50)]
+    assert shift_regions(regions, 10, 30) == []
+
+
+def test_boilerplate_regions():
+    """Test if only sections with boilerplate headers and citations are found as boilerplate regions."""
+    headers = ["1. Introduction", "2. Results and references", "3. Fundamentals", "Acknowledgements", "Conflicts of interest", "A.1 Nomenclature", "References"]
+    text = ""
+    annotations = {"section_header": [], "citations": []}
+    for header in headers:
+        text += "\n"
+        annotations["section_header"].append({"start": len(text), "end": len(text) + len(header)})
+        text += header + "\nSome text [1].\n\n"
+        annotations["citations"].append({"start": len(text) - 6, "end": len(text) - 3})
+
+    regions = get_boilerplate_regions(text, annotations, skip_citations=False)
+    boilerplate_headers = [text[region["start"]:region["end"]].split("\n")[0] for region in regions]
+    assert boilerplate_headers == ["Acknowledgements", "Conflicts of interest", "A.1 Nomenclature", "References"]
+    assert regions[-1]["end"] == len(text)
+    assert [region["end"] for region in regions[:-1]] == [region["start"] for region in regions[1:]]
+
+    regions = get_boilerplate_regions(text, annotations)
+    assert all(text[region["start"]:region["end"]] == "[1]" for region in regions[4:])
+    assert len(regions) == 4 + len(headers)
+
+
+def test_exclude_regions():
+    """Test if quantities in excluded regions are skipped while the other results stay the same."""
+    quinex = Quinex()
+    expected = quinex(test_str, skip_imprecise_quantities=True)
+    first_sentence_end = test_str.index(". ") + 1
+    result = quinex(test_str, skip_imprecise_quantities=True, exclude_regions=[{"start": 0, "end": first_sentence_end}])
+    assert [qc["claim"]["quantity"]["text"] for qc in result] == ["10^5 Pa"]
+    assert json.dumps(result, sort_keys=True) == json.dumps(expected[1:], sort_keys=True)
+    assert quinex(test_str, exclude_regions=[(0, len(test_str))]) == []
+
+
+def test_constrained_decoding_implicit_answers():
+    """Test if the implicit answers are passed on to constrained decoding of the context model."""
+    kwargs = {"inference_backend": "torch", "constrained_decoding": True, "enable_qualifier_extraction": False}
+    constraint = Quinex(**kwargs).measurement_context_extractor.measurement_context_pipelines[0].context_constraint
+    assert constraint.allowed_answers == IMPLICIT_ANSWERS
+    constraint = Quinex(implicit_answers=["temperature"], **kwargs).measurement_context_extractor.measurement_context_pipelines[0].context_constraint
+    assert constraint.allowed_answers == ["temperature"]
+
+    # Implicit answers are only allowed for the property question.
+    assert constraint.get_matching_text("question: Which property or quality is characterized by 5 K? context: It was cooled by 5 K.") == "It was cooled by 5 K.\x00temperature"
+    assert constraint.get_matching_text("question: Which entity's temperature is characterized by 5 K? context: It was cooled by 5 K.") == "It was cooled by 5 K."
+
+
+def test_worker_pool():
+    """Test if each task gets a rank that no other task uses at the same time and if shutting down waits for all tasks."""
+    n_workers = 3
+    ranks_in_use = set()
+    used_ranks = []
+    initialized = []
+    lock = threading.Lock()
+    def task(i, device_rank):
+        with lock:
+            assert device_rank not in ranks_in_use
+            ranks_in_use.add(device_rank)
+            used_ranks.append(device_rank)
+        time.sleep(0.01)
+        with lock:
+            ranks_in_use.remove(device_rank)
+        return i
+
+    def rank_initializer(rank):
+        with lock:
+            initialized.append((threading.get_ident(), rank))
+
+    pool = WorkerPool(n_workers, name="test", rank_initializer=rank_initializer)
+    futures = [pool.submit(task, i) for i in range(30)]
+    pool.shutdown(wait=True)
+    assert all(future.done() for future in futures)
+    assert [future.result() for future in futures] == list(range(30))
+    assert len(used_ranks) == 30 and set(used_ranks) <= set(range(n_workers))
+    assert len(ranks_in_use) == 0
+    # Each thread initializes a rank only when it takes over another rank than before.
+    for thread_id in {thread_id for thread_id, _ in initialized}:
+        ranks = [rank for other_thread_id, rank in initialized if other_thread_id == thread_id]
+        assert all(rank != previous_rank for previous_rank, rank in zip(ranks, ranks[1:]))
+    with pytest.raises(RuntimeError):
+        pool.submit(task, 30)
+
+
+def test_batches_sorted_by_length():
+    """Test if sorting inputs by length and batching them under a token budget keeps all inputs and their order."""
+    inputs = ["a" * length for length in [5, 1, 12, 3, 3, 40, 7, 2, 9]]
+    sorted_inputs, order = sort_by_length(inputs)
+    assert [len(input) for input in sorted_inputs] == sorted(len(input) for input in inputs)
+    assert restore_order(sorted_inputs, order) == inputs
+
+    for max_batch_tokens in [1, 10, 20, 100]:
+        batches = get_token_budget_batches(sorted_inputs, max_batch_tokens, max_batch_size=4)
+        assert [input for batch in batches for input in batch] == sorted_inputs
+        for batch in batches:
+            assert 0 < len(batch) <= 4
+            # Only a single input that is longer than the budget on its own may exceed it.
+            assert len(batch) * max(len(input) for input in batch) <= max_batch_tokens or (len(batch) == 1 and len(batch[0]) > max_batch_tokens)
+
+    pipe = lambda inputs, batch_size=None: [len(input) for input in inputs]
+    pipe._batch_size = 4
+    assert apply_pipe_sorted_by_length(pipe, inputs, max_batch_tokens=20) == [len(input) for input in inputs]
+
+
+def test_cached_quantity_parser():
+    """Test if cached parse results are isolated from modifications and keyed by the parser version."""
+    class CountingParser:
+        def __init__(self):
+            self.nbr_calls = 0
+        def parse(self, text):
+            self.nbr_calls += 1
+            return {"text": text, "normalized_quantities": [{"value": {"normalized": {"numeric_value": 10}}}]}
+
+    parser = CountingParser()
+    cached_parser = CachedQuantityParser(parser)
+    result = cached_parser.parse("10 %")
+    result["normalized_quantities"][0]["value"]["normalized"]["numeric_value"] = 20
+    result["text"] = "modified"
+    assert cached_parser.parse("10 %") == {"text": "10 %", "normalized_quantities": [{"value": {"normalized": {"numeric_value": 10}}}]}
+    assert parser.nbr_calls == 1
+    cached_parser.parse("2020")
+    assert cached_parser.get_stats() == {"hits": 1, "misses": 2, "hit_rate": 1/3, "size": 2}
+
+    # Results of another version of quinex-utils are not reused.
+    cached_parser.parser_version = "other version"
+    cached_parser.parse("10 %")
+    assert parser.nbr_calls == 3
+    assert cached_parser.get_stats()["misses"] == 3
+    assert cached_parser.nbr_calls == 3  # Attributes are passed through to the wrapped parser.
+
+
+def test_plan_cpu_layout():
+    """Test if the CPU cores are split between the workers without sharing cores or spanning NUMA nodes unnecessarily."""
+    numa_nodes = [list(range(0, 8)), list(range(8, 16))]
+    layout = plan_cpu_layout({"quantity_model": 1, "context_model": 3}, cpus=list(range(16)), numa_nodes=numa_nodes)
+    assert layout == {"quantity_model": [[0, 1, 2, 3]], "context_model": [[4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
+    assert format_cpu_layout(layout, numa_nodes=numa_nodes) == [
+        ("quantity_model", 0, 4, "0-3", "0"),
+        ("context_model", 0, 4, "4-7", "0"),
+        ("context_model", 1, 4, "8-11", "1"),
+        ("context_model", 2, 4, "12-15", "1"),
+    ]
+
+    # Fewer workers than NUMA nodes.
+    layout = plan_cpu_layout({"quantity_model": 1}, cpus=list(range(16)), numa_nodes=numa_nodes)
+    assert layout == {"quantity_model": [list(range(16))]}
+    assert format_cpu_layout(layout, numa_nodes=numa_nodes) == [("quantity_model", 0, 16, "0-15", "0,1")]
+
+    # More workers than cores.
+    layout = plan_cpu_layout({"quantity_model": 1, "context_model": 2}, cpus=[0, 1], numa_nodes=[[0, 1]])
+    assert layout == {"quantity_model": [[0]], "context_model": [[1], [0]]}
+
+    assert plan_cpu_layout({}, cpus=[0, 1], numa_nodes=[[0, 1]]) == {}
+
+
+def test_close_releases_models():
+    """Test if closing a pipeline only releases the shared models once no other pipeline uses them."""
+    quinex = Quinex()
+    other_quinex = Quinex()
+    keys = {key for _, key in quinex._model_references if key in _loaded_models}
+    assert len(keys) > 0
+
+    quinex.close()
+    assert all(key in _loaded_models for key in keys)
+
+    other_quinex.close()
+    assert not any(key in _loaded_models for key in keys)
+
+
+def test_lazy_loading_cpu_layout():
+    """Test if the qualifier extraction workers get the CPU cores of the context extraction workers also if models are loaded lazily."""
+    for lazy_loading in [False, True]:
+        quinex = Quinex(plan_cpu_threads=True, lazy_loading=lazy_loading)
+        pools = quinex.measurement_context_extractor.qualifier_worker_pools
+        assert len(pools) > 0
+        assert all(pool.rank_initializer is not None for pool in pools)
+        quinex.close()
+
+
 def test_quantity_span_identification():
     """
     Test quantity span identification on several hard-coded examples.